@@ -0,0 +1 @@
+"""Benchmarks for ``hlso`` using airspeed velocity (``asv``)."""
@@ -0,0 +1,143 @@
+"""Benchmarks for the stages of the pipeline from reads to report on simulated plates."""
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+from hlso.blast import parse_blastn_xml, run_blast
+from hlso.common import call_variants, SequenceRegistry, write_fasta
+from hlso.export import write_excel, RecordWriter
+from hlso.haplotyping import run_haplotyping
+from hlso.inputs import InputFile
+from hlso.phylo import phylo_analysis
+from hlso.streaming import iter_records
+from hlso.web.settings import SAMPLE_REGEX
+from hlso.workflow import REF_FILE, results_to_data_frames
+
+from .common import PLATE_SIZES, require_program, simulate_plate, write_plate
+
+
+class PlateBenchmark:
+    """Base class for benchmarks on simulated plates in a temporary directory."""
+
+    params = PLATE_SIZES
+    param_names = ["reads"]
+    timeout = 3600
+
+    def setup(self, reads):
+        self.tmpdir = tempfile.mkdtemp()
+        self.plate = simulate_plate(reads, os.path.join(self.tmpdir, "plate"))
+
+    def teardown(self, reads):
+        shutil.rmtree(self.tmpdir)
+
+    def haplotype(self):
+        return run_haplotyping(self.plate.matches)
+
+    def data_frames(self, results):
+        registry = SequenceRegistry()
+        for path, read in self.plate.reads.items():
+            registry.add(path, [read])
+        return results_to_data_frames(results, SAMPLE_REGEX, registry=registry)
+
+
+class TimeConversion(PlateBenchmark):
+    """Time converting one FASTQ file per read."""
+
+    def setup(self, reads):
+        try:
+            from hlso.conversion import convert_seqs
+        except ImportError as e:
+            raise NotImplementedError("conversion not available: %s" % e)
+        super().setup(reads)
+        self.convert_seqs = convert_seqs
+        self.paths = write_plate(self.plate, ".fastq")
+        os.makedirs(os.path.join(self.tmpdir, "out"))
+
+    def time_convert_seqs(self, reads):
+        self.convert_seqs(self.paths, os.path.join(self.tmpdir, "out"))
+
+
+class TimeBlast(PlateBenchmark):
+    """Time running ``blastn`` for the whole plate and parsing its XML output."""
+
+    def setup(self, reads):
+        require_program("blastn")
+        super().setup(reads)
+        self.path_plate = os.path.join(self.tmpdir, "plate.fasta")
+        with open(self.path_plate, "wt") as outputf:
+            write_fasta({read.name: read.sequence for read in self.plate.reads.values()}, outputf)
+        cmd = ("blastn", "-db", REF_FILE, "-query", self.path_plate, "-outfmt", "16")
+        self.blastn_xml = subprocess.check_output(cmd).decode("utf-8")
+
+    def time_run_blast(self, reads):
+        run_blast(REF_FILE, self.path_plate)
+
+    def time_parse_blastn_xml(self, reads):
+        parse_blastn_xml(self.blastn_xml, self.path_plate)
+
+
+class TimeHaplotyping(PlateBenchmark):
+    """Time variant calling and haplotyping on the simulated alignments."""
+
+    def time_call_variants(self, reads):
+        for match in self.plate.matches:
+            call_variants(match.alignment.hseq, match.alignment.qseq, match.database_start)
+
+    def time_run_haplotyping(self, reads):
+        self.haplotype()
+
+    def time_run_haplotyping_full_calling(self, reads):
+        run_haplotyping(self.plate.matches, full_calling=True)
+
+
+class TimeReport(PlateBenchmark):
+    """Time building the result tables and writing them to Excel."""
+
+    def setup(self, reads):
+        super().setup(reads)
+        self.results = self.haplotype()
+        self.dfs = self.data_frames(self.results)
+
+    def time_results_to_data_frames(self, reads):
+        self.data_frames(self.results)
+
+    def time_write_excel(self, reads):
+        write_excel(*self.dfs, os.path.join(self.tmpdir, "report.xlsx"))
+
+
+class TimeStreaming(PlateBenchmark):
+    """Time and peak memory of the streaming pipeline from FASTQ files to a TSV file."""
+
+    def setup(self, reads):
+        require_program("blastn")
+        super().setup(reads)
+        self.paths = write_plate(self.plate, ".fastq")
+
+    def stream(self):
+        records = iter_records((InputFile(path=path) for path in self.paths), SAMPLE_REGEX)
+        with RecordWriter(os.path.join(self.tmpdir, "records.tsv")) as writer:
+            for record in records:
+                writer.write(record)
+
+    def time_iter_records(self, reads):
+        self.stream()
+
+    def peakmem_iter_records(self, reads):
+        self.stream()
+
+
+class TimePhylo(PlateBenchmark):
+    """Time the phylogenetics analysis, including the all-to-all ``blastn`` calls."""
+
+    def setup(self, reads):
+        require_program("blastn")
+        require_program("makeblastdb")
+        super().setup(reads)
+        df_summary = self.data_frames(self.haplotype())[0]
+        row_select = (df_summary.orig_sequence != "-") & (df_summary.region != "-")
+        self.df_phylo = df_summary[row_select][["query", "region", "orig_sequence"]]
+
+    def time_phylo_analysis(self, reads):
+        phylo_analysis(self.df_phylo)
@@ -0,0 +1,36 @@
+"""Microbenchmarks for the sequence kernels."""
+
+import random
+
+from hlso import seqops
+
+from .common import READ_LENGTH
+
+
+class TimeSeqops:
+    """Time the sequence kernels on gapped reads."""
+
+    params = [100, 1000]
+    param_names = ["reads"]
+
+    def setup(self, reads):
+        rng = random.Random(42)
+        self.seqs = [
+            "".join(rng.choice("ACGTacgtN-") for _ in range(READ_LENGTH)) for _ in range(reads)
+        ]
+
+    def time_revcomp(self, reads):
+        for seq in self.seqs:
+            seqops.revcomp(seq)
+
+    def time_only_bases(self, reads):
+        for seq in self.seqs:
+            seqops.only_bases(seq)
+
+    def time_strip_n(self, reads):
+        for seq in self.seqs:
+            seqops.strip_n(seq)
+
+    def time_as_array(self, reads):
+        for seq in self.seqs:
+            seqops.IS_DNA[seqops.as_array(seq)]
@@ -0,0 +1,43 @@
+"""Benchmarks for building the summary data frames."""
+
+import random
+
+import pandas as pd
+
+from hlso.haplotyping import HAPLOTYPE_TABLE, HaplotypingResult, HaplotypingResultWithMatches
+from hlso.web.settings import SAMPLE_REGEX
+from hlso.workflow import augment_summary, match_sample_in_data_frame
+
+
+def make_results(num_rows, reads_per_sample=4, seed=42):
+    """Return synthetic haplotyping results for ``num_rows`` queries."""
+    rng = random.Random(seed)
+    keys = list(HAPLOTYPE_TABLE)
+    results = {}
+    for i in range(num_rows):
+        query = "S%06d.16S.%d" % (i // reads_per_sample, i % reads_per_sample)
+        values = {}
+        for key in rng.sample(keys, min(len(keys), 4)):
+            values[key] = rng.choice(list(HAPLOTYPE_TABLE[key].haplo_values.values()))
+        result = HaplotypingResult(filename="plate.fasta", query=query, informative_values=values)
+        results[query] = HaplotypingResultWithMatches(result=result, matches=())
+    return results
+
+
+class TimeSummary:
+    """Time parsing the sample names and augmenting the summary with per-sample rows."""
+
+    params = [1000, 10000, 100000]
+    param_names = ["rows"]
+    timeout = 600
+
+    def setup(self, rows):
+        self.results = make_results(rows)
+        self.df = pd.DataFrame({"query": list(self.results), "best_haplotypes": "-"})
+        self.df_sample = match_sample_in_data_frame(self.df.copy(), SAMPLE_REGEX, "query")
+
+    def time_match_sample_in_data_frame(self, rows):
+        match_sample_in_data_frame(self.df.copy(), SAMPLE_REGEX, "query")
+
+    def time_augment_summary(self, rows):
+        augment_summary(self.df_sample, self.results, SAMPLE_REGEX, "query", "sample")
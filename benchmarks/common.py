@@ -0,0 +1,133 @@
+"""Helpers for simulating plates of reads from the reference sequences."""
+
+import os
+import random
+import shutil
+import typing
+
+import attr
+
+from hlso.blast import BlastMatch, build_match
+from hlso.common import load_fasta, write_fasta, NamedSequence
+from hlso.seqops import revcomp
+from hlso.workflow import REF_FILE
+
+#: Number of reads of the simulated plates to run the benchmarks for.
+PLATE_SIZES = [10, 100, 1000, 10000]
+
+#: Length of the simulated reads.
+READ_LENGTH = 700
+#: Rate of substitutions in the simulated reads.
+SUBSTITUTION_RATE = 0.01
+#: Rate of insertions and of deletions in the simulated reads.
+INDEL_RATE = 0.001
+
+#: Number of reads per simulated sample.
+READS_PER_SAMPLE = 2
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Plate:
+    """A simulated plate of reads with one file per read."""
+
+    #: Mapping from file path to the read in the file.
+    reads: typing.Dict[str, NamedSequence]
+    #: The true alignments of the reads to the references.
+    matches: typing.Tuple[BlastMatch]
+
+
+def simulate_read(rng: random.Random, query: str, database: str, ref_seq: str, path: str):
+    """Simulate read ``query`` from ``ref_seq`` and return it with its ``BlastMatch``."""
+    start = rng.randrange(max(1, len(ref_seq) - READ_LENGTH))
+    q_row, r_row = [], []
+    for ref_base in ref_seq[start : start + READ_LENGTH]:
+        x = rng.random()
+        if q_row and "-" in (q_row[-1], r_row[-1]):  # no adjacent indels
+            x = max(x, 2 * INDEL_RATE)
+        if x < INDEL_RATE:  # deletion
+            q_row.append("-")
+            r_row.append(ref_base)
+        elif x < 2 * INDEL_RATE:  # insertion
+            q_row += [rng.choice("ACGT"), ref_base]
+            r_row += ["-", ref_base]
+        elif x < 2 * INDEL_RATE + SUBSTITUTION_RATE:
+            q_row.append(rng.choice([b for b in "ACGT" if b != ref_base]))
+            r_row.append(ref_base)
+        else:
+            q_row.append(ref_base)
+            r_row.append(ref_base)
+    qseq, hseq = "".join(q_row), "".join(r_row)
+    database_from, database_to = start + 1, start + len(hseq.replace("-", ""))
+    if rng.random() < 0.5:  # reverse read, reported as match to the reverse reference
+        qseq, hseq = revcomp(qseq), revcomp(hseq)
+        database_strand, database_from, database_to = "-", database_to, database_from
+    else:
+        database_strand = "+"
+    read = qseq.replace("-", "")
+    midline = "".join("|" if q == h else " " for q, h in zip(qseq, hseq))
+    match = build_match(
+        path_query=path,
+        query=query,
+        query_len=len(read),
+        database=database,
+        bits=float(midline.count("|")),
+        identities=midline.count("|"),
+        align_length=len(midline),
+        query_strand="+",
+        query_from=1,
+        query_to=len(read),
+        database_strand=database_strand,
+        database_from=database_from,
+        database_to=database_to,
+        qseq=qseq,
+        hseq=hseq,
+        midline=midline,
+    )
+    return read, match
+
+
+def simulate_plate(num_reads: int, path_dir: str, seed: int = 42) -> Plate:
+    """Simulate a plate of ``num_reads`` reads with mutations from the reference sequences.
+
+    The reads are named such that the ``SAMPLE_REGEX`` yields sample, region, and primer, and
+    attributed to FASTA files in ``path_dir`` (use ``write_plate()`` for writing them).
+    """
+    rng = random.Random(seed)
+    references = [(name, seq.upper()) for name, seq in load_fasta(REF_FILE).items()]
+    reads = {}
+    matches = []
+    for i in range(num_reads):
+        database, ref_seq = references[i % len(references)]
+        region = database.split("_", 1)[1]
+        query = "S%05d.%s.%d" % (i // READS_PER_SAMPLE, region, i % READS_PER_SAMPLE)
+        path = os.path.join(path_dir, query + ".fasta")
+        read, match = simulate_read(rng, query, database, ref_seq, path)
+        reads[path] = NamedSequence(name=query, sequence=read)
+        matches.append(match)
+    return Plate(reads=reads, matches=tuple(matches))
+
+
+def write_plate(plate: Plate, ext: str = ".fasta") -> typing.List[str]:
+    """Write the files of ``plate`` and return their paths.
+
+    With ``ext == ".fastq"``, the reads are written as FASTQ with constant quality instead.
+    """
+    result = []
+    for path, read in plate.reads.items():
+        result.append(path[: -len(".fasta")] + ext)
+        os.makedirs(os.path.dirname(result[-1]), exist_ok=True)
+        with open(result[-1], "wt") as outputf:
+            if ext == ".fastq":
+                print(
+                    "@%s\n%s\n+\n%s" % (read.name, read.sequence, "I" * len(read.sequence)),
+                    file=outputf,
+                )
+            else:
+                write_fasta({read.name: read.sequence}, file=outputf)
+    return result
+
+
+def require_program(name: str):
+    """Skip the benchmark by raising ``NotImplementedError`` if ``name`` is not installed."""
+    if not shutil.which(name):
+        raise NotImplementedError("%s is not installed" % name)
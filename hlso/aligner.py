@@ -0,0 +1,204 @@
+"""Aligner backends for matching query sequences against the reference sequences.
+
+Each backend aligns the sequences from a FASTA file and returns ``blast.BlastMatch`` objects.
+The ``blastn`` backend calls the external program while the ``local`` backend keeps the
+reference sequences in memory and performs Smith-Waterman alignments using NumPy with the
+scoring scheme of ``blastn`` (megablast).
+"""
+
+import math
+import typing
+
+from logzero import logger
+import numpy as np
+
+from .blast import BlastMatch, build_match, run_blast
+from .common import load_fasta
+from .seqops import revcomp
+
+#: Name of the default aligner backend.
+DEFAULT_ALIGNER = "blastn"
+
+#: Factor that the local aligner scores are scaled by such that they become integers.
+LOCAL_SCALE = 2
+#: Score for a match in the local aligner (scaled).
+LOCAL_MATCH = 1 * LOCAL_SCALE
+#: Score for a mismatch in the local aligner (scaled).
+LOCAL_MISMATCH = -2 * LOCAL_SCALE
+#: Score for each gap position in the local aligner (scaled).
+LOCAL_GAP = int(-2.5 * LOCAL_SCALE)
+#: Karlin-Altschul lambda parameter for converting (unscaled) scores to bit scores.
+LOCAL_LAMBDA = 1.28
+#: Karlin-Altschul K parameter for converting (unscaled) scores to bit scores.
+LOCAL_K = 0.46
+#: Length of the exact seed matches for selecting references and strands to align to.
+LOCAL_WORD_SIZE = 16
+#: Number of bases to add left and right of the seeded region of the reference.
+LOCAL_BAND = 64
+
+
+class Aligner:
+    """Base class for the aligner backends."""
+
+    #: The name of the backend.
+    name: str = None
+
+    def __init__(self, database: str):
+        #: Path to the FASTA file with the reference sequences (BLAST database).
+        self.database = database
+
+    def align(self, path_query: str, num_threads: int = 1) -> typing.Tuple[BlastMatch]:
+        """Align all sequences in FASTA file at ``path_query`` to the references."""
+        raise NotImplementedError("Override me!")
+
+
+class BlastnAligner(Aligner):
+    """Aligner backend that calls ``blastn``."""
+
+    name = "blastn"
+
+    def align(self, path_query: str, num_threads: int = 1) -> typing.Tuple[BlastMatch]:
+        return run_blast(self.database, path_query, num_threads=num_threads)
+
+
+class LocalAligner(Aligner):
+    """Aligner backend that aligns in-process against the references held in memory.
+
+    Only references and strands that share a seed of ``LOCAL_WORD_SIZE`` bases with the query
+    are considered and the best local alignment is computed against the seeded region.
+    """
+
+    name = "local"
+
+    def __init__(self, database: str):
+        super().__init__(database)
+        logger.info("Loading reference sequences from %s", database)
+        #: The reference sequences.
+        self.references = {
+            name: seq.upper().encode("ascii") for name, seq in load_fasta(database).items()
+        }
+        #: Mapping from k-mer to list of ``(reference, position)``.
+        self.index = {}
+        for name, seq in self.references.items():
+            for pos in range(len(seq) - LOCAL_WORD_SIZE + 1):
+                self.index.setdefault(seq[pos : pos + LOCAL_WORD_SIZE], []).append((name, pos))
+
+    def align(self, path_query: str, num_threads: int = 1) -> typing.Tuple[BlastMatch]:
+        result = []
+        for query, seq in load_fasta(path_query).items():
+            result += self.align_seq(query, seq, path_query=path_query)
+        return tuple(result)
+
+    def align_seq(
+        self, query: str, seq: str, path_query: typing.Optional[str] = None
+    ) -> typing.List[BlastMatch]:
+        """Align sequence ``seq`` named ``query`` to all seeded references."""
+        seqs = {"+": seq.upper().encode("ascii"), "-": revcomp(seq.upper()).encode("ascii")}
+        diagonals = {}  # (reference, strand) => list of diagonals
+        for strand, qseq in seqs.items():
+            for qpos in range(len(qseq) - LOCAL_WORD_SIZE + 1):
+                for name, rpos in self.index.get(qseq[qpos : qpos + LOCAL_WORD_SIZE], ()):
+                    diagonals.setdefault((name, strand), []).append(rpos - qpos)
+
+        result = []
+        for name in self.references:
+            hits = {strand: diagonals.get((name, strand), []) for strand in "+-"}
+            strand = max("+-", key=lambda s: len(hits[s]))
+            if hits[strand]:
+                result.append(
+                    self._align_region(path_query, query, seqs[strand], name, strand, hits[strand])
+                )
+        return result
+
+    def _align_region(self, path_query, query, qseq, name, strand, diagonals):
+        """Align ``qseq`` to the region of reference ``name`` covered by ``diagonals``."""
+        ref = self.references[name]
+        offset = max(0, min(diagonals) - LOCAL_BAND)
+        region = ref[offset : min(len(ref), max(diagonals) + len(qseq) + LOCAL_BAND)]
+        score, (q_begin, q_end), (r_begin, r_end), rows = smith_waterman(qseq, region)
+        q_ali, r_ali = rows
+        if strand == "-":  # report as match of forward query to reverse reference
+            q_ali, r_ali = revcomp(q_ali), revcomp(r_ali)
+            q_begin, q_end = len(qseq) - q_end, len(qseq) - q_begin
+            database_from, database_to = offset + r_end, offset + r_begin + 1
+        else:
+            database_from, database_to = offset + r_begin + 1, offset + r_end
+        midline = "".join("|" if q == r else " " for q, r in zip(q_ali, r_ali))
+        return build_match(
+            path_query=path_query,
+            query=query,
+            query_len=len(qseq),
+            database=name,
+            bits=(LOCAL_LAMBDA * score / LOCAL_SCALE - math.log(LOCAL_K)) / math.log(2),
+            identities=midline.count("|"),
+            align_length=len(midline),
+            query_strand="+",
+            query_from=q_begin + 1,
+            query_to=q_end,
+            database_strand=strand,
+            database_from=database_from,
+            database_to=database_to,
+            qseq=q_ali,
+            hseq=r_ali,
+            midline=midline,
+        )
+
+
+def smith_waterman(
+    qseq: bytes, rseq: bytes
+) -> typing.Tuple[int, typing.Tuple[int, int], typing.Tuple[int, int], typing.Tuple[str, str]]:
+    """Compute best local alignment of ``qseq`` and ``rseq`` with linear gap costs.
+
+    The dynamic programming matrix is computed row by row, the horizontal gaps are resolved
+    with a running maximum.  Returns ``(score, (q_begin, q_end), (r_begin, r_end), rows)`` with
+    0-based half-open intervals and ``rows`` being the gapped query and reference rows.
+    """
+    q = np.frombuffer(qseq, dtype=np.uint8)
+    r = np.frombuffer(rseq, dtype=np.uint8).copy()
+    r[r == ord("N")] = 0  # never match N
+    gap_offsets = -LOCAL_GAP * np.arange(len(r) + 1, dtype=np.int32)
+    matrix = np.zeros((len(q) + 1, len(r) + 1), dtype=np.int32)
+    for i in range(1, len(q) + 1):
+        row = np.empty(len(r) + 1, dtype=np.int32)
+        row[0] = 0
+        scores = np.where(r == q[i - 1], LOCAL_MATCH, LOCAL_MISMATCH).astype(np.int32)
+        np.maximum(matrix[i - 1, :-1] + scores, matrix[i - 1, 1:] + LOCAL_GAP, out=row[1:])
+        np.maximum(row, 0, out=row)
+        matrix[i] = np.maximum.accumulate(row + gap_offsets) - gap_offsets
+
+    i, j = np.unravel_index(np.argmax(matrix), matrix.shape)
+    score = int(matrix[i, j])
+    q_end, r_end = int(i), int(j)
+    q_row, r_row = [], []
+    while i > 0 and j > 0 and matrix[i, j] > 0:
+        value = matrix[i, j]
+        if value == matrix[i - 1, j - 1] + (
+            LOCAL_MATCH if q[i - 1] == r[j - 1] else LOCAL_MISMATCH
+        ):
+            i, j = i - 1, j - 1
+            q_row.append(qseq[i])
+            r_row.append(rseq[j])
+        elif value == matrix[i - 1, j] + LOCAL_GAP:
+            i -= 1
+            q_row.append(qseq[i])
+            r_row.append(ord("-"))
+        else:
+            j -= 1
+            q_row.append(ord("-"))
+            r_row.append(rseq[j])
+    rows = (bytes(reversed(q_row)).decode("ascii"), bytes(reversed(r_row)).decode("ascii"))
+    return score, (int(i), q_end), (int(j), r_end), rows
+
+
+#: The available aligner backends.
+ALIGNERS = {cls.name: cls for cls in (BlastnAligner, LocalAligner)}
+
+#: Aligner backend instances by ``(name, database)``, keeping references resident.
+_INSTANCES = {}
+
+
+def get_aligner(name: str, database: str) -> Aligner:
+    """Return (cached) aligner backend with the given ``name`` for the given ``database``."""
+    if (name, database) not in _INSTANCES:
+        _INSTANCES[(name, database)] = ALIGNERS[name](database)
+    return _INSTANCES[(name, database)]
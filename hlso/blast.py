@@ -4,7 +4,9 @@ We store matches in ``BlastMatch`` objects that can be easily converted into dic
 subsequently Pandas dataframe rows.
 """
 
+import array
 import os
+import re
 import subprocess
 import typing
 import shlex
@@ -14,34 +16,157 @@ import attr
 from Bio.Blast import NCBIXML
 import io
 from logzero import logger
+import numpy as np
 
-from .common import revcomp, rev
+from .seqops import only_bases, revcomp
+
+#: Regular expression for the tokens of BLAST trace-back operations (``btop``).
+BTOP_RE = re.compile(r"(\d+)|(.)(.)")
+
+
+@attr.s(auto_attribs=True, frozen=True, slots=True)
+class Cigar:
+    """Run-length encoded CIGAR of a match, the string is only built by ``str()``."""
+
+    #: the operations, one character code per run
+    ops: bytes
+    #: the run lengths, one per operation
+    lengths: array.array
+
+    def __str__(self) -> str:
+        return "".join("%d%c" % (length, op) for length, op in zip(self.lengths, self.ops))
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def reversed(self) -> typing.TypeVar("Cigar"):
+        """Return ``Cigar`` with the runs in reverse order, e.g., after reverse-complementing."""
+        return Cigar(self.ops[::-1], array.array("L", reversed(self.lengths)))
+
+    def clipped(self, left: int, right: int) -> typing.TypeVar("Cigar"):
+        """Return ``Cigar`` with hard-clipping of ``left`` and ``right`` bases added."""
+        ops = (b"H" if left else b"") + self.ops + (b"H" if right else b"")
+        lengths = array.array("L", [left] if left else [])
+        lengths.extend(self.lengths)
+        if right:
+            lengths.append(right)
+        return Cigar(ops, lengths)
+
+    @staticmethod
+    def from_rows(qseq: str, hseq: str) -> typing.TypeVar("Cigar"):
+        """Build ``Cigar`` from the gapped query and hit rows of an alignment."""
+        if not qseq:
+            return Cigar.build_empty()
+        query = np.frombuffer(qseq.encode("ascii", "replace"), dtype=np.uint8)
+        hit = np.frombuffer(hseq.encode("ascii", "replace"), dtype=np.uint8)
+        ops = np.full(len(query), ord("M"), dtype=np.uint8)
+        ops[hit == ord("-")] = ord("I")
+        ops[query == ord("-")] = ord("D")
+        starts = np.flatnonzero(np.concatenate(([True], ops[1:] != ops[:-1])))
+        lengths = np.diff(np.append(starts, len(ops)))
+        return Cigar(ops[starts].tobytes(), array.array("L", lengths.tolist()))
+
+    @staticmethod
+    def from_btop(btop: str) -> typing.TypeVar("Cigar"):
+        """Build ``Cigar`` from BLAST trace-back operations (``btop`` output field)."""
+        ops = bytearray()
+        lengths = array.array("L")
+        for m in BTOP_RE.finditer(btop):
+            if m.group(1):
+                op, length = ord("M"), int(m.group(1))
+            else:
+                op = ord("D" if m.group(2) == "-" else "I" if m.group(3) == "-" else "M")
+                length = 1
+            if ops and ops[-1] == op:
+                lengths[-1] += length
+            else:
+                ops.append(op)
+                lengths.append(length)
+        return Cigar(bytes(ops), lengths)
+
+    @staticmethod
+    def build_empty() -> typing.TypeVar("Cigar"):
+        return Cigar(b"", array.array("L"))
 
 
-@attr.s(auto_attribs=True, frozen=True)
 class Alignment:
-    """Representation of an alignment."""
+    """Representation of an alignment.
+
+    The rows are kept as given, e.g., by the BLAST HSP.  With ``reverse``, they are for the
+    reverse strand and reverse-complemented on first access.  If ``midline`` is ``None``, it is
+    computed from the rows on first access.
+    """
+
+    __slots__ = ("_rows", "_midline")
+
+    def __init__(self, hseq: str, midline: typing.Optional[str], qseq: str, reverse: bool = False):
+        #: ``(hseq, qseq, reverse)``, replaced by the forward rows on first access
+        self._rows = (hseq, qseq, reverse)
+        #: ``(midline, reverse)``, ``None`` to compute the mid line from the rows
+        self._midline = None if midline is None else (midline, reverse)
+
+    def _forward_rows(self) -> typing.Tuple[str, str]:
+        hseq, qseq, reverse = self._rows
+        if reverse:
+            hseq, qseq = revcomp(hseq), revcomp(qseq)
+            self._rows = (hseq, qseq, False)
+        return hseq, qseq
+
+    @property
+    def hseq(self) -> str:
+        """(database) hit sequence"""
+        return self._forward_rows()[0]
+
+    @property
+    def qseq(self) -> str:
+        """query sequence"""
+        return self._forward_rows()[1]
+
+    @property
+    def midline(self) -> str:
+        """alignment mid line"""
+        midline = self._midline
+        if midline is None:
+            hseq, qseq = self._forward_rows()
+            midline = ("".join(["|" if q == h else " " for q, h in zip(qseq, hseq)]), False)
+            self._midline = midline
+        elif midline[1]:
+            midline = (midline[0][::-1], False)
+            self._midline = midline
+        return midline[0]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Alignment):
+            return NotImplemented
+        return (self.hseq, self.midline, self.qseq) == (other.hseq, other.midline, other.qseq)
+
+    def __hash__(self) -> int:
+        return hash((self.hseq, self.midline, self.qseq))
+
+    def __repr__(self) -> str:
+        return "Alignment(hseq=%r, midline=%r, qseq=%r)" % (self.hseq, self.midline, self.qseq)
 
-    #: (database) hit sequence
-    hseq: str
-    #: alignment mid line
-    midline: str
-    #: query sequence
-    qseq: str
+    def __getstate__(self):
+        return (self.hseq, self._midline and self.midline, self.qseq)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
 
     def revcomp(self) -> typing.TypeVar("Alignment"):
-        return Alignment(revcomp(self.hseq), "".join(reversed(self.midline)), revcomp(self.qseq))
+        return Alignment(self.hseq, self.midline, self.qseq, reverse=True)
 
     def wrapped(self, qry_start: int, db_start: int, line_length: int = 60) -> str:
+        hseq, qseq = self._forward_rows()
+        midline = self.midline
         result = []
-        for offset in range(0, len(self.hseq), line_length):
-            end = min(len(self.hseq), offset + line_length)
+        for offset in range(0, len(hseq), line_length):
+            end = min(len(hseq), offset + line_length)
             result += [
                 ("Sbjct %%4d %%-%ds %%s" % line_length)
-                % (db_start + offset + 1, self.hseq[offset:end], db_start + offset + line_length),
-                ("      %%4s %%-%ds" % line_length) % ("", "".join(self.midline[offset:end])),
+                % (db_start + offset + 1, hseq[offset:end], db_start + offset + line_length),
+                ("      %%4s %%-%ds" % line_length) % ("", midline[offset:end]),
                 ("Query %%4d %%-%ds %%s" % line_length)
-                % (qry_start + offset + 1, self.qseq[offset:end], qry_start + offset + line_length),
+                % (qry_start + offset + 1, qseq[offset:end], qry_start + offset + line_length),
                 "",
             ]
         return "\n".join(result)
@@ -51,9 +176,12 @@ class Alignment:
         return Alignment(hseq="", midline="", qseq="")
 
 
-@attr.s(auto_attribs=True, frozen=True)
+@attr.s(auto_attribs=True, frozen=True, slots=True)
 class BlastMatch:
-    """Representation of a match."""
+    """Representation of a match.
+
+    ``match_cigar`` and ``match_seq`` are computed from the alignment on first access.
+    """
 
     #: query file name
     path: typing.Optional[str]
@@ -77,12 +205,41 @@ class BlastMatch:
     database_start: int
     #: 0-based end position
     database_end: int
-    #: CIGAR string of match
-    match_cigar: str
-    #: matching sequence
-    match_seq: str
     #: Alignment
     alignment: typing.Optional[Alignment]
+    #: length of the query sequence
+    query_len: int = 0
+    #: BLAST trace-back operations for the alignment rows as reported, if any
+    btop: typing.Optional[str] = None
+    #: cached value of ``match_cigar``
+    _match_cigar: typing.Optional[Cigar] = attr.ib(init=False, default=None, eq=False, repr=False)
+    #: cached value of ``match_seq``
+    _match_seq: typing.Optional[str] = attr.ib(init=False, default=None, eq=False, repr=False)
+
+    @property
+    def match_cigar(self) -> Cigar:
+        """CIGAR of match, use ``str()`` for the CIGAR string"""
+        if self._match_cigar is None:
+            if self.btop is not None:
+                cigar = Cigar.from_btop(self.btop)
+                if self.query_strand == "-":
+                    cigar = cigar.reversed()
+            else:
+                cigar = Cigar.from_rows(self.alignment.qseq, self.alignment.hseq)
+            clips = (self.query_start, self.query_len - self.query_end)
+            if self.query_strand == "-":
+                clips = clips[::-1]
+            object.__setattr__(self, "_match_cigar", cigar.clipped(*clips))
+        return self._match_cigar
+
+    @property
+    def match_seq(self) -> str:
+        """matching sequence"""
+        if self._match_seq is None:
+            object.__setattr__(
+                self, "_match_seq", only_dna(self.alignment.qseq) if self.alignment else ""
+            )
+        return self._match_seq
 
     @property
     def database_length(self):
@@ -110,8 +267,6 @@ class BlastMatch:
             database_strand=".",
             database_start=0,
             database_end=0,
-            match_cigar="",
-            match_seq="",
             alignment=Alignment.build_empty(),
         )
 
@@ -121,32 +276,85 @@ def is_nucl(c: str) -> bool:
     return c in "acgtnACGTN"
 
 
-def match_cigar(
-    qseq: str, hseq: str, query_start: int, query_end: int, query_len: int
-) -> typing.Tuple[typing.Tuple[int, str]]:
-    """Return CIGAR string for the match with the given paraemters."""
-    match_cigar = []
-    if query_start > 0:
-        match_cigar.append([query_start, "H"])
-    for q, h in zip(qseq, hseq):
-        if q == "-":
-            op = "D"
-        elif h == "-":
-            op = "I"
-        else:
-            op = "M"
-        if match_cigar and match_cigar[-1][1] == op:
-            match_cigar[-1][0] += 1
-        else:
-            match_cigar.append([1, op])
-    if query_end != query_len:
-        match_cigar.append([query_len - query_end, "H"])
-    return tuple(tuple(t) for t in match_cigar)
-
-
 def only_dna(seq: str) -> str:
     """Return ``str`` with all ACGTN characters from ``seq``."""
-    return "".join(filter(lambda x: x in "ACGTNacgtn", seq))
+    return only_bases(seq)
+
+
+#: The fields to request from ``blastn`` for the tabular output format.
+TABULAR_FIELDS = (
+    "qseqid",
+    "qlen",
+    "sseqid",
+    "stitle",
+    "bitscore",
+    "nident",
+    "length",
+    "qstart",
+    "qend",
+    "sstart",
+    "send",
+    "sstrand",
+    "qseq",
+    "sseq",
+    "btop",
+)
+
+
+def build_match(
+    *,
+    path_query: typing.Optional[str],
+    query: str,
+    query_len: int,
+    database: str,
+    bits: float,
+    identities: int,
+    align_length: int,
+    query_strand: str,
+    query_from: int,
+    query_to: int,
+    database_strand: str,
+    database_from: int,
+    database_to: int,
+    qseq: str,
+    hseq: str,
+    midline: typing.Optional[str],
+    btop: typing.Optional[str] = None,
+) -> BlastMatch:
+    """Build ``BlastMatch`` from the properties of a BLAST HSP.
+
+    Positions are 1-based and inclusive as in the ``blastn`` output, strands are given as
+    ``"+"`` or ``"-"``, and ``qseq``, ``hseq``, ``midline`` are the rows of the alignment
+    (``midline`` may be ``None``).  The CIGAR is computed from ``btop`` if given and from the
+    rows otherwise.  Matches on the reverse strand of the database are flipped to the forward
+    strand.  The rows are not copied, flipping them and the CIGAR happen on first access.
+    """
+    db_start = min(database_from, database_to) - 1
+    db_end = max(database_from, database_to)
+    query_start = min(query_from, query_to) - 1
+    query_end = max(query_from, query_to)
+    if database_strand == "-":
+        database_strand = "+"
+        query_strand = "-" if query_strand == "+" else "+"
+        alignment = Alignment(hseq=hseq, midline=midline, qseq=qseq, reverse=True)
+    else:
+        alignment = Alignment(hseq=hseq, midline=midline, qseq=qseq)
+    return BlastMatch(
+        path=path_query,
+        query=query,
+        database=database,
+        bits=bits,
+        identity=identities / align_length,
+        query_strand=query_strand,
+        query_start=query_start,
+        query_end=query_end,
+        database_strand=database_strand,
+        database_start=db_start,
+        database_end=db_end,
+        alignment=alignment,
+        query_len=query_len,
+        btop=btop,
+    )
 
 
 def parse_blastn_xml(
@@ -157,51 +365,90 @@ def parse_blastn_xml(
     for blast_record in NCBIXML.parse(io.StringIO(blastn_xml)):
         for blast_alignment in blast_record.alignments:
             hsp = blast_alignment.hsps[0]
-            qseq = only_dna(hsp.query)
-            hseq = only_dna(hsp.sbjct)
-            db_strand = "+" if hsp.strand[1] == "Plus" else "-"
-            db_start = min(hsp.sbjct_start, hsp.sbjct_end) - 1
-            db_end = max(hsp.sbjct_start, hsp.sbjct_end)
-            query_strand = "+" if hsp.strand[0] == "Plus" else "-"
-            query_start = min(hsp.query_start, hsp.query_end) - 1
-            query_end = max(hsp.query_start, hsp.query_end)
-            if db_strand == "-":
-                db_strand = "+"
-                query_strand = "-" if query_strand == "+" else "+"
-                qseq = revcomp(qseq)
-                hseq = revcomp(hseq)
-                alignment = Alignment(
-                    hseq=revcomp(hsp.sbjct), midline=rev(hsp.match), qseq=revcomp(hsp.query)
-                )
-            else:
-                alignment = Alignment(hseq=hsp.sbjct, midline=hsp.match, qseq=hsp.query)
-            cigar = match_cigar(qseq, hseq, query_start, query_end, blast_record.query_letters)
             result.append(
-                BlastMatch(
-                    path=path_query,
+                build_match(
+                    path_query=path_query,
                     query=blast_record.query,
+                    query_len=blast_record.query_letters,
                     database=blast_alignment.title.split()[1],
                     bits=hsp.bits,
-                    identity=hsp.identities / hsp.align_length,
-                    query_strand=query_strand,
-                    query_start=query_start,
-                    query_end=query_end,
-                    database_strand=db_strand,
-                    database_start=db_start,
-                    database_end=db_end,
-                    match_cigar="".join(["".join(map(str, x)) for x in cigar]),
-                    match_seq="".join([x for x in filter(is_nucl, qseq)]),
-                    alignment=alignment,
+                    identities=hsp.identities,
+                    align_length=hsp.align_length,
+                    query_strand="+" if hsp.strand[0] == "Plus" else "-",
+                    query_from=hsp.query_start,
+                    query_to=hsp.query_end,
+                    database_strand="+" if hsp.strand[1] == "Plus" else "-",
+                    database_from=hsp.sbjct_start,
+                    database_to=hsp.sbjct_end,
+                    qseq=hsp.query,
+                    hseq=hsp.sbjct,
+                    midline=hsp.match,
                 )
             )
     return tuple(result)
 
 
-def run_blast(database: str, query: str) -> typing.Tuple[BlastMatch]:
-    """Run blastn on FASTA query ``query`` to database sequence at ``database``."""
-    cmd = ("blastn", "-db", database, "-query", query, "-outfmt", "16")
+def parse_blastn_tabular(
+    lines: typing.Iterable[str], path_query: typing.Optional[str] = None
+) -> typing.Tuple[BlastMatch]:
+    """Parse BLASTN output in tabular format with ``TABULAR_FIELDS`` line by line.
+
+    As for ``parse_blastn_xml()``, only the first HSP is used for each pair of query and
+    database sequence.  Note that ``blastn`` rounds the bit scores in the tabular output.
+    """
+    result = []
+    seen = set()
+    for line in lines:
+        record = dict(zip(TABULAR_FIELDS, line.rstrip("\n").split("\t")))
+        if (record["qseqid"], record["sseqid"]) in seen:
+            continue
+        seen.add((record["qseqid"], record["sseqid"]))
+        result.append(
+            build_match(
+                path_query=path_query,
+                query=record["qseqid"],
+                query_len=int(record["qlen"]),
+                database=record["stitle"].split()[0],
+                bits=float(record["bitscore"]),
+                identities=int(record["nident"]),
+                align_length=int(record["length"]),
+                query_strand="+",
+                query_from=int(record["qstart"]),
+                query_to=int(record["qend"]),
+                database_strand="+" if record["sstrand"] == "plus" else "-",
+                database_from=int(record["sstart"]),
+                database_to=int(record["send"]),
+                qseq=record["qseq"],
+                hseq=record["sseq"],
+                midline=None,
+                btop=record["btop"],
+            )
+        )
+    return tuple(result)
+
+
+def run_blast(
+    database: str, query: str, num_threads: int = 1, tabular: bool = True
+) -> typing.Tuple[BlastMatch]:
+    """Run blastn on FASTA query ``query`` to database sequence at ``database``.
+
+    By default, the tabular output of ``blastn`` is parsed while it is being written.  Set
+    ``tabular`` to ``False`` for parsing the XML output instead.
+    """
+    if tabular:
+        outfmt = " ".join(("6",) + TABULAR_FIELDS)
+    else:
+        outfmt = "16"
+    cmd = ("blastn", "-db", database, "-query", query, "-outfmt", outfmt)
+    cmd += ("-num_threads", str(num_threads))
     logger.info("Executing %s", repr(" ".join(cmd)))
-    return parse_blastn_xml(subprocess.check_output(cmd).decode("utf-8"), path_query=query)
+    if not tabular:
+        return parse_blastn_xml(subprocess.check_output(cmd).decode("utf-8"), path_query=query)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True) as proc:
+        result = parse_blastn_tabular(proc.stdout, path_query=query)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return result
 
 
 def run_makeblastdb(path: str, dbtype: str = "nucl") -> str:
@@ -0,0 +1,112 @@
+"""On-disk cache for alignment and haplotyping results.
+
+The results are stored in an SQLite database and keyed by the hash of the query sequence
+(and its qualities if these are used) together with the checksums of the reference sequences
+and haplotype table, the ``hlso`` version and the aligner backend.  When the cache grows beyond
+its maximal size, the least recently used entries are evicted.
+"""
+
+import contextlib
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+import typing
+
+from logzero import logger
+
+from . import __version__
+
+#: Default maximal size of the cache in bytes.
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+
+#: File name of the SQLite database within the cache directory.
+CACHE_FILE_NAME = "hlso-cache.sqlite3"
+
+
+def file_checksum(path: str) -> str:
+    """Return SHA256 checksum of the file at ``path``."""
+    result = hashlib.sha256()
+    with open(path, "rb") as inputf:
+        for chunk in iter(lambda: inputf.read(1024 * 1024), b""):
+            result.update(chunk)
+    return result.hexdigest()
+
+
+class ResultCache:
+    """Cache for results in an SQLite database in directory ``path``.
+
+    The ``salt`` values are hashed together with each sequence and should capture everything
+    that the cached results depend on besides the sequence itself.
+    """
+
+    def __init__(self, path: str, max_size: int = DEFAULT_CACHE_SIZE, salt: typing.Tuple = ()):
+        #: Path to the cache directory.
+        self.path = path
+        #: Maximal size of the cached values in bytes.
+        self.max_size = max_size
+        #: Hash of the values that the cached results depend on.
+        self.salt = hashlib.sha256(repr((__version__,) + tuple(salt)).encode("utf-8")).hexdigest()
+        os.makedirs(self.path, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(os.path.join(self.path, CACHE_FILE_NAME), timeout=60)
+        try:
+            with conn:  # commit or roll back
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, sequence: str, qualities: typing.Optional[bytes] = None) -> str:
+        """Return cache key for the given ``sequence`` and its ``qualities``, if relevant."""
+        value = "%s:%s" % (self.salt, sequence.upper())
+        if qualities is not None:
+            value += ":" + qualities.hex()
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: typing.Iterable[str]) -> typing.List[typing.Any]:
+        """Return cached values for ``keys``, ``None`` for those not in the cache."""
+        keys = list(keys)
+        found = {}
+        with self._connect() as conn:
+            for key in set(keys):
+                row = conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+                if row:
+                    found[key] = pickle.loads(row[0])
+                    conn.execute(
+                        "UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key)
+                    )
+        logger.info("Found %d of %d sequences in cache %s", len(found), len(keys), self.path)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, items: typing.Iterable[typing.Tuple[str, typing.Any]]):
+        """Store the ``(key, value)`` pairs from ``items`` and evict entries if necessary."""
+        with self._connect() as conn:
+            for key, value in items:
+                blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), time.time()),
+                )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        """Evict least recently used entries until the cache is within its size limit."""
+        total = 0
+        evict = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed DESC"):
+            total += size
+            if total > self.max_size:
+                evict.append((key,))
+        if evict:
+            logger.info("Evicting %d entries from cache %s", len(evict), self.path)
+            conn.executemany("DELETE FROM entries WHERE key = ?", evict)
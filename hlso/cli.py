@@ -1,15 +1,26 @@
 """Code for the command line interface to ``hlso``."""
 
+import itertools
 import tempfile
 import typing
 
 import attr
 from logzero import logger
 
+from .aligner import ALIGNERS, DEFAULT_ALIGNER
+from .cache import ResultCache, DEFAULT_CACHE_SIZE
+from .common import SequenceRegistry
 from .conversion import convert_seqs
-from .export import write_excel
+from .export import write_excel, RecordWriter
+from .inputs import iter_input_files, InputFile, DEFAULT_EXTENSIONS
 from .phylo import phylo_analysis
-from .workflow import blast_and_haplotype_many, results_to_data_frames
+from .streaming import iter_records
+from .workflow import (
+    blast_and_haplotype_many,
+    cache_salt,
+    results_to_data_frames,
+    DEFAULT_BATCH_SIZE,
+)
 
 from .web.settings import SAMPLE_REGEX
 
@@ -30,32 +41,118 @@ class Config:
     input_paths: typing.Tuple[str]
     #: The path to the output file.
     output_path: str
+    #: The directories to take the input files from (recursively).
+    input_dirs: typing.Tuple[str] = ()
+    #: The extensions of the files to take from the input directories.
+    extensions: typing.Tuple[str] = DEFAULT_EXTENSIONS
+    #: The path to the manifest file with the input files and their samples, if any.
+    manifest: typing.Optional[str] = None
+    #: The path to the file with the list of input files (``"-"`` for stdin), if any.
+    input_list: typing.Optional[str] = None
+    #: The path to the TSV or JSONL file for writing the records incrementally, if any.
+    stream_output: typing.Optional[str] = None
     #: Whether or not the sample names are to be inferred from the command line.
     #: If not, then the sequence names are used.
     sample_name_from_file: bool = False
     #: The regular expression to parse information from the sample.
     sample_regex: str = SAMPLE_REGEX
+    #: The number of sequences to align in one ``blastn`` call.
+    batch_size: int = DEFAULT_BATCH_SIZE
+    #: The number of cores to use for converting files and running BLAST.
+    jobs: int = 1
+    #: The name of the aligner backend to use.
+    aligner: str = DEFAULT_ALIGNER
+    #: Minimal Phred quality for trimming the ends of reads with qualities, if any.
+    trim_quality: typing.Optional[float] = None
+    #: Minimal Phred quality of bases at informative positions, if any.
+    min_base_quality: typing.Optional[float] = None
+    #: Path to the result cache directory, if any.
+    cache_dir: typing.Optional[str] = None
+    #: Maximal size of the result cache in bytes.
+    cache_size: int = DEFAULT_CACHE_SIZE
 
 
 def run(parser, args):
     """Run the ``hlso`` command line interface."""
     args = _proc_args(parser, args)
+    if args.manifest == "-" and args.input_list == "-":
+        parser.error("--manifest and --input-list cannot both be read from stdin")
+    other_inputs = args.seq_files or args.input_dirs or args.input_list
+    if args.stream_output and args.manifest and other_inputs:
+        # the records of a TSV file must have the same sample columns
+        parser.error("--stream-output cannot combine --manifest with other input files")
     config = Config(
         input_paths=tuple(args.seq_files),
         output_path=args.output,
+        input_dirs=tuple(args.input_dirs),
+        extensions=tuple(args.extensions or DEFAULT_EXTENSIONS),
+        manifest=args.manifest,
+        input_list=args.input_list,
+        stream_output=args.stream_output,
         sample_name_from_file=args.sample_name_from_file,
         sample_regex=args.sample_regex,
+        batch_size=args.batch_size,
+        jobs=args.jobs,
+        aligner=args.aligner,
+        trim_quality=args.trim_quality,
+        min_base_quality=args.min_base_quality,
+        cache_dir=args.cache_dir,
+        cache_size=args.cache_size * 1024 * 1024,
     )
     logger.info("Starting Lso classification.")
     logger.info("Arguments are %s", config)
+    input_files = iter_input_files(
+        config.input_paths, config.input_dirs, config.manifest, config.input_list, config.extensions
+    )
+    first = next(input_files, None)  # keep the input files lazy for streaming
+    if first is None:
+        parser.error("no input files given")
+    input_files = itertools.chain((first,), input_files)
+    if config.stream_output:
+        run_streaming(config, input_files)
+        return
+    input_files = list(input_files)
     with tempfile.TemporaryDirectory() as tmpdir:
         logger.info("Converting sequences (if necessary)...")
-        seq_files = convert_seqs(args.seq_files, tmpdir, config.sample_name_from_file)
+        registry = SequenceRegistry()
+        seq_files = convert_seqs(
+            [input_file.path for input_file in input_files],
+            tmpdir,
+            config.sample_name_from_file,
+            registry=registry,
+            jobs=config.jobs,
+            trim_quality=config.trim_quality,
+        )
+        if config.manifest:
+            metadata = {
+                seq_file: input_file.metadata or {}
+                for seq_file, input_file in zip(seq_files, input_files)
+            }
+        else:
+            metadata = None
         config = Config(**{**attr.asdict(config), "input_paths": tuple(sorted(seq_files))})
         logger.info("Running BLAST and haplotyping...")
-        results = blast_and_haplotype_many(seq_files)
+        if config.cache_dir:
+            cache = ResultCache(
+                config.cache_dir,
+                config.cache_size,
+                cache_salt(config.aligner, config.min_base_quality),
+            )
+        else:
+            cache = None
+        results = blast_and_haplotype_many(
+            seq_files,
+            config.batch_size,
+            config.jobs,
+            config.aligner,
+            cache,
+            registry,
+            min_quality=config.min_base_quality,
+        )
         logger.info("Converting results into data frames...")
-        df_summary, df_blast, df_haplotyping = results_to_data_frames(results, args.sample_regex)
+        df_summary, df_blast, df_haplotyping = results_to_data_frames(
+            results, args.sample_regex, registry=registry, metadata=metadata
+        )
         logger.info("Summary:\n%s", df_summary)
         logger.info("Writing XLSX file to %s", args.output)
         write_excel(df_summary, df_blast, df_haplotyping, args.output)
@@ -69,6 +166,36 @@ def run(parser, args):
     logger.info("All done. Have a nice day!")
 
 
+def run_streaming(config: Config, input_files: typing.Iterable[InputFile]):
+    """Run the pipeline on ``input_files`` with ``streaming.iter_records()``.
+
+    The records are written to ``config.stream_output`` as they become available.
+    """
+    logger.info("Running streaming pipeline, writing records to %s", config.stream_output)
+    if config.cache_dir:
+        cache = ResultCache(
+            config.cache_dir, config.cache_size, cache_salt(config.aligner, config.min_base_quality)
+        )
+    else:
+        cache = None
+    records = iter_records(
+        input_files,
+        config.sample_regex,
+        config.sample_name_from_file,
+        batch_size=config.batch_size,
+        jobs=config.jobs,
+        aligner=config.aligner,
+        cache=cache,
+        trim_quality=config.trim_quality,
+        min_quality=config.min_base_quality,
+    )
+    count = 0
+    with RecordWriter(config.stream_output) as writer:
+        for count, record in enumerate(records, 1):
+            writer.write(record)
+    logger.info("Wrote %d records. Have a nice day!", count)
+
+
 def add_parser(subparser):
     """Configure the ``argparse`` sub parser."""
     parser = subparser.add_parser("cli")
@@ -85,5 +212,80 @@ def add_parser(subparser):
         default=SAMPLE_REGEX,
         help="Regular expression to match file name to sample name.",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Number of sequences to align in one blastn call (0 for a single call).",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        "--threads",
+        dest="jobs",
+        type=int,
+        default=1,
+        help="Number of cores to use for converting files and running blastn.",
+    )
+    parser.add_argument(
+        "--aligner",
+        default=DEFAULT_ALIGNER,
+        choices=tuple(ALIGNERS),
+        help="Aligner backend to use, 'local' aligns in-process without calling blastn.",
+    )
+    parser.add_argument(
+        "--trim-quality",
+        type=float,
+        default=None,
+        help="Trim the low-quality ends of reads with qualities (AB1, SCF, FASTQ) with the "
+        "modified Mott algorithm to this Phred quality.",
+    )
+    parser.add_argument(
+        "--min-base-quality",
+        type=float,
+        default=None,
+        help="Mask informative positions where the read base has a lower Phred quality.",
+    )
+    parser.add_argument(
+        "--cache-dir", default=None, help="Directory for caching results for each sequence."
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE // 1024 // 1024,
+        help="Maximal size of the result cache in MB.",
+    )
+    parser.add_argument(
+        "--input-dir",
+        dest="input_dirs",
+        default=[],
+        action="append",
+        help="Directory to take input files from (recursively), may be given multiple times.",
+    )
+    parser.add_argument(
+        "--extension",
+        dest="extensions",
+        default=None,
+        action="append",
+        help="Extension of the files to take from --input-dir, may be given multiple times "
+        "(default: %s)." % ", ".join(DEFAULT_EXTENSIONS),
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        help="TSV file with columns path, sample, and region for the input files ('-' for "
+        "stdin), the sample information is then not parsed with --sample-regex.",
+    )
+    parser.add_argument(
+        "--input-list",
+        default=None,
+        help="File with one input file path per line ('-' for stdin).",
+    )
     parser.add_argument("-o", "--output", default="clsified.xlsx", help="Path to output file")
-    parser.add_argument("seq_files", nargs="+", default=[], action="append")
+    parser.add_argument(
+        "--stream-output",
+        default=None,
+        help="Process the input files in batches and write one record per query to this TSV "
+        "(or .jsonl) file as they complete, instead of writing the XLSX file at the end.",
+    )
+    parser.add_argument("seq_files", nargs="*", default=[], action="append")
@@ -1,3 +1,28 @@
+"""Common helper code for sequences, FASTA files, and variant calling."""
+
+import itertools
+import operator
+import typing
+
+import attr
+import numpy as np
+
+from .seqops import IS_DNA, as_array, only_bases
+from .seqops import revcomp  # noqa: F401, kept for backwards compatibility
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class NamedSequence:
+    """A named sequence."""
+
+    #: the sequence name
+    name: str
+    #: the sequence
+    sequence: str
+    #: the Phred qualities, one byte per base, ``None`` if not available
+    qualities: typing.Optional[bytes] = None
+
+
 def load_tsv(input_path):
     header = None
     records = []
@@ -18,35 +43,61 @@ def rev(seq):
     return list(reversed(seq))
 
 
-def revcomp(seq):
-    m = {"a": "t", "A": "T", "t": "a", "T": "A", "c": "g", "C": "G", "g": "c", "G": "C"}
-    return "".join(reversed(list(map(lambda x: m.get(x, x), seq))))
-
-
 def write_fasta(seqs, file):
     for name, seq in seqs.items():
         print(">%s\n%s" % (name, seq), file=file)
 
 
-def load_fasta(path):
+def parse_fasta(lines):
+    """Parse FASTA from ``lines`` and return mapping from sequence name to sequence."""
     result = {}
-    with open(path, "rt") as inputf:
-        name = None
-        seq_lines = []
-        for line in inputf:
-            line = line.rstrip()
-            if line.startswith(">"):
-                if name:
-                    result[name] = "".join(seq_lines)
-                name = line[1:].split()[0]
-                seq_lines = []
-            elif name:  # ignore if first line is not ">"
-                seq_lines.append(line)
-        if name:
-            result[name] = "".join(seq_lines)
+    name = None
+    seq_lines = []
+    for line in lines:
+        line = line.rstrip()
+        if line.startswith(">"):
+            if name:
+                result[name] = "".join(seq_lines)
+            name = line[1:].split()[0]
+            seq_lines = []
+        elif name:  # ignore if first line is not ">"
+            seq_lines.append(line)
+    if name:
+        result[name] = "".join(seq_lines)
     return result
 
 
+def load_fasta(path):
+    with open(path, "rt") as inputf:
+        return parse_fasta(inputf)
+
+
+class SequenceRegistry:
+    """Registry of the sequences in FASTA files such that each file is parsed at most once.
+
+    Sequences can be registered explicitly for a path (e.g., when the file is written) and are
+    otherwise loaded from the file on first access.
+    """
+
+    def __init__(self):
+        #: Mapping from path to the sequences in the file.
+        self._sequences = {}
+
+    def add(self, path: str, sequences: typing.Iterable[NamedSequence]):
+        """Register ``sequences`` as the content of the file at ``path``."""
+        self._sequences[path] = tuple(sequences)
+
+    def get(self, path: str) -> typing.Tuple[NamedSequence]:
+        """Return sequences from the file at ``path``."""
+        if path not in self._sequences:
+            self.add(path, (NamedSequence(name, seq) for name, seq in load_fasta(path).items()))
+        return self._sequences[path]
+
+    def get_dict(self, path: str) -> typing.Dict[str, str]:
+        """Return mapping from sequence name to sequence for the file at ``path``."""
+        return {seq.name: seq.sequence for seq in self.get(path)}
+
+
 def describe(*, pos, ref, alt, **kwargs):
     """Return description of variant."""
     if "-" in ref and "-" in alt:
@@ -89,108 +140,189 @@ def describe(*, pos, ref, alt, **kwargs):
             return "n.%d_%ddel%s" % (pos + 1, pos + len(ref) - 1, ref[1:])
 
 
-def only_bases(s):
-    return "".join([x for x in s if x.upper() in "CGATN"])
+class _Variant:
+    """Compact record of a normalized variant, see ``call_variants()`` for the fields."""
 
+    __slots__ = ("pos", "ali_pos", "ref", "alt", "ref_bases", "alt_bases")
 
-def normalize_var(ref_seq, curr_var, offset):
-    """Normalize the variant."""
-    ref_seq = only_bases(ref_seq)
-    ref = only_bases(curr_var["ref_bases"])
-    alt = only_bases(curr_var["alt_bases"])
-    orig_ref, orig_alt = ref, alt
-    pos = curr_var["pos"] - 1 - offset
+    def __init__(self, pos, ali_pos, ref, alt, ref_bases, alt_bases):
+        self.pos = pos
+        self.ali_pos = ali_pos
+        self.ref = ref
+        self.alt = alt
+        self.ref_bases = ref_bases
+        self.alt_bases = alt_bases
+
+    def to_dict(self):
+        result = {
+            "pos": self.pos,
+            "ali_pos": self.ali_pos,
+            "ref": self.ref,
+            "alt": self.alt,
+            "ref_bases": self.ref_bases,
+            "alt_bases": self.alt_bases,
+        }
+        result["description"] = describe(**result)
+        return result
+
+
+def _normalize(ref_seq, pos, ali_pos, ref_bases, alt_bases, offset):
+    """Normalize the variant against ``ref_seq``, the reference row with gaps already removed.
+
+    ``ref_bases`` and ``alt_bases`` must only contain bases, see ``only_bases()``.
+    """
+    ref = ref_bases
+    alt = alt_bases
+    pos_seq = pos - 1 - offset
     delta = 0
-    while ref[-1] == alt[-1] and pos > 0:
+    while ref[-1] == alt[-1] and pos_seq > 0:
         delta += 1
-        pos -= 1
-        ref = ref_seq[pos] + ref
-        alt = ref_seq[pos] + alt
+        pos_seq -= 1
+        ref = ref_seq[pos_seq] + ref
+        alt = ref_seq[pos_seq] + alt
         while ref[-1] == alt[-1] and len(ref) > 1 and len(alt) > 1:
             ref = ref[:-1]
             alt = alt[:-1]
+    return _Variant(
+        pos - delta,
+        ali_pos,
+        ref if len(ref) >= len(alt) else ref + "-" * (len(alt) - len(ref)),
+        alt if len(ref) <= len(alt) else alt + "-" * (len(ref) - len(alt)),
+        ref,
+        alt,
+    )
+
 
+def normalize_var(ref_seq, curr_var, offset):
+    """Normalize the variant."""
+    var = _normalize(
+        only_bases(ref_seq),
+        curr_var["pos"],
+        curr_var.get("ali_pos"),
+        only_bases(curr_var["ref_bases"]),
+        only_bases(curr_var["alt_bases"]),
+        offset,
+    )
     result = dict(curr_var)
-    result["pos"] -= delta
-    result["ref"] = ref if len(ref) >= len(alt) else ref + "-" * (len(alt) - len(ref))
-    result["alt"] = alt if len(ref) <= len(alt) else alt + "-" * (len(ref) - len(alt))
-    result["ref_bases"] = ref
-    result["alt_bases"] = alt
+    result["pos"] = var.pos
+    result["ref"] = var.ref
+    result["alt"] = var.alt
+    result["ref_bases"] = var.ref_bases
+    result["alt_bases"] = var.alt_bases
     result["description"] = describe(**result)
     return result
 
 
+def _call_run(ref, alt, ref_seq, begin, end, gaps, offset):
+    """Return the normalized variant for the run of differing columns ``[begin, end)``.
+
+    ``gaps`` is the number of gaps in ``ref`` left of ``begin``.
+    """
+    is_last = end == len(ref)
+    pos = offset + begin - gaps + 1
+    ali_pos = begin + 1
+    var_ref = ref[begin:end]
+    var_alt = alt[begin:end]
+    if var_ref[0] == "-" or var_alt[0] == "-":
+        if ali_pos > 1:  # left-pad indels if possible
+            pos -= 1
+            ali_pos -= 1
+            var_ref = ref[begin - 1] + var_ref
+            var_alt = alt[begin - 1] + var_alt
+        else:  # use base right of it, VCF-style
+            if is_last:
+                pos = ali_pos
+            var_ref += ref[end + 1]
+            var_alt += alt[end + 1]
+    if not is_last and "-" in var_ref and "-" in var_alt:
+        describe(pos=pos, ref=var_ref, alt=var_alt)  # raises
+    return _normalize(ref_seq, pos, ali_pos, only_bases(var_ref), only_bases(var_alt), offset)
+
+
 def call_variants(ref, alt, offset=0):
     """Call variants from alignment (``ref`` and ``alt`` with gaps).
 
-    The resulting positions are 1-based.
+    The resulting positions are 1-based.  The alignment is scanned once for runs of differing
+    columns and the ungapped reference for normalization is only computed once.
     """
     if len(ref) != len(alt):
         raise Exception("Invalid alignment row lengths: %d vs. %d", len(ref), len(alt))
     result = {}
     ref = ref.upper()
     alt = alt.upper()
+    ref_seq = only_bases(ref)
 
-    pos_ref = offset  # position in ref
-    i = 0  # position in rows
-    curr_var = {}
-    while i < len(ref):
-        if ref[i] == alt[i]:
-            if curr_var:
-                if curr_var["ref"].startswith("-") or curr_var["alt"].startswith("-"):
-                    if curr_var["ali_pos"] > 1:  # left-pad indels if possible
-                        curr_var = {
-                            "pos": curr_var["pos"] - 1,
-                            "ali_pos": curr_var["ali_pos"] - 1,
-                            "ref": ref[curr_var["ali_pos"] - 2] + curr_var["ref"],
-                            "alt": alt[curr_var["ali_pos"] - 2] + curr_var["alt"],
-                        }
-                    else:  # use base right of it, VCF-style
-                        curr_var = {
-                            "pos": curr_var["pos"],
-                            "ali_pos": curr_var["ali_pos"],
-                            "ref": curr_var["ref"]
-                            + ref[curr_var["ali_pos"] + len(curr_var["ref"])],
-                            "alt": curr_var["alt"]
-                            + alt[curr_var["ali_pos"] + len(curr_var["alt"])],
-                        }
-                curr_var["ref_bases"] = only_bases(curr_var["ref"])
-                curr_var["alt_bases"] = only_bases(curr_var["alt"])
-                curr_var["description"] = describe(**curr_var)
-                curr_var = normalize_var(ref, curr_var, offset)
-                result[curr_var["pos"]] = curr_var
-                curr_var = {}
-        else:
-            if curr_var:
-                curr_var["ref"] = curr_var["ref"] + ref[i]
-                curr_var["alt"] = curr_var["alt"] + alt[i]
-            else:
-                curr_var = {"pos": pos_ref + 1, "ali_pos": i + 1, "ref": ref[i], "alt": alt[i]}
-
-        if ref[i] != "-":
-            pos_ref += 1
-        i += 1
-
-    if curr_var:
-        if curr_var["ref"].startswith("-") or curr_var["alt"].startswith("-"):
-            if curr_var["ali_pos"] > 1:  # left-pad indels if possible
-                curr_var = {
-                    "pos": curr_var["pos"] - 1,
-                    "ali_pos": curr_var["ali_pos"] - 1,
-                    "ref": ref[curr_var["ali_pos"] - 2] + curr_var["ref"],
-                    "alt": alt[curr_var["ali_pos"] - 2] + curr_var["alt"],
-                }
-            else:  # use base right of it, VCF-style
-                curr_var = {
-                    "pos": curr_var["ali_pos"],
-                    "ali_pos": curr_var["ali_pos"],
-                    "ref": curr_var["ref"] + ref[curr_var["ali_pos"] + len(curr_var["ref"])],
-                    "alt": curr_var["alt"] + alt[curr_var["ali_pos"] + len(curr_var["alt"])],
-                }
-        curr_var["ref_bases"] = only_bases(curr_var["ref"])
-        curr_var["alt_bases"] = only_bases(curr_var["alt"])
-        curr_var = normalize_var(ref, curr_var, offset)
-        curr_var["description"] = describe(**curr_var)
-        result[curr_var["pos"]] = curr_var
+    diffs = list(itertools.compress(range(len(ref)), map(operator.ne, ref, alt)))
+    num_diffs = len(diffs)
+    gaps = 0  # number of gaps in ref left of column ``scanned``
+    scanned = 0
+    k = 0
+    while k < num_diffs:
+        # Find the run of differing columns ``[begin, end)``.
+        begin = diffs[k]
+        end = begin + 1
+        k += 1
+        while k < num_diffs and diffs[k] == end:
+            end += 1
+            k += 1
+        gaps += ref.count("-", scanned, begin)
+        scanned = begin
+        var = _call_run(ref, alt, ref_seq, begin, end, gaps, offset).to_dict()
+        result[var["pos"]] = var
 
     return result
+
+
+def genotype_positions(ref, alt, positions, offset=0):
+    """Return the subset of the 1-based ``positions`` that ``call_variants()`` reports.
+
+    Instead of calling all variants, the reference ``positions`` are mapped to alignment columns
+    with an index of the ungapped reference columns.  Substitutions can then be looked up in the
+    alignment directly, only runs of differing columns that involve gaps (or characters other
+    than ``ACGTN``) are normalized as in ``call_variants()``, which also raises the same errors.
+    """
+    if len(ref) != len(alt):
+        raise Exception("Invalid alignment row lengths: %d vs. %d", len(ref), len(alt))
+    ref = ref.upper()
+    alt = alt.upper()
+    if not (ref.isascii() and alt.isascii()):
+        return set(positions) & set(call_variants(ref, alt, offset))
+    ref_arr = as_array(ref)
+    alt_arr = as_array(alt)
+    # Column of each ungapped reference position, i.e., the cumulative gap index.
+    columns = np.flatnonzero(ref_arr != ord("-"))
+    is_diff = ref_arr != alt_arr
+    is_special = ~(IS_DNA[ref_arr] & IS_DNA[alt_arr])
+    length = len(ref)
+
+    def run_end(begin):
+        end = begin + 1
+        while end < length and ref[end] != alt[end]:
+            end += 1
+        return end
+
+    result = set()
+    # Normalize the runs with gaps and other characters, in order such that errors match.
+    ref_seq = None
+    end = 0
+    for col in np.flatnonzero(is_diff & is_special).tolist():
+        if col < end:
+            continue  # part of previous run
+        if ref_seq is None:
+            ref_seq = only_bases(ref)
+        begin = col
+        while begin > 0 and ref[begin - 1] != alt[begin - 1]:
+            begin -= 1
+        end = run_end(begin)
+        gaps = begin - int(np.searchsorted(columns, begin))
+        result.add(_call_run(ref, alt, ref_seq, begin, end, gaps, offset).pos)
+    # Look up substitutions at the columns of the remaining positions.
+    for pos in positions:
+        index = pos - 1 - offset
+        if pos in result or not 0 <= index < len(columns):
+            continue
+        col = int(columns[index])
+        if ref[col] != alt[col] and (col == 0 or ref[col - 1] == alt[col - 1]):
+            if not is_special[col : run_end(col)].any():
+                result.add(pos)
+    return result & set(positions)
@@ -1,63 +1,136 @@
 """Helpers for converting read files."""
 
+import collections
+import concurrent.futures
+import functools
+import itertools
 import os
-import tempfile
 import typing
 
-from bioconvert.scf2fasta import SCF2FASTA
-from bioconvert.abi2fasta import ABI2FASTA
-from bioconvert.fastq2fasta import FASTQ2FASTA
 from logzero import logger
 
-from .common import load_fasta
+from .common import NamedSequence, SequenceRegistry
+from .traces import READERS, read_traces, trim_trace, Trace
+
+
+def read_seq_file(
+    seq_path: str, trim_quality: typing.Optional[float] = None
+) -> typing.Dict[str, Trace]:
+    """Read the sequences from the SCF, AB1, FASTQ, or FASTA file at ``seq_path``.
+
+    Returns mapping from sequence name (as ``load_fasta()`` would read it after conversion to
+    FASTA) to ``Trace``.  With ``trim_quality``, the low-quality ends of reads with qualities
+    are trimmed, see ``trim_trace()``.
+    """
+    if os.path.splitext(seq_path)[1] in READERS:
+        logger.info("Converting file %s...", seq_path)
+    result = {}
+    for trace in read_traces(seq_path):
+        result[(trace.name.split() or [""])[0]] = trim_trace(trace, trim_quality)
+    return result
+
+
+def iter_seq_files(
+    seq_files: typing.Iterable[str], jobs: int = 1, trim_quality: typing.Optional[float] = None
+) -> typing.Iterator[typing.Dict[str, Trace]]:
+    """Read the sequences from the ``seq_files`` with ``read_seq_file()``, lazily and in order.
+
+    With ``jobs > 1``, the files are read in a pool of that many processes, with at most a few
+    files per process read ahead.
+    """
+    read = functools.partial(read_seq_file, trim_quality=trim_quality)
+    if jobs <= 1:
+        yield from map(read, seq_files)
+        return
+    seq_files = iter(seq_files)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        pending = collections.deque(
+            executor.submit(read, path) for path in itertools.islice(seq_files, 4 * jobs)
+        )
+        while pending:
+            traces = pending.popleft().result()
+            pending.extend(executor.submit(read, path) for path in itertools.islice(seq_files, 1))
+            yield traces
+
+
+def read_seq_files(
+    seq_files: typing.Iterable[str], jobs: int = 1, trim_quality: typing.Optional[float] = None
+) -> typing.List[typing.Dict[str, Trace]]:
+    """Read the sequences from all ``seq_files`` with ``read_seq_file()``, in order.
+
+    With ``jobs > 1``, the files are read in a pool of that many processes.
+    """
+    seq_files = list(seq_files)
+    return list(iter_seq_files(seq_files, jobs if len(seq_files) > 1 else 1, trim_quality))
+
+
+def fasta_records(
+    seq_path: str, traces: typing.Dict[str, Trace], sample_name_from_file_name: bool = False
+) -> typing.List[typing.Tuple[str, Trace]]:
+    """Return the ``(header, trace)`` pairs for writing the ``traces`` of ``seq_path`` as FASTA.
+
+    With ``sample_name_from_file_name``, the sequences are named by the file name, numbered if
+    there is more than one.
+    """
+    file_basename = os.path.basename(seq_path)[: -len(".fasta")]
+    if sample_name_from_file_name and len(traces) != 1:
+        prefix_no = 1
+    else:
+        prefix_no = 0
+
+    result = []
+    for name, trace in traces.items():
+        if sample_name_from_file_name:
+            name = file_basename
+        if prefix_no:
+            prefix = "_%d" % prefix_no
+            prefix_no += 1
+        else:
+            prefix = ""
+        result.append((prefix + name, trace))
+    return result
 
 
 def convert_seqs(
-    seq_files: typing.Iterable[str], tmpdir: str, sample_name_from_file_name: bool = False
+    seq_files: typing.Iterable[str],
+    tmpdir: str,
+    sample_name_from_file_name: bool = False,
+    registry: typing.Optional[SequenceRegistry] = None,
+    jobs: int = 1,
+    trim_quality: typing.Optional[float] = None,
 ) -> typing.List[str]:
-    """Convert SRF and AB1 files to FASTQ."""
+    """Convert SRF and AB1 files to FASTQ.
+
+    The files are read in ``jobs`` processes and trimmed to ``trim_quality``, if given.  The
+    sequences of the resulting files are registered with ``registry``, if given, together with
+    their qualities (if any).
+    """
     logger.info("Running file conversion...")
+    seq_files = list(seq_files)
     result = []
+    seen = set()
 
-    for seq_path in seq_files:
+    for seq_path, traces in zip(seq_files, read_seq_files(seq_files, jobs, trim_quality)):
         file_basename = os.path.basename(seq_path)[: -len(".fasta")]
         path_fasta = os.path.join(tmpdir, file_basename) + ".fasta"
+        if path_fasta in seen:  # same file name in another input directory
+            os.makedirs(os.path.join(tmpdir, str(len(result))))
+            path_fasta = os.path.join(tmpdir, str(len(result)), file_basename) + ".fasta"
+        seen.add(path_fasta)
         result.append(path_fasta)
 
-        path_fasta_tmp = tempfile.NamedTemporaryFile(dir=tmpdir, delete=False).name
-        with open(seq_path, "rb") as seq_file:
-            if seq_path.endswith(".scf"):
-                logger.info("Converting SCF file %s...", seq_path)
-                SCF2FASTA(seq_file, path_fasta_tmp)()
-                result.append(path_fasta_tmp)
-            elif seq_path.endswith(".ab1"):
-                logger.info("Converting ABI file %s...", seq_path)
-                ABI2FASTA(seq_file, path_fasta_tmp)()
-                result.append(path_fasta_tmp)
-            elif seq_path.endswith(".fastq"):
-                logger.info("Converting FASTAQ file %s...", seq_path)
-                FASTQ2FASTA(seq_file, path_fasta_tmp)()
-                result.append(path_fasta_tmp)
-            else:
-                path_fasta_tmp = seq_path
-
-        fasta_content = load_fasta(path_fasta_tmp)
-
-        if sample_name_from_file_name and len(fasta_content) != 1:
-            prefix_no = 1
-        else:
-            prefix_no = 0
-
+        sequences = []
         with open(path_fasta, "wt") as outputf:
-            for name, seq in fasta_content.items():
-                if sample_name_from_file_name:
-                    name = file_basename
-                if prefix_no:
-                    prefix = "_%d" % prefix_no
-                    prefix_no += 1
-                else:
-                    prefix = ""
-                print(">%s%s\n%s" % (prefix, name, seq), file=outputf)
+            for header, trace in fasta_records(seq_path, traces, sample_name_from_file_name):
+                print(">%s\n%s" % (header, trace.sequence), file=outputf)
+                # register name as ``load_fasta()`` would read it
+                sequences.append(
+                    NamedSequence(
+                        name=header.split()[0], sequence=trace.sequence, qualities=trace.qualities
+                    )
+                )
+        if registry is not None:
+            registry.add(path_fasta, sequences)
 
     logger.info("Done converting files.")
     return result
@@ -16,7 +16,9 @@ def run(parser, args):
     logger.info("Converting sequences...")
     logger.info("Args = %s", args)
     with tempfile.TemporaryDirectory() as tmpdir:
-        seq_files = convert_seqs(args.seq_files, tmpdir)
+        seq_files = convert_seqs(
+            args.seq_files, tmpdir, jobs=args.jobs, trim_quality=args.trim_quality
+        )
         for seq_file in seq_files:
             shutil.copy(seq_file, os.path.join(args.out_dir, os.path.basename(seq_file)))
     logger.info("All done, have a nice day!")
@@ -33,5 +35,14 @@ def add_parser(subparser):
         default=False,
         help="Set file name to sample name",
     )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=1, help="Number of processes for converting files."
+    )
+    parser.add_argument(
+        "--trim-quality",
+        type=float,
+        default=None,
+        help="Trim the low-quality ends of reads with qualities to this Phred quality.",
+    )
     parser.add_argument("out_dir", help="Path to output directory.")
     parser.add_argument("seq_files", nargs="+", default=[], action="append")
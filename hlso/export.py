@@ -1,5 +1,9 @@
 """Code for exporting the data frames generated from the ``workflow`` module."""
 
+import json
+import os
+import typing
+
 import pandas as pd
 
 from .web.settings import (
@@ -76,4 +80,57 @@ def write_excel(df_summary, df_blast, df_haplotyping, path):
         )
         sheet_blast.conditional_format("%s2:%s%d" % (c_blast, c_blast, df_blast.shape[0] + 1), cond)
 
-    writer.save()
+    writer.close()
+
+
+def _tsv_value(value: typing.Any) -> str:
+    """Return ``value`` as a TSV field with backslashes, tabs, and line breaks escaped."""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class RecordWriter:
+    """Incremental writer for records (dicts) as TSV or JSON Lines, by extension of ``path``.
+
+    Each record is written and flushed immediately.  The TSV header is taken from the keys of
+    the first record, later records must have the same keys.  Tabs and line breaks in the TSV
+    values are escaped as ``\\t``, ``\\n``, and ``\\r``.
+    """
+
+    def __init__(self, path: str):
+        #: Path to the output file.
+        self.path = path
+        #: Whether to write JSON Lines instead of TSV.
+        self.jsonl = os.path.splitext(path)[1] in (".jsonl", ".json")
+        #: The TSV columns, set on the first record.
+        self.columns = None
+        self._outputf = open(path, "wt")
+
+    def write(self, record: typing.Dict[str, typing.Any]):
+        """Write and flush ``record``."""
+        if self.jsonl:
+            print(json.dumps(record), file=self._outputf)
+        else:
+            if self.columns is None:
+                self.columns = list(record)
+                print("\t".join(map(_tsv_value, self.columns)), file=self._outputf)
+            elif set(record) != set(self.columns):
+                raise ValueError(
+                    "Record columns %s differ from the header %s" % (list(record), self.columns)
+                )
+            print("\t".join(_tsv_value(record[col]) for col in self.columns), file=self._outputf)
+        self._outputf.flush()
+
+    def close(self):
+        self._outputf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -3,6 +3,7 @@
 This contains the informative positions for haplotyping of calls.
 """
 
+import bisect
 import os
 import shlex
 import subprocess
@@ -12,9 +13,10 @@ import typing
 import attr
 import json
 from logzero import logger
+import numpy as np
 
 from .blast import BlastMatch
-from .common import call_variants, normalize_var
+from .common import call_variants, genotype_positions, normalize_var
 
 
 @attr.s(auto_attribs=True, frozen=True)
@@ -56,16 +58,146 @@ def load_haplotyping_table(path: str) -> typing.Dict[typing.Tuple[str, int], Hap
     return result
 
 
+#: Path to the haplotype table file.
+HAPLOTYPE_TABLE_FILE = os.path.join(os.path.dirname(__file__), "data", "haplotype_table.txt")
+
 #: The haplotype table.
-HAPLOTYPE_TABLE = load_haplotyping_table(
-    os.path.join(os.path.dirname(__file__), "data", "haplotype_table.txt")
-)
+HAPLOTYPE_TABLE = load_haplotyping_table(HAPLOTYPE_TABLE_FILE)
 # logger.debug("haplotype table = %s", HAPLOTYPE_TABLE)
 
 #: The haplotype names
 HAPLOTYPE_NAMES = "ABCDE"
 
 
+@attr.s(auto_attribs=True, frozen=True)
+class HaplotypingIndex:
+    """Index of haplotyping table keys by reference and position."""
+
+    #: mapping from reference to sorted 0-based positions
+    positions: typing.Dict[str, typing.Tuple[int]]
+    #: mapping from reference to haplotyping table keys, in the same order as ``positions``
+    keys: typing.Dict[str, typing.Tuple[typing.Tuple[str, int, str]]]
+
+    @staticmethod
+    def build(
+        table: typing.Dict[typing.Tuple[str, int, str], HaplotypingPos],
+    ) -> typing.TypeVar("HaplotypingIndex"):
+        by_reference = {}
+        for key in table:
+            by_reference.setdefault(key[0], []).append(key)
+        keys = {ref: tuple(sorted(lst, key=lambda k: k[1])) for ref, lst in by_reference.items()}
+        return HaplotypingIndex(
+            positions={ref: tuple(key[1] for key in lst) for ref, lst in keys.items()}, keys=keys
+        )
+
+    def overlapping(
+        self, reference: str, start: int, end: int
+    ) -> typing.Tuple[typing.Tuple[str, int, str]]:
+        """Return keys on ``reference`` with positions in the 0-based interval ``[start, end)``."""
+        positions = self.positions.get(reference, ())
+        begin = bisect.bisect_left(positions, start)
+        return self.keys.get(reference, ())[begin : bisect.bisect_left(positions, end, begin)]
+
+
+#: The index of the haplotype table.
+HAPLOTYPE_INDEX = HaplotypingIndex.build(HAPLOTYPE_TABLE)
+
+#: Mapping from haplotype name to mapping from haplotype table key to allele.
+HAPLOTYPE_ALLELES = {
+    name: {key: pos.haplo_values[name] for key, pos in HAPLOTYPE_TABLE.items()}
+    for name in HAPLOTYPE_NAMES
+}
+
+#: Column names for the haplotype table positions, paired with their keys.
+HAPLOTYPE_COLUMNS = tuple(
+    ("%s:%d:%s" % (key[0], key[1] + 1, key[2]), key) for key in HAPLOTYPE_TABLE
+)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class HaplotypeMatrix:
+    """Haplotype table compiled into a matrix of integer-coded alleles."""
+
+    #: haplotype names, one for each matrix column
+    names: typing.Tuple[str]
+    #: mapping from haplotyping table key to matrix row
+    sites: typing.Dict[typing.Tuple[str, int, str], int]
+    #: for each matrix row, mapping from allele to code
+    codes: typing.Tuple[typing.Dict[str, int]]
+    #: matrix of allele codes with one row per site and one column per haplotype
+    matrix: np.ndarray
+
+    @staticmethod
+    def build(
+        table: typing.Dict[typing.Tuple[str, int, str], HaplotypingPos], names: typing.Iterable[str]
+    ) -> typing.TypeVar("HaplotypeMatrix"):
+        names = tuple(names)
+        codes = []
+        for pos in table.values():
+            alleles = {}
+            for name in names:
+                alleles.setdefault(pos.haplo_values[name], len(alleles))
+            codes.append(alleles)
+        matrix = np.asarray(
+            [
+                [alleles[pos.haplo_values[name]] for name in names]
+                for alleles, pos in zip(codes, table.values())
+            ],
+            dtype=np.int32,
+        ).reshape(len(codes), len(names))
+        return HaplotypeMatrix(
+            names=names,
+            sites={key: i for i, key in enumerate(table)},
+            codes=tuple(codes),
+            matrix=matrix,
+        )
+
+    def encode(
+        self, informative_values: typing.Sequence[typing.Dict[typing.Tuple[str, int, str], str]]
+    ) -> np.ndarray:
+        """Encode the informative values into a matrix with one row per element.
+
+        Missing sites are encoded as ``-1`` and alleles not found in any haplotype as ``-2``.
+        """
+        result = np.full((len(informative_values), len(self.codes)), -1, dtype=np.int32)
+        for i, values in enumerate(informative_values):
+            for key, value in values.items():
+                site = self.sites[key]
+                result[i, site] = self.codes[site].get(value, -2)
+        return result
+
+    def score(
+        self, informative_values: typing.Sequence[typing.Dict[typing.Tuple[str, int, str], str]]
+    ) -> typing.Dict[str, typing.List]:
+        """Score the informative values of multiple results against all haplotypes.
+
+        Returns a dict with the columns ``best_haplotypes``, ``best_score``, and ``X_pos``
+        and ``X_neg`` for each haplotype ``X``, each having one entry per element.
+        """
+        observed = self.encode(informative_values)
+        positive = (observed[:, :, np.newaxis] == self.matrix[np.newaxis, :, :]).sum(axis=1)
+        negative = (observed != -1).sum(axis=1)[:, np.newaxis] - positive
+        scores = positive - negative
+        best_scores = scores.max(axis=1, initial=np.iinfo(np.int32).min)
+        best_haplotypes = [
+            (
+                ",".join(name for name, value in zip(self.names, row) if value == best)
+                if best > 0
+                else "-"
+            )
+            for row, best in zip(scores.tolist(), best_scores.tolist())
+        ]
+        result = {"best_haplotypes": best_haplotypes, "best_score": best_scores.tolist()}
+        for i, name in enumerate(self.names):
+            result["%s_pos" % name] = positive[:, i].tolist()
+            result["%s_neg" % name] = negative[:, i].tolist()
+        return result
+
+
+#: The haplotype table compiled into a matrix.
+HAPLOTYPE_MATRIX = HaplotypeMatrix.build(HAPLOTYPE_TABLE, HAPLOTYPE_NAMES)
+
+
 @attr.s(auto_attribs=True, frozen=True)
 class HaplotypingResult:
     """A haplotyping result."""
@@ -76,6 +208,19 @@ class HaplotypingResult:
     query: str
     #: mapping from ``(reference, zero_based_pos)`` to allele value
     informative_values: typing.Dict[typing.Tuple[str, int, str], str]
+    #: keys of informative positions masked for low base quality, ``None`` if not masking
+    masked: typing.Optional[typing.Tuple[typing.Tuple[str, int, str]]] = None
+
+    def _merge_masked(
+        self, others: typing.Sequence[typing.TypeVar("HaplotypingResult")], merged: typing.Dict
+    ) -> typing.Optional[typing.Tuple[typing.Tuple[str, int, str]]]:
+        """Return the masked keys of ``self`` and ``others`` that are not in ``merged``."""
+        if all(r.masked is None for r in (self, *others)):
+            return None
+        masked = set(self.masked or ())
+        for other in others:
+            masked |= set(other.masked or ())
+        return tuple(sorted(masked - merged.keys()))
 
     def merge(
         self, other: typing.TypeVar("HaplotypingResult")
@@ -92,52 +237,56 @@ class HaplotypingResult:
                 if here == there:
                     merged[key] = here
             merged[key] = self.informative_values.get(key, other.informative_values.get(key))
+        masked = self._merge_masked([other], merged)
         if self.filename == other.filename and self.query == other.query:
             return HaplotypingResult(
-                filename=self.filename, query=self.query, informative_values=merged
+                filename=self.filename, query=self.query, informative_values=merged, masked=masked
             )
         else:
-            return HaplotypingResult(filename="-", query="-", informative_values=merged)
-
-    def asdict(self, only_summary=False) -> typing.Dict:
-        informative = {}
-        scores = {}
-        for name in HAPLOTYPE_NAMES:
-            plus, minus = self.compare(name)
-            informative["%s_pos" % name] = plus
-            informative["%s_neg" % name] = minus
-            scores[name] = plus - minus
-        best_score = max(scores.values())
-        if best_score > 0:
-            best_haplotypes = ",".join(
-                [key for key, value in scores.items() if value == best_score]
+            return HaplotypingResult(
+                filename="-", query="-", informative_values=merged, masked=masked
             )
+
+    @staticmethod
+    def merge_all(
+        results: typing.Sequence[typing.TypeVar("HaplotypingResult")],
+    ) -> typing.TypeVar("HaplotypingResult"):
+        """Merge all ``results`` in one pass, equivalent to repeated ``merge()`` calls."""
+        merged = {}
+        for result in results:
+            for key, value in result.informative_values.items():
+                merged.setdefault(key, value)
+        first = results[0]
+        if all(r.filename == first.filename and r.query == first.query for r in results):
+            filename, query = first.filename, first.query
         else:
-            best_haplotypes = "-"
+            filename, query = "-", "-"
+        return HaplotypingResult(
+            filename=filename,
+            query=query,
+            informative_values={key: merged[key] for key in sorted(merged)},
+            masked=first._merge_masked(results[1:], merged),
+        )
+
+    def asdict(self, only_summary=False) -> typing.Dict:
+        scores = {key: values[0] for key, values in score_haplotypes([self]).items()}
         if only_summary:
-            return {"best_haplotypes": best_haplotypes, "best_score": best_score}
+            return {
+                "best_haplotypes": scores["best_haplotypes"],
+                "best_score": scores["best_score"],
+            }
         else:
             return {
                 "filename": self.filename,
-                "best_haplotypes": best_haplotypes,
-                "best_score": best_score,
-                **informative,
-                **{
-                    "%s:%d:%s" % (key[0], key[1] + 1, key[2]): self.informative_values.get(key)
-                    for key in HAPLOTYPE_TABLE
-                },
+                **scores,
+                **{column: self.informative_values.get(key) for column, key in HAPLOTYPE_COLUMNS},
             }
 
     def compare(self, haplotype: str) -> typing.Tuple[int, int]:
         """Return ``(match_count, mismatch_count)`` for the given ``haplotype``."""
-        positive = 0
-        negative = 0
-        for key, value in self.informative_values.items():
-            if HAPLOTYPE_TABLE[key].haplo_values[haplotype] == value:
-                positive += 1
-            else:
-                negative += 1
-        return (positive, negative)
+        alleles = HAPLOTYPE_ALLELES[haplotype]
+        positive = sum(1 for key, value in self.informative_values.items() if alleles[key] == value)
+        return (positive, len(self.informative_values) - positive)
 
     @classmethod
     def fromdict(self, dict_: typing.Dict) -> typing.TypeVar("HaplotypingResult"):
@@ -151,6 +300,11 @@ class HaplotypingResult:
         )
 
 
+def score_haplotypes(results: typing.Sequence[HaplotypingResult]) -> typing.Dict[str, typing.List]:
+    """Score all ``results`` against all haplotypes at once, see ``HaplotypeMatrix.score()``."""
+    return HAPLOTYPE_MATRIX.score([result.informative_values for result in results])
+
+
 @attr.s(auto_attribs=True, frozen=True)
 class HaplotypingResultWithMatches:
     """Result from haplotyping."""
@@ -165,31 +319,91 @@ class HaplotypingResultWithMatches:
         return HaplotypingResultWithMatches(None, None)
 
 
+def base_qualities(
+    match: BlastMatch, qualities: bytes, positions: typing.Sequence[int]
+) -> typing.List[int]:
+    """Return the quality of the query base aligned to each 1-based database position.
+
+    ``qualities`` are the Phred qualities of the whole query.  Positions that are deleted in
+    the query get the lower quality of the two flanking bases.
+    """
+    hseq = np.frombuffer(match.alignment.hseq.encode("ascii"), dtype=np.uint8)
+    qseq = np.frombuffer(match.alignment.qseq.encode("ascii"), dtype=np.uint8)
+    ref_count = np.cumsum(hseq != ord("-"))
+    query_count = np.cumsum(qseq != ord("-"))
+    columns = np.searchsorted(
+        ref_count, np.asarray(positions, dtype=np.int64) - match.database_start
+    )
+    columns = np.minimum(columns, len(hseq) - 1)
+    after = query_count[columns]  # number of aligned query bases up to and including column
+    is_gap = qseq[columns] == ord("-")
+    if match.query_strand == "-":  # the alignment rows run along the reverse complement
+        indices = match.query_end - after
+    else:
+        indices = match.query_start + after - 1
+    quals = np.frombuffer(qualities, dtype=np.uint8)
+    result = quals[np.clip(indices, 0, len(quals) - 1)]
+    if is_gap.any():
+        step = -1 if match.query_strand == "-" else 1
+        flank = quals[np.clip(indices + step, 0, len(quals) - 1)]
+        result = np.where(is_gap, np.minimum(result, flank), result)
+    return result.tolist()
+
+
 def run_haplotyping(
     matches: typing.Iterable[BlastMatch],
+    full_calling: bool = False,
+    qualities: typing.Optional[typing.Dict[str, bytes]] = None,
+    min_quality: typing.Optional[float] = None,
 ) -> typing.Dict[str, HaplotypingResultWithMatches]:
-    """Perform the haplotyping based on the match."""
+    """Perform the haplotyping based on the match.
+
+    By default, only the informative positions are genotyped with ``genotype_positions()``,
+    set ``full_calling`` to call all variants with ``call_variants()`` instead.
+
+    With ``min_quality``, informative positions where the query base has a lower quality are
+    masked, i.e., left out of the haplotyping and reported in ``HaplotypingResult.masked``.
+    ``qualities`` maps query names to Phred qualities, queries without are not masked.
+    """
     results_matches = {}
     results_haplo = {}
 
-    # TODO: properly handle overlapping changes; directly look into alignment
+    # TODO: properly handle overlapping changes
     for match in matches:
         ref = match.database
         if "_" in ref:
             ref = ref.split("_")[0]
 
-        calls = call_variants(match.alignment.hseq, match.alignment.qseq, match.database_start)
+        keys = HAPLOTYPE_INDEX.overlapping(ref, match.database_start, match.database_end)
+        masked = None
+        if min_quality is not None:
+            masked = ()
+            if keys and (qualities or {}).get(match.query) is not None:
+                quals = base_qualities(match, qualities[match.query], [key[1] + 1 for key in keys])
+                masked = tuple(key for key, qual in zip(keys, quals) if qual < min_quality)
+                keys = tuple(key for key, qual in zip(keys, quals) if qual >= min_quality)
+        if full_calling:
+            calls = call_variants(match.alignment.hseq, match.alignment.qseq, match.database_start)
+        else:
+            calls = genotype_positions(
+                match.alignment.hseq,
+                match.alignment.qseq,
+                [key[1] + 1 for key in keys],
+                match.database_start,
+            )
 
         informative_values = {}
-        for (h_ref, h_pos, ref_base), variant in HAPLOTYPE_TABLE.items():
-            if ref == h_ref and h_pos >= match.database_start and h_pos < match.database_end:
-                if h_pos + 1 in calls:
-                    informative_values[(ref, h_pos, ref_base)] = variant.haplo_values["alt"]
-                else:
-                    informative_values[(ref, h_pos, ref_base)] = variant.haplo_values["ref"]
+        for key in keys:
+            if key[1] + 1 in calls:
+                informative_values[key] = HAPLOTYPE_TABLE[key].haplo_values["alt"]
+            else:
+                informative_values[key] = HAPLOTYPE_TABLE[key].haplo_values["ref"]
 
         result = HaplotypingResult(
-            filename=match.path, query=match.query, informative_values=informative_values
+            filename=match.path,
+            query=match.query,
+            informative_values=informative_values,
+            masked=masked,
         )
         if result.filename in results_haplo:
             results_matches[result.filename].append(match)
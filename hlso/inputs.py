@@ -0,0 +1,117 @@
+"""Discovery of the input files for the command line interface.
+
+Besides the paths given on the command line, the input files can be taken from directories
+(recursively), from a manifest TSV file with the sample information for each file, or from a
+list of paths (e.g., on stdin).  All sources are read lazily.
+"""
+
+import os
+import sys
+import typing
+
+import attr
+
+from .traces import READERS
+
+#: Default extensions of the files to take from input directories.
+DEFAULT_EXTENSIONS = tuple(READERS) + (".fasta", ".fa")
+
+#: Name of the manifest column with the file paths.
+MANIFEST_PATH_COLUMN = "path"
+
+#: Names of columns that the results already have and that the manifest must not contain.
+MANIFEST_RESERVED_COLUMNS = ("id", "query")
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class InputFile:
+    """An input file with its sample information, if given explicitly."""
+
+    #: the path to the file
+    path: str
+    #: mapping from column name (e.g., ``sample``, ``region``) to value, ``None`` if not given
+    metadata: typing.Optional[typing.Dict[str, typing.Optional[str]]] = None
+
+
+def _open(path: str) -> typing.TextIO:
+    return sys.stdin if path == "-" else open(path, "rt")
+
+
+def iter_input_dir(
+    path: str, extensions: typing.Iterable[str] = DEFAULT_EXTENSIONS
+) -> typing.Iterator[InputFile]:
+    """Yield the files with one of the ``extensions`` below the directory ``path``, sorted."""
+    extensions = tuple(extensions)
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(extensions):
+                yield InputFile(path=os.path.join(root, name))
+
+
+def iter_input_list(path: str) -> typing.Iterator[InputFile]:
+    """Yield the files listed one per line in the file at ``path`` (``"-"`` for stdin)."""
+    inputf = _open(path)
+    try:
+        for line in inputf:
+            if line.strip() and not line.startswith("#"):
+                yield InputFile(path=line.strip())
+    finally:
+        if inputf is not sys.stdin:
+            inputf.close()
+
+
+def iter_manifest(path: str) -> typing.Iterator[InputFile]:
+    """Yield the files from the manifest TSV file at ``path`` (``"-"`` for stdin).
+
+    The manifest has a header line with a ``path`` column, the other columns (e.g., ``sample``
+    and ``region``) give the metadata of the files, empty values are ``None``.  Relative paths
+    are interpreted relative to the directory of the manifest.  Duplicate column names and the
+    ``MANIFEST_RESERVED_COLUMNS`` are rejected.
+    """
+    base_dir = os.getcwd() if path == "-" else os.path.dirname(os.path.abspath(path))
+    header = None
+    inputf = _open(path)
+    try:
+        for line in inputf:
+            if line.startswith("#") or not line.strip():
+                continue
+            arr = line.rstrip("\r\n").split("\t")
+            if not header:
+                header = arr
+                if MANIFEST_PATH_COLUMN not in header:
+                    raise ValueError("Manifest %s has no column %s" % (path, MANIFEST_PATH_COLUMN))
+                reserved = [key for key in header if key in MANIFEST_RESERVED_COLUMNS]
+                if reserved:
+                    raise ValueError("Manifest %s has reserved columns %s" % (path, reserved))
+                if len(set(header)) != len(header):
+                    raise ValueError("Manifest %s has duplicate columns" % path)
+                continue
+            record = dict(zip(header, arr))
+            yield InputFile(
+                path=os.path.join(base_dir, record.pop(MANIFEST_PATH_COLUMN)),
+                metadata={
+                    key: record.get(key) or None for key in header if key != MANIFEST_PATH_COLUMN
+                },
+            )
+    finally:
+        if inputf is not sys.stdin:
+            inputf.close()
+
+
+def iter_input_files(
+    paths: typing.Iterable[str] = (),
+    input_dirs: typing.Iterable[str] = (),
+    manifest: typing.Optional[str] = None,
+    input_list: typing.Optional[str] = None,
+    extensions: typing.Iterable[str] = DEFAULT_EXTENSIONS,
+) -> typing.Iterator[InputFile]:
+    """Yield the input files from the command line ``paths`` and the other sources, in order."""
+    for path in paths:
+        yield InputFile(path=path)
+    for input_dir in input_dirs:
+        yield from iter_input_dir(input_dir, extensions)
+    if manifest:
+        yield from iter_manifest(manifest)
+    if input_list:
+        yield from iter_input_list(input_list)
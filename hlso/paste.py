@@ -6,7 +6,8 @@ import textwrap
 
 from logzero import logger
 
-from .common import load_fasta, revcomp
+from .common import load_fasta, SequenceRegistry
+from .seqops import only_bases, revcomp
 from .conversion import convert_seqs
 from .workflow import blast_and_haplotype_many, REF_FILE
 from .cli import _proc_args
@@ -15,19 +16,19 @@ from .cli import _proc_args
 def do_paste(match, ref_seqs=None):
     ref_seqs = ref_seqs or load_fasta(REF_FILE)
     seq = ref_seqs[match.database]
-    qseq = "".join([c for c in match.alignment.qseq if c in "cgatnCGATN"])
+    qseq = only_bases(match.alignment.qseq)
     if match.query_strand == "-":
         qseq = revcomp(seq)
     seq = seq[: match.database_start] + qseq + seq[match.database_end :]
-    return "".join([c for c in seq if c != "N"]).upper()
+    return seq.replace("N", "").upper()
 
 
 def write_pasted(results, output_prefix):
     logger.info("Loading reference sequences...")
     ref_seqs = load_fasta(REF_FILE)
     logger.info("Writing pasted sequences...")
-    for result in results:
-        for match in result["matches"]:
+    for result in results.values():
+        for match in result.matches:
             if match.database is None:
                 logger.info("  => no match for %s", match.query)
                 continue
@@ -52,9 +53,10 @@ def run(parser, args):
     logger.info("Arguments are %s", vars(args))
     with tempfile.TemporaryDirectory() as tmpdir:
         logger.info("Converting sequences (if necessary)...")
-        seq_files = convert_seqs(args.seq_files, tmpdir)
+        registry = SequenceRegistry()
+        seq_files = convert_seqs(args.seq_files, tmpdir, registry=registry)
         logger.info("Running BLAST (and haplotyping)...")
-        results = blast_and_haplotype_many(seq_files)
+        results = blast_and_haplotype_many(seq_files, registry=registry)
         logger.info("Writing out pasted sequence")
         write_pasted(results, args.output_prefix)
     logger.info("All done. Have a nice day!")
@@ -31,6 +31,7 @@ from .ref_blast import load_tsv
 from .cli import _proc_args
 from .common import call_variants, describe, load_fasta, normalize_var, only_bases
 from .paste import REF_FILE, do_paste
+from .seqops import strip_n
 from .workflow import only_blast
 
 
@@ -40,13 +41,13 @@ def paste_query_seq(query_seq, blast_alignment):
 
     if hsp.strand[0] == "Plus":  # query strand is forward
         prefix = query_seq[: hsp.query_start]
-        sbjct_seq = "".join([c for c in hsp.sbjct if c in "cgatnCGATN"])
+        sbjct_seq = only_bases(hsp.sbjct)
         suffix = query_seq[hsp.query_end :]
         seq = prefix + sbjct_seq + suffix
     else:
         raise Exception("Cannot handle matches on query reverse strand")
 
-    return "".join([c for c in seq if c != "N"]).upper()
+    return seq.replace("N", "").upper()
 
 
 def consensus(cs):
@@ -191,10 +192,6 @@ def build_haplotype_sequences(records, args):
     return results
 
 
-def strip_n(s):
-    return "".join([c for c in s if c not in "nN"])
-
-
 def build_haplotyping_table(records, args):
     """Build consensus sequence for each seed."""
     logger.info("Building haplotyping table...")
@@ -0,0 +1,44 @@
+"""Kernels for operations on DNA sequences.
+
+The operations are implemented with ``str.translate()``/``bytes.translate()`` tables instead of
+per-character Python code.  ``as_array()`` provides NumPy ``uint8`` views for operations on
+many positions at once.
+"""
+
+import numpy as np
+
+#: Characters that are considered bases, see ``only_bases()``.
+BASES = "ACGTNacgtn"
+
+#: Translation table for complementing bases, other characters are kept.
+_COMPLEMENT = str.maketrans("ACGTacgt", "TGCAtgca")
+
+#: All byte values that are not bases, to be deleted with ``bytes.translate()``.
+_NOT_BASES = bytes(sorted(set(range(256)) - set(BASES.encode("ascii"))))
+
+#: Lookup table for upper case DNA characters without gaps, indexed by byte value.
+IS_DNA = np.zeros(256, dtype=bool)
+IS_DNA[np.frombuffer(b"ACGTN", dtype=np.uint8)] = True
+
+
+def revcomp(seq: str) -> str:
+    """Return reverse complement of ``seq``, characters other than ``ACGT`` are kept."""
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def only_bases(seq: str) -> str:
+    """Return ``seq`` with all characters removed that are not in ``BASES``."""
+    if seq.isascii():
+        return seq.encode("ascii").translate(None, _NOT_BASES).decode("ascii")
+    else:
+        return "".join([x for x in seq if x in BASES])
+
+
+def strip_n(seq: str) -> str:
+    """Return ``seq`` with all ``N`` characters (of any case) removed."""
+    return seq.replace("N", "").replace("n", "")
+
+
+def as_array(seq: str) -> np.ndarray:
+    """Return read-only ``uint8`` array view of the ASCII string ``seq``."""
+    return np.frombuffer(seq.encode("ascii"), dtype=np.uint8)
@@ -0,0 +1,189 @@
+"""Streaming pipeline for processing many input files in bounded memory.
+
+The stages (conversion, alignment and haplotyping of batches, building records) run in
+background threads that are connected by bounded queues.  Thus, only a few batches are in
+memory at any time and the records of each batch are available as soon as it is done.  There
+is one record per query with the columns of the summary table; the per-sample summaries that
+need all results are not computed.
+"""
+
+import collections
+import queue
+import re
+import threading
+import typing
+
+from .aligner import DEFAULT_ALIGNER
+from .cache import ResultCache
+from .common import NamedSequence, SequenceRegistry
+from .conversion import fasta_records, iter_seq_files
+from .inputs import InputFile
+from .workflow import blast_and_haplotype_many, iter_result_rows, DEFAULT_BATCH_SIZE
+
+#: Default maximal number of items in each queue between the stages.
+DEFAULT_QUEUE_SIZE = 8
+
+#: The columns of the records after the query and sample information.
+RECORD_COLUMNS = ("database", "identity", "best_haplotypes", "best_score")
+
+#: Marker for the end of the items in a queue.
+_END = object()
+
+
+def buffered(
+    iterable: typing.Iterable, maxsize: int = DEFAULT_QUEUE_SIZE
+) -> typing.Iterator[typing.Any]:
+    """Yield the items of ``iterable``, which is consumed in a background thread.
+
+    At most ``maxsize`` items are buffered in between.  Exceptions are re-raised in the
+    consuming thread and the background thread stops when the generator is closed.
+    """
+    items = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:  # passed to the consumer
+            put((_END, e))
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stopped.set()
+
+
+def iter_converted(
+    input_files: typing.Iterable[InputFile],
+    sample_name_from_file_name: bool = False,
+    jobs: int = 1,
+    trim_quality: typing.Optional[float] = None,
+) -> typing.Iterator[typing.Tuple[InputFile, typing.List[NamedSequence]]]:
+    """Yield ``(input_file, sequences)`` for the ``input_files`` as they are read.
+
+    The sequences are named as by ``conversion.convert_seqs()``.
+    """
+    pending = collections.deque()
+
+    def paths():
+        for input_file in input_files:
+            pending.append(input_file)
+            yield input_file.path
+
+    for traces in iter_seq_files(paths(), jobs, trim_quality):
+        input_file = pending.popleft()
+        yield input_file, [
+            NamedSequence(
+                name=header.split()[0], sequence=trace.sequence, qualities=trace.qualities
+            )
+            for header, trace in fasta_records(input_file.path, traces, sample_name_from_file_name)
+        ]
+
+
+def iter_batches(
+    converted: typing.Iterable[typing.Tuple[InputFile, typing.List[NamedSequence]]],
+    batch_size: typing.Optional[int] = DEFAULT_BATCH_SIZE,
+) -> typing.Iterator[typing.List[typing.Tuple[InputFile, typing.List[NamedSequence]]]]:
+    """Group the ``converted`` files into batches of about ``batch_size`` sequences.
+
+    A ``batch_size`` of ``None`` or ``0`` selects ``DEFAULT_BATCH_SIZE``.
+    """
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    batch, size = [], 0
+    for item in converted:
+        batch.append(item)
+        size += len(item[1])
+        if size >= batch_size:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def parse_sample(query: str, pattern: typing.Pattern) -> typing.Dict[str, typing.Optional[str]]:
+    """Return the named groups of ``pattern`` matched at the start of ``query``.
+
+    This is the counterpart of ``workflow.match_sample_in_data_frame()`` for single records.
+    """
+    m = pattern.match(query)
+    return {name: m.group(name) if m else None for name in pattern.groupindex}
+
+
+def iter_records(
+    input_files: typing.Iterable[InputFile],
+    regex: str,
+    sample_name_from_file_name: bool = False,
+    batch_size: typing.Optional[int] = DEFAULT_BATCH_SIZE,
+    jobs: int = 1,
+    aligner: str = DEFAULT_ALIGNER,
+    cache: typing.Optional[ResultCache] = None,
+    trim_quality: typing.Optional[float] = None,
+    min_quality: typing.Optional[float] = None,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Yield one record per query of the ``input_files``, batch by batch.
+
+    The files are converted, aligned and haplotyped in batches of about ``batch_size``
+    sequences (see ``iter_batches()``) with ``blast_and_haplotype_many()``.  The sample
+    information is taken from the metadata of the input files if given and parsed from the
+    query names with ``regex`` otherwise.  Each record has the ``path`` of the input file, the
+    ``query``, the sample information, and the ``RECORD_COLUMNS`` (and ``masked`` with
+    ``min_quality``), with ``"-"`` for missing values.  Sample information named like one of
+    the other columns is left out.
+    """
+    pattern = re.compile(regex)
+    columns = RECORD_COLUMNS + (("masked",) if min_quality is not None else ())
+
+    def process(batch):
+        registry = SequenceRegistry()
+        for input_file, sequences in batch:
+            registry.add(input_file.path, sequences)
+        results = blast_and_haplotype_many(
+            [input_file.path for input_file, _ in batch],
+            batch_size or DEFAULT_BATCH_SIZE,
+            jobs,
+            aligner,
+            cache,
+            registry,
+            min_quality=min_quality,
+        )
+        metadata = {input_file.path: input_file.metadata for input_file, _ in batch}
+        records = []
+        for path, summary_row, _, haplo_row in iter_result_rows(results, registry):
+            if metadata[path] is not None:
+                sample = metadata[path]
+            else:
+                sample = parse_sample(summary_row["query"], pattern)
+            row = {**haplo_row, **summary_row}
+            record = {"path": path, "query": summary_row["query"]}
+            for key, value in sample.items():
+                if key not in record and key not in columns:
+                    record[key] = "-" if value is None else value
+            record.update((column, row.get(column, "-")) for column in columns)
+            records.append(record)
+        return records
+
+    converted = buffered(
+        iter_converted(input_files, sample_name_from_file_name, jobs, trim_quality), queue_size
+    )
+    for records in buffered(map(process, iter_batches(converted, batch_size)), queue_size):
+        yield from records
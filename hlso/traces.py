@@ -0,0 +1,181 @@
+"""Readers for sequencing trace files and quality trimming.
+
+AB1 (ABIF) and SCF files are parsed directly with ``struct`` from a memory-mapped file.  The
+readers yield the base calls together with their Phred qualities, which can be used for
+trimming the low-quality ends with the modified Mott algorithm before the alignment.
+"""
+
+import mmap
+import os
+import struct
+import typing
+
+import attr
+from Bio.SeqIO.QualityIO import FastqGeneralIterator
+import numpy as np
+
+from .common import load_fasta
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Trace:
+    """A read from a sequencing file."""
+
+    #: the read name
+    name: str
+    #: the base calls
+    sequence: str
+    #: the Phred qualities, one byte per base, ``None`` if not available
+    qualities: typing.Optional[bytes] = None
+
+
+#: Name used for AB1 files without sample name, as by ``Bio.SeqIO``.
+ABIF_UNKNOWN_ID = "<unknown id>"
+
+#: Layout of an ABIF directory entry.
+_ABIF_ENTRY = struct.Struct(">4sihhiii")
+
+#: ABIF element types of Pascal and C strings.
+_ABIF_PSTRING, _ABIF_CSTRING = 18, 19
+
+
+def _mapped(path: str) -> mmap.mmap:
+    with open(path, "rb") as inputf:
+        if not os.fstat(inputf.fileno()).st_size:
+            raise ValueError("Empty trace file %s" % path)
+        return mmap.mmap(inputf.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_abif_tags(buf) -> typing.Dict[str, typing.Tuple[int, bytes]]:
+    """Return mapping from tag name and number (e.g., ``"PBAS2"``) to element type and data."""
+    if buf[:4] != b"ABIF":
+        raise ValueError("Not an ABIF file")
+    _, _, _, _, count, _, offset = _ABIF_ENTRY.unpack_from(buf, 6)
+    result = {}
+    for i in range(count):
+        pos = offset + i * 28
+        name, number, elem_type, _, _, size, data_offset = _ABIF_ENTRY.unpack_from(buf, pos)
+        if size <= 4:  # data is stored in the offset field
+            data = bytes(buf[pos + 20 : pos + 20 + size])
+        else:
+            data = bytes(buf[data_offset : data_offset + size])
+        result["%s%d" % (name.decode("ascii", "replace"), number)] = (elem_type, data)
+    return result
+
+
+def read_ab1(path: str) -> typing.Iterator[Trace]:
+    """Read the base calls (``PBAS2``) and qualities (``PCON2``) from the AB1 file at ``path``."""
+    buf = _mapped(path)
+    try:
+        tags = read_abif_tags(buf)
+    finally:
+        buf.close()
+    name = ABIF_UNKNOWN_ID
+    if "SMPL1" in tags:
+        elem_type, data = tags["SMPL1"]
+        if elem_type == _ABIF_PSTRING:
+            data = data[1 : 1 + data[0]] if data else data
+        name = data.rstrip(b"\0").decode("ascii", "replace")
+    sequence = (tags.get("PBAS2") or tags.get("PBAS1") or (0, b""))[1].decode("ascii")
+    qualities = (tags.get("PCON2") or tags.get("PCON1") or (0, None))[1]
+    if qualities is not None and len(qualities) != len(sequence):
+        qualities = None
+    yield Trace(name=name, sequence=sequence, qualities=qualities)
+
+
+#: Layout of the SCF header after the magic number, up to the version.
+_SCF_HEADER = struct.Struct(">8I4s")
+
+
+def read_scf(path: str) -> typing.Iterator[Trace]:
+    """Read the base calls and qualities from the SCF file at ``path``.
+
+    The read is named by the ``NAME`` comment, if any, and by the file name otherwise.  The
+    quality of each base is the probability value of its channel.
+    """
+    buf = _mapped(path)
+    try:
+        if buf[:4] != b".scf":
+            raise ValueError("Not an SCF file: %s" % path)
+        _, _, num_bases, _, _, bases_offset, comments_size, comments_offset, version = (
+            _SCF_HEADER.unpack_from(buf, 4)
+        )
+        records = np.frombuffer(bytes(buf[bases_offset : bases_offset + 12 * num_bases]), np.uint8)
+        comments = bytes(buf[comments_offset : comments_offset + comments_size])
+    finally:
+        buf.close()
+    if version[:1] >= b"3":
+        # values are stored by field: peak indices, probabilities for A, C, G, T, bases, spare
+        probs = records[4 * num_bases : 8 * num_bases].reshape(4, num_bases)
+        bases = records[8 * num_bases : 9 * num_bases].tobytes()
+    else:
+        # values are stored by base: peak index, probabilities for A, C, G, T, base, spare
+        records = records.reshape(num_bases, 12)
+        probs = records[:, 4:8].T
+        bases = records[:, 8].tobytes()
+    bases = bases.rstrip(b"\0")
+    calls = np.frombuffer(bases.upper(), dtype=np.uint8)
+    qualities = probs[:, : len(bases)].max(axis=0)  # for ambiguous base calls
+    for i, base in enumerate(b"ACGT"):
+        qualities = np.where(calls == base, probs[i, : len(bases)], qualities)
+    name = os.path.splitext(os.path.basename(path))[0]
+    for line in comments.decode("ascii", "replace").split("\n"):
+        if line.startswith("NAME=") and line[5:].strip("\0 "):
+            name = line[5:].strip("\0 ")
+    yield Trace(name=name, sequence=bases.decode("ascii"), qualities=qualities.tobytes())
+
+
+def read_fastq(path: str) -> typing.Iterator[Trace]:
+    """Read the records with their (Sanger encoded) qualities from the FASTQ file at ``path``."""
+    with open(path, "rt") as inputf:
+        for title, sequence, qualities in FastqGeneralIterator(inputf):
+            yield Trace(
+                name=title.split()[0] if title.strip() else "",
+                sequence=sequence,
+                qualities=bytes(ord(c) - 33 for c in qualities),
+            )
+
+
+def read_fasta(path: str) -> typing.Iterator[Trace]:
+    """Read the records from the FASTA file at ``path``, without qualities."""
+    for name, sequence in load_fasta(path).items():
+        yield Trace(name=name, sequence=sequence)
+
+
+#: Readers by file name extension, files with other extensions are read as FASTA.
+READERS = {".ab1": read_ab1, ".scf": read_scf, ".fastq": read_fastq}
+
+
+def read_traces(path: str) -> typing.Iterator[Trace]:
+    """Read the records from the file at ``path`` with the reader for its extension."""
+    return READERS.get(os.path.splitext(path)[1], read_fasta)(path)
+
+
+def mott_trim(qualities: bytes, min_quality: float) -> typing.Tuple[int, int]:
+    """Return ``(begin, end)`` of the high-quality segment with the modified Mott algorithm.
+
+    Each base scores the difference of the error probability for ``min_quality`` and its own
+    error probability, the result is the segment with the maximal score sum (``(0, 0)`` if no
+    segment has a positive sum).
+    """
+    errors = 10.0 ** (np.frombuffer(qualities, dtype=np.uint8) / -10.0)
+    sums = np.concatenate(([0.0], np.cumsum(10.0 ** (min_quality / -10.0) - errors)))
+    minima = np.minimum.accumulate(sums)
+    end = int(np.argmax(sums - minima))
+    if sums[end] - minima[end] <= 0:
+        return 0, 0
+    return int(np.argmax(sums[: end + 1] == minima[end])), end
+
+
+def trim_trace(trace: Trace, min_quality: typing.Optional[float]) -> Trace:
+    """Trim the low-quality ends of ``trace`` with ``mott_trim()``.
+
+    Traces without qualities are returned as they are, as are all traces if ``min_quality`` is
+    ``None``.
+    """
+    if min_quality is None or trace.qualities is None:
+        return trace
+    begin, end = mott_trim(trace.qualities, min_quality)
+    return attr.evolve(
+        trace, sequence=trace.sequence[begin:end], qualities=trace.qualities[begin:end]
+    )
@@ -1,10 +1,12 @@
 """Code for the web interface to Haplotype-Lso."""
 
 import os
+import tempfile
 
 from logzero import logger
 
 from . import settings
+from ..aligner import ALIGNERS
 
 
 def run(parser, args):
@@ -13,6 +15,23 @@ def run(parser, args):
     settings.HOST = args.host
     settings.PORT = args.port
     settings.PUBLIC_URL_PREFIX = args.public_url_prefix
+    settings.ALIGNER = args.aligner
+    settings.TRIM_QUALITY = args.trim_quality
+    settings.MIN_BASE_QUALITY = args.min_base_quality
+    settings.CACHE_DIR = args.cache_dir
+    settings.CACHE_SIZE = args.cache_size * 1024 * 1024
+    settings.RESULT_ENTRIES = args.result_entries
+    settings.RESULT_TTL = args.result_ttl * 60 * 60
+    settings.JOB_DIR = args.job_dir or tempfile.mkdtemp(prefix="hlso-jobs-")
+    settings.JOB_WORKERS = args.workers
+    # The results are passed from the workers through the store and must be on disk.
+    settings.RESULT_DIR = args.result_dir or os.path.join(settings.JOB_DIR, "results")
+
+    if not args.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        logger.info("Starting %d workers...", settings.JOB_WORKERS)
+        from .jobs import start_workers
+
+        start_workers(settings.JOB_WORKERS)
 
     logger.info("Running server...")
     from .app import app  # noqa
@@ -39,6 +58,69 @@ def add_parser(subparser):
         default=os.environ.get("HLSO_URL_PREFIX", ""),
         help="The prefix that this app will be served under (e.g., if behind a reverse proxy.)",
     )
+    parser.add_argument(
+        "--aligner",
+        default=os.environ.get("HLSO_ALIGNER", settings.ALIGNER),
+        choices=tuple(ALIGNERS),
+        help="Aligner backend to use, 'local' aligns in-process without calling blastn.",
+    )
+    parser.add_argument(
+        "--trim-quality",
+        type=float,
+        default=(
+            float(os.environ["HLSO_TRIM_QUALITY"]) if os.environ.get("HLSO_TRIM_QUALITY") else None
+        ),
+        help="Trim the low-quality ends of reads with qualities to this Phred quality.",
+    )
+    parser.add_argument(
+        "--min-base-quality",
+        type=float,
+        default=(
+            float(os.environ["HLSO_MIN_BASE_QUALITY"])
+            if os.environ.get("HLSO_MIN_BASE_QUALITY")
+            else None
+        ),
+        help="Mask informative positions where the read base has a lower Phred quality.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=os.environ.get("HLSO_CACHE_DIR"),
+        help="Directory for caching results for each sequence.",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=int(os.environ.get("HLSO_CACHE_SIZE", settings.CACHE_SIZE // 1024 // 1024)),
+        help="Maximal size of the result cache in MB.",
+    )
+    parser.add_argument(
+        "--result-entries",
+        type=int,
+        default=int(os.environ.get("HLSO_RESULT_ENTRIES", settings.RESULT_ENTRIES)),
+        help="Maximal number of results to keep in memory.",
+    )
+    parser.add_argument(
+        "--result-ttl",
+        type=float,
+        default=float(os.environ.get("HLSO_RESULT_TTL", settings.RESULT_TTL / 60 / 60)),
+        help="Time to keep results for in hours.",
+    )
+    parser.add_argument(
+        "--result-dir",
+        default=os.environ.get("HLSO_RESULT_DIR"),
+        help="Directory for storing results, such that they survive eviction from memory.",
+    )
+    parser.add_argument(
+        "--job-dir",
+        default=os.environ.get("HLSO_JOB_DIR"),
+        help="Directory for the job queue, defaults to a temporary directory.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("HLSO_WORKERS", settings.JOB_WORKERS)),
+        help="Number of worker processes for running jobs.",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -1,13 +1,21 @@
 """Setup of Haplotype-Lso Dash application."""
 
+import io
 import os
 
 import dash
 import flask
 
 from . import callbacks, settings
+from .jobs import get_queue
+from .store import get_store
+from .upload import receive_upload
 from .ui import build_layout
 from hlso import __version__
+from ..export import write_excel
+
+#: MIME type of XLSX files.
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
 #: Path to assets.
 ASSETS_FOLDER = os.path.join(os.path.dirname(__file__), "assets")
@@ -42,10 +50,41 @@ app.scripts.config.serve_locally = True
 
 # TODO: register callbacks
 callbacks.register_upload(app)
+callbacks.register_job_progress(app)
 callbacks.register_computation_complete(app)
 callbacks.register_row_clicks(app)
+callbacks.register_tables(app)
 
 # Add redirection for root.
 @app_flask.route("/")
 def redirect_root():
     return flask.redirect("%s/dash/" % settings.PUBLIC_URL_PREFIX)
+
+
+# Add download of XLSX files, generated on first download.
+@app_flask.route("/results/<result_id>/hlso_result.xlsx")
+def download_xlsx(result_id):
+    store = get_store()
+    data = store.get(result_id)  # also checks that the result has not expired
+    if not data:
+        flask.abort(404)
+    path = store.attachment_path(result_id, "xlsx")
+    if path and os.path.exists(path):
+        return flask.send_file(path, mimetype=MIME_XLSX)
+    if path:
+        # keep the extension, ``pd.ExcelWriter`` chooses the engine by it
+        path_tmp = "%s.%d.tmp.xlsx" % (path, os.getpid())
+        write_excel(data["summary"], data["blast"], data["haplotyping"], path_tmp)
+        os.replace(path_tmp, path)
+        return flask.send_file(path, mimetype=MIME_XLSX)
+    else:
+        buf = io.BytesIO()
+        write_excel(data["summary"], data["blast"], data["haplotyping"], buf)
+        buf.seek(0)
+        return flask.send_file(buf, mimetype=MIME_XLSX)
+
+
+# Add upload of files, streamed into the directory of a new job.
+@app_flask.route("/upload", methods=["POST"])
+def upload():
+    return flask.jsonify({"job_id": receive_upload(flask.request.environ, get_queue())})
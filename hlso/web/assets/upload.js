@@ -0,0 +1,40 @@
+/* Upload of sequence files to the server.
+ *
+ * The files selected with the "upload-input" element are posted to the upload endpoint as
+ * multipart form data.  Once the job has been created, the page is opened for the job.
+ */
+document.addEventListener("change", function (event) {
+  var input = event.target;
+  if (input.id !== "upload-input" || !input.files.length) {
+    return;
+  }
+
+  var label = document.getElementById("upload-label");
+  var prefix = window.location.pathname.replace(/\/dash\/.*$/, "");
+  var data = new FormData();
+  for (var i = 0; i < input.files.length; i++) {
+    data.append("files", input.files[i], input.files[i].name);
+  }
+
+  var request = new XMLHttpRequest();
+  request.open("POST", prefix + "/upload");
+  request.responseType = "json";
+  request.upload.onprogress = function (e) {
+    if (e.lengthComputable && label) {
+      label.textContent = "uploading " + Math.round((100 * e.loaded) / e.total) + "%";
+    }
+  };
+  request.onload = function () {
+    if (request.status === 200 && request.response && request.response.job_id) {
+      window.location.search = "?job=" + request.response.job_id;
+    } else {
+      window.alert("Uploading the files failed (HTTP status " + request.status + ").");
+      window.location.reload();
+    }
+  };
+  request.onerror = function () {
+    window.alert("Uploading the files failed.");
+    window.location.reload();
+  };
+  request.send(data);
+});
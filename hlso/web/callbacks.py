@@ -1,85 +1,71 @@
 """Callback code."""
 
-import base64
-import json
-import os
-import tempfile
+import urllib.parse
 
-from dash.dependencies import Input, Output, State
+import dash
+from dash.dependencies import Input, Output
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
 from logzero import logger
-import pandas as pd
 
-from ..conversion import convert_seqs
-from ..export import write_excel
-from ..workflow import blast_and_haplotype_many, results_to_data_frames
-from ..phylo import phylo_analysis
-from .settings import FILE_NAME_TO_SAMPLE_NAME, SAMPLE_REGEX
+from . import settings
+from .jobs import get_queue, STATE_DONE, STATE_QUEUED, STATE_RUNNING
+from .store import get_store
+from .tables import get_page, TABLES
 
 from . import ui
 
 
 def register_upload(app):
+    @app.callback(Output("hidden-job", "children"), [Input("url", "search")])
+    def job_from_url(search):
+        """The files are uploaded by ``assets/upload.js`` which then opens ``?job=<id>``."""
+        job_id = urllib.parse.parse_qs((search or "").lstrip("?")).get("job", [None])[0]
+        if job_id and job_id.isalnum():
+            return job_id
+        else:
+            return None
+
+
+def register_job_progress(app):
     @app.callback(
-        Output("hidden-data", "children"),
-        [Input("upload-data", "contents")],
-        [State("hidden-data", "children"), State("upload-data", "filename")],
+        [
+            Output("job-progress", "children"),
+            Output("job-interval", "disabled"),
+            Output("hidden-data", "children"),
+        ],
+        [Input("job-interval", "n_intervals"), Input("hidden-job", "children")],
     )
-    def data_uploaded(list_of_contents, hidden_data, list_of_names):
-        if list_of_contents:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                paths_reads = []
-                for content, name in zip(list_of_contents, list_of_names):
-                    paths_reads.append(os.path.join(tmpdir, name))
-                    with open(paths_reads[-1], "wb") as tmp_file:
-                        logger.info("Writing to %s", paths_reads[-1])
-                        _, content = content.split(",", 1)
-                        tmp_file.write(base64.b64decode(content))
-                seq_files = convert_seqs(paths_reads, tmpdir, FILE_NAME_TO_SAMPLE_NAME)
-                results = blast_and_haplotype_many(seq_files)
-                df_summary, df_blast, df_haplotyping = results_to_data_frames(results, SAMPLE_REGEX)
-
-                row_select = (df_summary.orig_sequence != "-") & (df_summary.region != "-")
-                columns = ["query", "region", "orig_sequence"]
-                phylo_result = phylo_analysis(df_summary[row_select][columns])
-            return json.dumps(
-                {
-                    "summary": df_summary.to_dict(),
-                    "blast": df_blast.to_dict(),
-                    "haplotyping": df_haplotyping.to_dict(),
-                    "phylo": phylo_result,
-                }
-            )
+    def job_progress(_n_intervals, job_id):
+        if not job_id:
+            return [], True, dash.no_update
+        status = get_queue().status(job_id)
+        if status and status.state == STATE_DONE:
+            return [], True, job_id  # result ID is job ID
+        elif status and status.state in (STATE_QUEUED, STATE_RUNNING):
+            return ui.render_job_progress(status), False, dash.no_update
+        else:
+            return ui.render_job_progress(status), True, dash.no_update
 
 
 def load_hidden_data(hidden_data):
-    raw_data = json.loads(hidden_data)
-
-    def decode(data, key):
-        if key in ("summary", "blast", "haplotyping"):
-            return pd.DataFrame.from_dict(data)
-        else:
-            return data
-
-    return {key: decode(raw_data[key], key) for key in raw_data}
+    """Return the result from the store for the result ID in ``hidden_data``, if any."""
+    if hidden_data:
+        return get_store().get(hidden_data)
+    else:
+        return None
 
 
 def register_computation_complete(app):
     @app.callback(Output("page-content", "children"), [Input("hidden-data", "children")])
     def computation_complete(hidden_data):
-        if not hidden_data:
+        data = load_hidden_data(hidden_data)
+        if not data:
+            if hidden_data:
+                logger.info("Result %s has expired", hidden_data)
             return ui.render_page_content_empty_children()
         else:
-            data = load_hidden_data(hidden_data)
-            mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            mime = "application/octet-stream"
-            with tempfile.NamedTemporaryFile() as tmpf:
-                # df_summary, df_blast, df_haplotyping, path):
-                write_excel(data["summary"], data["blast"], data["haplotyping"], tmpf.name)
-                tmpf.seek(0)
-                xlsx = base64.b64encode(tmpf.read()).decode("utf-8")
             return [
                 html.P(
                     children=[
@@ -88,10 +74,10 @@ def register_computation_complete(app):
                                 html.I(className="fas fa-file-excel ml-2 mr-2"),
                                 "Download XLSX",
                             ],
-                            # href="data:text/html,<script>alert('hi');</script>",
                             download="hlso_result.xlsx",
                             target="_blank",
-                            href="data:%s;base64,%s" % (mime, xlsx),
+                            href="%s/results/%s/hlso_result.xlsx"
+                            % (settings.PUBLIC_URL_PREFIX, hidden_data),
                         )
                     ]
                 ),
@@ -121,16 +107,15 @@ def register_row_clicks(app):
     )
     def update_haplotype_match(hidden_data, selected_row_ids):
         # logger.info("Selected %s from %s", selected_row_ids, hidden_data)
-        if selected_row_ids and hidden_data:
-            selected_row_ids = list(map(str, selected_row_ids))[0]
-            data = load_hidden_data(hidden_data)
-            df_blast = data["blast"]
-            alignment = df_blast.loc[selected_row_ids].alignment
+        data = load_hidden_data(hidden_data)
+        if selected_row_ids and data:
+            row = data["blast"].loc[int(selected_row_ids[0])]
+            alignment = row.alignment
             ncbi_tpl = "%s?DATABASE=nt&PROGRAM=blastn&MEGABLAST=on&QUERY=>%s%%0A%s"
             ncbi_url = ncbi_tpl % (
                 "https://blast.ncbi.nlm.nih.gov/Blast.cgi",
-                df_blast.loc[selected_row_ids]["query"],
-                df_blast.loc[selected_row_ids].orig_sequence,
+                row["query"],
+                row.orig_sequence,
             )
             return [
                 html.P(
@@ -152,3 +137,30 @@ def register_row_clicks(app):
                 dcc.Markdown("```text\n%s\n```" % alignment, className="mt-3"),
             ]
         return [html.P(["no match selected yet"])]
+
+
+def register_tables(app):
+    for table in TABLES:
+        _register_table(app, table)
+
+
+def _register_table(app, table):
+    table_id = "%s-table" % table
+
+    @app.callback(
+        [Output(table_id, "data"), Output(table_id, "page_count")],
+        [
+            Input("hidden-data", "children"),
+            Input(table_id, "page_current"),
+            Input(table_id, "page_size"),
+            Input(table_id, "sort_by"),
+            Input(table_id, "filter_query"),
+        ],
+    )
+    def update_table(hidden_data, page_current, page_size, sort_by, filter_query):
+        data = load_hidden_data(hidden_data)
+        if not data or not page_size:
+            return [], 0
+        return get_page(
+            table, data[table], page_current or 0, page_size, sort_by or [], filter_query or ""
+        )
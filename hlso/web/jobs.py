@@ -0,0 +1,282 @@
+"""Asynchronous jobs for the web app.
+
+Uploaded files are written to a job directory and the job is enqueued in an SQLite database in
+the jobs directory.  Local worker processes pick up the jobs in the order of submission, report
+the current stage, and put the results into the result store under the job ID.  The results
+are thus picked up from there by the web server processes.
+"""
+
+import contextlib
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import typing
+import uuid
+
+import attr
+from logzero import logger
+
+from ..cache import ResultCache
+from ..common import SequenceRegistry
+from ..conversion import convert_seqs
+from ..phylo import phylo_analysis
+from ..workflow import blast_and_haplotype_many, cache_salt, results_to_data_frames
+from . import settings
+from .settings import FILE_NAME_TO_SAMPLE_NAME, SAMPLE_REGEX
+from .store import get_store
+
+#: File name of the SQLite database within the jobs directory.
+QUEUE_FILE_NAME = "hlso-jobs.sqlite3"
+
+#: State of jobs waiting for a worker.
+STATE_QUEUED = "queued"
+#: State of jobs being processed by a worker.
+STATE_RUNNING = "running"
+#: State of successfully completed jobs, the result is in the store.
+STATE_DONE = "done"
+#: State of failed jobs.
+STATE_FAILED = "failed"
+
+#: The stages of the jobs with their descriptions, in order.
+STAGES = (
+    ("queued", "Waiting for a worker..."),
+    ("conversion", "Converting sequence files..."),
+    ("alignment", "Aligning and haplotyping sequences..."),
+    ("tables", "Building result tables..."),
+    ("phylogeny", "Performing phylogenetics analysis..."),
+    ("done", "Done."),
+)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class JobStatus:
+    """Status of a job."""
+
+    #: The job ID.
+    job_id: str
+    #: The job state, one of the ``STATE_*`` constants.
+    state: str
+    #: The current stage, one of the names from ``STAGES``.
+    stage: str
+    #: Error message for failed jobs.
+    message: str
+
+    @property
+    def description(self) -> str:
+        return dict(STAGES)[self.stage]
+
+    @property
+    def progress(self) -> int:
+        """Progress in percent based on the current stage."""
+        names = [name for name, _ in STAGES]
+        return 100 * names.index(self.stage) // (len(names) - 1)
+
+
+class JobQueue:
+    """Queue of jobs in an SQLite database in directory ``path``.
+
+    Each job has a working directory below ``path`` with the uploaded files in its ``input``
+    sub directory.  Jobs and their directories are removed after ``ttl`` seconds.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        #: Path to the jobs directory.
+        self.path = path
+        #: Time to live of jobs in seconds.
+        self.ttl = ttl
+        os.makedirs(self.path, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, state TEXT NOT NULL, stage TEXT NOT NULL, "
+                "message TEXT NOT NULL, claim TEXT, created REAL NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(os.path.join(self.path, QUEUE_FILE_NAME), timeout=60)
+        try:
+            with conn:  # commit or roll back
+                yield conn
+        finally:
+            conn.close()
+
+    def job_dir(self, job_id: str) -> str:
+        """Return path to the working directory of the job."""
+        return os.path.join(self.path, job_id)
+
+    def input_dir(self, job_id: str) -> str:
+        """Return path to the directory for the uploaded files of the job."""
+        return os.path.join(self.job_dir(job_id), "input")
+
+    def create(self) -> str:
+        """Create a job with empty input directory and return its ID, use ``enqueue()`` next."""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.input_dir(job_id))
+        return job_id
+
+    def enqueue(self, job_id: str):
+        """Enqueue the job ``job_id`` after its input files have been written."""
+        logger.info("Enqueuing job %s", job_id)
+        with self._connect() as conn:
+            self._remove_expired(conn)
+            conn.execute(
+                "INSERT INTO jobs (id, state, stage, message, created) VALUES (?, ?, ?, '', ?)",
+                (job_id, STATE_QUEUED, STAGES[0][0], time.time()),
+            )
+
+    def claim(self) -> typing.Optional[str]:
+        """Claim the oldest queued job and return its ID, ``None`` if there is none."""
+        claim = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, claim = ? WHERE id = ("
+                "SELECT id FROM jobs WHERE state = ? ORDER BY created LIMIT 1)",
+                (STATE_RUNNING, claim, STATE_QUEUED),
+            )
+            row = conn.execute("SELECT id FROM jobs WHERE claim = ?", (claim,)).fetchone()
+        return row[0] if row else None
+
+    def update(self, job_id: str, stage: str):
+        """Set the current ``stage`` of the job."""
+        logger.info("Job %s: %s", job_id, dict(STAGES)[stage])
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET stage = ? WHERE id = ?", (stage, job_id))
+
+    def finish(self, job_id: str, state: str, message: str = ""):
+        """Mark the job as finished with the given ``state`` and remove its input files."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, message = ? WHERE id = ?", (state, message, job_id)
+            )
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def fail_running(self, message: str):
+        """Mark all running jobs as failed, e.g., after their workers have been killed."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state = ?, message = ? WHERE state = ?",
+                (STATE_FAILED, message, STATE_RUNNING),
+            )
+
+    def status(self, job_id: str) -> typing.Optional[JobStatus]:
+        """Return status of the job or ``None`` if it is unknown or expired."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state, stage, message FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row:
+            return JobStatus(job_id, *row)
+        else:
+            return None
+
+    def _remove_expired(self, conn):
+        """Remove expired jobs and their working directories."""
+        expired = conn.execute(
+            "SELECT id FROM jobs WHERE created < ?", (time.time() - self.ttl,)
+        ).fetchall()
+        for (job_id,) in expired:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        conn.executemany("DELETE FROM jobs WHERE id = ?", expired)
+
+
+#: The job queue, created from the settings on first use.
+_QUEUE = None
+
+
+def get_queue() -> JobQueue:
+    """Return the job queue configured in ``settings``."""
+    global _QUEUE
+    if _QUEUE is None:
+        _QUEUE = JobQueue(settings.JOB_DIR, settings.RESULT_TTL)
+    return _QUEUE
+
+
+def run_job(queue: JobQueue, job_id: str):
+    """Run the pipeline on the input files of the job and put the result into the store."""
+    path_input = queue.input_dir(job_id)
+    paths_reads = sorted(  # files with the same name are in numbered subdirectories
+        os.path.join(root, name) for root, _, names in os.walk(path_input) for name in names
+    )
+    with tempfile.TemporaryDirectory(dir=queue.job_dir(job_id)) as tmpdir:
+        queue.update(job_id, "conversion")
+        registry = SequenceRegistry()
+        seq_files = convert_seqs(
+            paths_reads,
+            tmpdir,
+            FILE_NAME_TO_SAMPLE_NAME,
+            registry=registry,
+            trim_quality=settings.TRIM_QUALITY,
+        )
+        queue.update(job_id, "alignment")
+        if settings.CACHE_DIR:
+            cache = ResultCache(
+                settings.CACHE_DIR,
+                settings.CACHE_SIZE,
+                cache_salt(settings.ALIGNER, settings.MIN_BASE_QUALITY),
+            )
+        else:
+            cache = None
+        results = blast_and_haplotype_many(
+            seq_files,
+            aligner=settings.ALIGNER,
+            cache=cache,
+            registry=registry,
+            min_quality=settings.MIN_BASE_QUALITY,
+        )
+        queue.update(job_id, "tables")
+        df_summary, df_blast, df_haplotyping = results_to_data_frames(
+            results, SAMPLE_REGEX, registry=registry
+        )
+        queue.update(job_id, "phylogeny")
+        row_select = (df_summary.orig_sequence != "-") & (df_summary.region != "-")
+        columns = ["query", "region", "orig_sequence"]
+        phylo_result = phylo_analysis(df_summary[row_select][columns])
+    get_store().put(
+        {
+            "summary": df_summary,
+            "blast": df_blast,
+            "haplotyping": df_haplotyping,
+            "phylo": phylo_result,
+        },
+        result_id=job_id,
+    )
+    queue.update(job_id, "done")
+
+
+def work(config: typing.Dict[str, typing.Any]):
+    """Main loop of the worker processes, ``config`` holds the values for ``settings``."""
+    for key, value in config.items():
+        setattr(settings, key, value)
+    queue = get_queue()
+    logger.info("Worker %d waiting for jobs in %s", os.getpid(), queue.path)
+    while True:
+        job_id = queue.claim()
+        if not job_id:
+            time.sleep(settings.JOB_POLL_INTERVAL)
+            continue
+        try:
+            run_job(queue, job_id)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            queue.finish(job_id, STATE_FAILED, str(e))
+        else:
+            queue.finish(job_id, STATE_DONE)
+
+
+def start_workers(count: int) -> typing.List[multiprocessing.Process]:
+    """Start ``count`` worker processes for the queue configured in ``settings``.
+
+    The results are passed through the result store and thus ``settings.RESULT_DIR`` must be
+    set.  Jobs left running by previous workers are marked as failed.
+    """
+    get_queue().fail_running("The server has been restarted, please upload again.")
+    config = {key: getattr(settings, key) for key in dir(settings) if key.isupper()}
+    result = []
+    for _ in range(count):
+        result.append(multiprocessing.Process(target=work, args=(config,), daemon=True))
+        result[-1].start()
+    return result
@@ -35,6 +35,9 @@ MIN_IDENTITY_GREEN = 98
 #: Minimal identity (in percent) for yellow color.
 MIN_IDENTITY_YELLOW = 96
 
+#: Number of rows per page of the result tables.
+TABLE_PAGE_SIZE = 100
+
 
 # Configurable ===============================================================
 
@@ -45,3 +48,29 @@ PORT = 8050
 
 #: The public URL prefix to use.
 PUBLIC_URL_PREFIX = ""
+
+#: The aligner backend to use.
+ALIGNER = "blastn"
+#: Minimal Phred quality for trimming the ends of reads with qualities, ``None`` for no trimming.
+TRIM_QUALITY = None
+#: Minimal Phred quality of bases at informative positions, ``None`` for no masking.
+MIN_BASE_QUALITY = None
+
+#: Path to the result cache directory, ``None`` for no caching.
+CACHE_DIR = None
+#: Maximal size of the result cache in bytes.
+CACHE_SIZE = 1024 * 1024 * 1024
+
+#: Maximal number of results to keep in memory.
+RESULT_ENTRIES = 32
+#: Time to live of results in seconds.
+RESULT_TTL = 24 * 60 * 60
+#: Path to directory to store results in, ``None`` for keeping them in memory only.
+RESULT_DIR = None
+
+#: Path to directory for the job queue and working directories.
+JOB_DIR = None
+#: Number of worker processes for running jobs.
+JOB_WORKERS = 2
+#: Interval in seconds for polling the job queue (workers) and job progress (browser).
+JOB_POLL_INTERVAL = 1.0
@@ -0,0 +1,124 @@
+"""Server-side store for the results of the web app.
+
+The browser only holds the ID of a result while the data frames and the phylogenetics results
+stay on the server.  The results are kept in memory with least recently used eviction and a
+time to live.  When a directory is given, the results are also written there such that they
+survive eviction from memory and can be shared between processes.
+"""
+
+import collections
+import os
+import pickle
+import threading
+import time
+import typing
+import uuid
+
+from logzero import logger
+
+from . import settings
+
+
+class ResultStore:
+    """Store for results with least recently used eviction and time to live.
+
+    At most ``max_entries`` results are kept in memory, results older than ``ttl`` seconds
+    are dropped.  If ``path`` is given then results are also stored as files in this directory.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, path: typing.Optional[str] = None):
+        #: Maximal number of results to keep in memory.
+        self.max_entries = max_entries
+        #: Time to live of results in seconds.
+        self.ttl = ttl
+        #: Optional path to directory to store results in.
+        self.path = path
+        #: Mapping from result ID to ``(creation time, result)``, least recently used first.
+        self._entries = collections.OrderedDict()
+        #: Lock for ``_entries``.
+        self._lock = threading.Lock()
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+
+    def _result_path(self, result_id: str) -> str:
+        return os.path.join(self.path, "%s.pickle" % result_id)
+
+    def attachment_path(self, result_id: str, extension: str) -> typing.Optional[str]:
+        """Return path for a file derived from the result, e.g., for caching exports.
+
+        Such files are removed together with the result.  Returns ``None`` if the store is not
+        backed by a directory.
+        """
+        if self.path and result_id.isalnum():
+            return os.path.join(self.path, "%s.%s" % (result_id, extension))
+        else:
+            return None
+
+    def put(self, result: typing.Any, result_id: typing.Optional[str] = None) -> str:
+        """Store ``result`` and return its ID, a new ID is generated if not given."""
+        result_id = result_id or uuid.uuid4().hex
+        if self.path:
+            self._remove_expired_files()
+            path_tmp = "%s.%s.tmp" % (self._result_path(result_id), os.getpid())
+            with open(path_tmp, "wb") as outputf:
+                pickle.dump(result, outputf, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path_tmp, self._result_path(result_id))
+        with self._lock:
+            self._entries[result_id] = (time.time(), result)
+            self._entries.move_to_end(result_id)
+            self._evict()
+        return result_id
+
+    def get(self, result_id: str) -> typing.Optional[typing.Any]:
+        """Return result with the given ID or ``None`` if it is unknown or expired."""
+        with self._lock:
+            self._evict()
+            if result_id in self._entries:
+                self._entries.move_to_end(result_id)
+                return self._entries[result_id][1]
+        if not self.path or not result_id.isalnum():
+            return None
+        try:
+            created = os.path.getmtime(self._result_path(result_id))
+            if created + self.ttl < time.time():
+                return None
+            with open(self._result_path(result_id), "rb") as inputf:
+                result = pickle.load(inputf)
+        except OSError:
+            return None
+        with self._lock:
+            self._entries[result_id] = (created, result)
+            self._evict()
+        return result
+
+    def _evict(self):
+        """Evict expired and least recently used results from memory, must hold ``_lock``."""
+        now = time.time()
+        for result_id, (created, _) in list(self._entries.items()):
+            if created + self.ttl < now:
+                del self._entries[result_id]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _remove_expired_files(self):
+        """Remove files of expired results (and their attachments) from ``path``."""
+        now = time.time()
+        for entry in os.scandir(self.path):
+            try:
+                if entry.stat().st_mtime + self.ttl < now:
+                    logger.info("Removing expired result %s", entry.path)
+                    os.remove(entry.path)
+            except OSError:
+                pass  # removed by other process
+
+
+#: The result store, created from the settings on first use.
+_STORE = None
+
+
+def get_store() -> ResultStore:
+    """Return the result store configured in ``settings``."""
+    global _STORE
+    if _STORE is None:
+        _STORE = ResultStore(settings.RESULT_ENTRIES, settings.RESULT_TTL, settings.RESULT_DIR)
+    return _STORE
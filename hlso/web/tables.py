@@ -0,0 +1,159 @@
+"""Server-side paging, sorting, and filtering of the result tables.
+
+The tables use ``page_action``, ``sort_action``, and ``filter_action`` set to ``"custom"`` and
+only the rows of the current page are sent to the browser.  Sorting and filtering is done on
+the unformatted values of the data frames from the result store.
+"""
+
+import math
+import operator
+import re
+import typing
+
+import pandas as pd
+
+#: Names of the result tables, ``"<name>-table"`` is the ID of the ``DataTable``.
+TABLES = ("summary", "blast", "haplotyping")
+
+#: names of columns that are not to be shown
+HIDDEN_COLUMNS = ("alignment", "orig_sequence")
+
+#: Values that are displayed for missing values and sorted last.
+MISSING_VALUES = ("-", "", None)
+
+#: Regular expression for one part of the ``filter_query`` of ``DataTable``.
+FILTER_PART_RE = re.compile(
+    r"^\s*\{(?P<column>[^}]*)\}\s*"
+    r"(?P<case>[is]?)(?P<op>contains|datestartswith|>=|<=|!=|<|>|=|eq|ne|lt|le|gt|ge)"
+    r"\s*(?P<value>.*?)\s*$"
+)
+
+#: Comparison functions by filter operator.
+FILTER_OPERATORS = {
+    "=": operator.eq,
+    "eq": operator.eq,
+    "!=": operator.ne,
+    "ne": operator.ne,
+    "<": operator.lt,
+    "lt": operator.lt,
+    "<=": operator.le,
+    "le": operator.le,
+    ">": operator.gt,
+    "gt": operator.gt,
+    ">=": operator.ge,
+    "ge": operator.ge,
+}
+
+
+def _pos_neg(x):
+    return x.replace("_neg", "-").replace("_pos", "+")
+
+
+def display_columns(table: str, df: pd.DataFrame) -> typing.Dict[str, str]:
+    """Return mapping from displayed column ID to data frame column for ``table``."""
+    if table == "haplotyping":
+        return {_pos_neg(col): col for col in df.columns}
+    else:
+        return {col: col for col in df.columns if col not in HIDDEN_COLUMNS}
+
+
+def format_identity(x):
+    return str(round(float(x), 1)) if x != "-" else x
+
+
+def parse_filter_query(filter_query: str) -> typing.List[typing.Tuple[str, str, bool, typing.Any]]:
+    """Parse ``filter_query`` into a list of ``(column, operator, ignore_case, value)``.
+
+    Quoted values are kept as strings, unquoted values are converted to numbers if possible.
+    Parts that cannot be parsed are ignored.
+    """
+    result = []
+    for part in filter_query.split(" && ") if filter_query else ():
+        m = FILTER_PART_RE.match(part)
+        if not m:
+            continue
+        value = m.group("value")
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"`":
+            value = value[1:-1].replace("\\" + value[0], value[0])
+        else:
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        result.append((m.group("column"), m.group("op"), m.group("case") == "i", value))
+    return result
+
+
+def filter_frame(df: pd.DataFrame, filter_query: str, columns: typing.Dict[str, str]):
+    """Return the rows of ``df`` that match ``filter_query`` on the displayed ``columns``."""
+    mask = pd.Series(True, index=df.index)
+    for column, op, ignore_case, value in parse_filter_query(filter_query):
+        if column not in columns:
+            continue
+        series = df[columns[column]]
+        if op in ("contains", "datestartswith") or not isinstance(value, float):
+            strings = series.astype(str)
+            value = str(value)
+            if ignore_case:
+                strings, value = strings.str.lower(), value.lower()
+            if op == "contains":
+                mask &= strings.str.contains(value, regex=False)
+            elif op == "datestartswith":
+                mask &= strings.str.startswith(value)
+            else:
+                mask &= FILTER_OPERATORS[op](strings, value)
+        else:
+            mask &= FILTER_OPERATORS[op](pd.to_numeric(series, errors="coerce"), value)
+    return df[mask]
+
+
+def sort_key(value) -> typing.Tuple[int, float, str]:
+    """Key for sorting columns with mixed values, numbers sort before (and apart from) text."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, float(value), "")
+    else:
+        return (1, 0.0, str(value))
+
+
+def is_missing(value) -> bool:
+    """Return whether ``value`` is displayed as missing (e.g., ``"-"`` or NaN)."""
+    if isinstance(value, float):
+        return math.isnan(value)
+    else:
+        return value in MISSING_VALUES
+
+
+def sort_frame(df: pd.DataFrame, sort_by: typing.List[typing.Dict], columns: typing.Dict[str, str]):
+    """Return ``df`` sorted according to ``sort_by`` of ``DataTable`` on displayed ``columns``.
+
+    Missing values are sorted last, regardless of the direction.
+    """
+    order = list(range(df.shape[0]))
+    for entry in reversed(sort_by):  # stable sort from least to most significant column
+        if entry["column_id"] not in columns:
+            continue
+        values = df[columns[entry["column_id"]]].tolist()
+        present = [i for i in order if not is_missing(values[i])]
+        missing = [i for i in order if is_missing(values[i])]
+        present.sort(key=lambda i: sort_key(values[i]), reverse=entry["direction"] == "desc")
+        order = present + missing
+    return df.iloc[order]
+
+
+def get_page(
+    table: str,
+    df: pd.DataFrame,
+    page_current: int,
+    page_size: int,
+    sort_by: typing.List[typing.Dict],
+    filter_query: str,
+) -> typing.Tuple[typing.List[typing.Dict], int]:
+    """Return ``(records, page_count)`` for the current page of ``table`` from ``df``."""
+    columns = display_columns(table, df)
+    df = sort_frame(filter_frame(df, filter_query, columns), sort_by, columns)
+    page_count = max(1, math.ceil(df.shape[0] / page_size))
+    df = df.iloc[page_current * page_size : (page_current + 1) * page_size][list(columns.values())]
+    df.columns = list(columns.keys())
+    if table in ("summary", "blast"):
+        df = df.assign(identity=df["identity"].map(format_identity))
+    return df.to_dict("records"), page_count
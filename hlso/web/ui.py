@@ -26,9 +26,20 @@ from .settings import (
 from ..haplotyping import HAPLOTYPE_NAMES
 from ..phylo import plot_phylo
 from .. import __version__
+from .tables import display_columns
 
-#: names of columns that are not to be shown
-HIDDEN_COLUMNS = ("alignment", "orig_sequence")
+#: Settings for server-side paging, sorting, and filtering of the ``DataTable``s.
+TABLE_PAGING = {
+    "data": [],
+    "page_action": "custom",
+    "page_current": 0,
+    "page_size": settings.TABLE_PAGE_SIZE,
+    "sort_action": "custom",
+    "sort_mode": "multi",
+    "sort_by": [],
+    "filter_action": "custom",
+    "filter_query": "",
+}
 
 
 def render_navbar():
@@ -44,13 +55,19 @@ def render_navbar():
                 dbc.Nav(
                     dbc.NavItem(
                         dbc.NavLink(
-                            dcc.Upload(
-                                id="upload-data",
+                            html.Label(
                                 children=[
                                     html.I(className="fas fa-cloud-upload-alt mr-1"),
-                                    "upload files",
+                                    html.Span("upload files", id="upload-label"),
+                                    # Posted to the upload endpoint by ``assets/upload.js``.
+                                    html.Input(
+                                        id="upload-input",
+                                        type="file",
+                                        multiple=True,
+                                        style={"display": "none"},
+                                    ),
                                 ],
-                                multiple=True,
+                                className="mb-0",
                             ),
                             className="btn btn-outline-secondary",
                             active=True,
@@ -111,6 +128,7 @@ def render_page_content_empty_children():
                 ),
             ]
         ),
+        html.Div(children=[dash_table.DataTable(id="summary-table")], style={"display": "none"}),
         html.Div(children=[dash_table.DataTable(id="blast-table")], style={"display": "none"}),
         html.Div(
             children=[dash_table.DataTable(id="haplotyping-table")], style={"display": "none"}
@@ -128,10 +146,28 @@ def render_page_content_empty():
     )
 
 
+def render_job_progress(status):
+    """Render progress of the job with the given ``JobStatus``, ``None`` for unknown jobs."""
+    if not status:
+        return [
+            dbc.Alert("The job is unknown or has expired, please upload again.", color="warning")
+        ]
+    elif status.state == "failed":
+        return [dbc.Alert("The job has failed: %s" % status.message, color="danger")]
+    else:
+        return [
+            html.P(status.description, className="text-muted"),
+            dbc.Progress(value=status.progress, striped=True, animated=True),
+        ]
+
+
 def render_main_content():
     """Render page main content"""
     return html.Div(
-        children=[dbc.Row(dbc.Col(children=[render_page_content_empty()]))],
+        children=[
+            dbc.Row(dbc.Col(children=[html.Div(id="job-progress")])),
+            dbc.Row(dbc.Col(children=[render_page_content_empty()])),
+        ],
         className="container pt-3",
     )
 
@@ -208,17 +244,10 @@ def render_tab_summary(session_data):
         },
     ]
     style_header = {"text-align": "center", "fontWeight": "bold"}
-    df = session_data["summary"]
-    df.loc[:, "identity"] = df.loc[:, "identity"].map(
-        lambda x: str(round(float(x), 1)) if x != "-" else x
-    )
     table = dash_table.DataTable(
         id="summary-table",
-        columns=[{"name": i, "id": i} for i in df.columns if i not in HIDDEN_COLUMNS],
-        data=[
-            {k: v for k, v in record.items() if k not in HIDDEN_COLUMNS}
-            for record in df.to_dict("records")
-        ],
+        columns=[{"name": i, "id": i} for i in display_columns("summary", session_data["summary"])],
+        **TABLE_PAGING,
         style_cell=style_cell,
         style_cell_conditional=style_cell_conditional,
         style_data_conditional=style_data_conditional,
@@ -263,15 +292,10 @@ def render_tab_blast(session_data):
         },
     ]
     style_header = {"text-align": "center", "fontWeight": "bold"}
-    df = session_data["blast"]
-    df.loc[:, "identity"] = df.loc[:, "identity"].map(lambda x: str(round(float(x), 1)))
     table = dash_table.DataTable(
         id="blast-table",
-        columns=[{"name": i, "id": i} for i in df.columns if i not in HIDDEN_COLUMNS],
-        data=[
-            {k: v for k, v in record.items() if k not in HIDDEN_COLUMNS}
-            for record in df.to_dict("records")
-        ],
+        columns=[{"name": i, "id": i} for i in display_columns("blast", session_data["blast"])],
+        **TABLE_PAGING,
         style_cell=style_cell,
         style_cell_conditional=style_cell_conditional,
         style_data_conditional=style_data_conditional,
@@ -282,10 +306,6 @@ def render_tab_blast(session_data):
     return [dcc.Loading(table), dcc.Loading(blast_match_div)]
 
 
-def _pos_neg(x):
-    return x.replace("_neg", "-").replace("_pos", "+")
-
-
 def render_tab_haplotyping(session_data):
     logger.info("Rendering Haplotying Tab")
     df = session_data["haplotyping"]
@@ -294,11 +314,8 @@ def render_tab_haplotyping(session_data):
     style_header = {"text-align": "center", "fontWeight": "bold"}
     table = dash_table.DataTable(
         id="haplotyping-table",
-        columns=[{"name": _pos_neg(i), "id": _pos_neg(i)} for i in df.columns],
-        data=[
-            {_pos_neg(key): value for key, value in record.items()}
-            for record in df.to_dict("records")
-        ],
+        columns=[{"name": i, "id": i} for i in display_columns("haplotyping", df)],
+        **TABLE_PAGING,
         style_cell=style_cell,
         style_header=style_header,
     )
@@ -331,7 +348,16 @@ def render_tab_dendrograms(session_data):
 
 
 def render_hidden():
-    return html.Div(id="hidden-data", style={"display": "none"})
+    return html.Div(
+        children=[
+            html.Div(id="hidden-job"),
+            html.Div(id="hidden-data"),
+            dcc.Interval(
+                id="job-interval", interval=settings.JOB_POLL_INTERVAL * 1000, disabled=True
+            ),
+        ],
+        style={"display": "none"},
+    )
 
 
 def build_layout():
@@ -0,0 +1,95 @@
+"""Receiving of uploaded files for the web app.
+
+The files of multipart uploads are streamed directly into the input directory of a new job
+instead of being decoded in memory by a callback.  ZIP archives are unpacked into the input
+directory as well.
+"""
+
+import os
+import shutil
+import tempfile
+import typing
+import zipfile
+
+from logzero import logger
+from werkzeug import formparser
+
+from .jobs import JobQueue
+
+#: Name of the form field with the uploaded files.
+UPLOAD_FIELD = "files"
+
+
+def is_ignored(path: str) -> bool:
+    """Return whether to ignore the file at ``path`` in ZIP archives (e.g., hidden files)."""
+    return any(part.startswith(".") or part == "__MACOSX" for part in path.split("/"))
+
+
+def input_path(path_dir: str, name: str) -> typing.Optional[str]:
+    """Return a new path for the input file ``name`` in ``path_dir``, ``None`` if invalid.
+
+    Names that consist of dots only are invalid.  If there already is a file with the same
+    name, the file is put into a numbered subdirectory (as by ``conversion.convert_seqs()``)
+    such that its name is kept.
+    """
+    if not name.strip("."):
+        return None
+    path = os.path.join(path_dir, name)
+    number = 0
+    while os.path.exists(path) or os.path.isfile(os.path.dirname(path)):
+        number += 1
+        path = os.path.join(path_dir, str(number), name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def extract_zip(fileobj, path_dir: str):
+    """Extract the files from the ZIP archive in ``fileobj`` into ``path_dir``.
+
+    The directory structure within the archive is flattened, see ``input_path()`` for files
+    with the same name.
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or not name or is_ignored(info.filename):
+                continue
+            path = input_path(path_dir, name)
+            logger.info("Extracting %s to %s", info.filename, path)
+            with archive.open(info) as inputf:
+                with open(path, "wb") as outputf:
+                    shutil.copyfileobj(inputf, outputf)
+
+
+def receive_upload(environ, queue: JobQueue) -> str:
+    """Receive the files uploaded in the request ``environ`` and enqueue a job for them.
+
+    Returns the ID of the job.
+    """
+    job_id = queue.create()
+    path_input = queue.input_dir(job_id)
+    path_upload = os.path.join(queue.job_dir(job_id), "upload")
+    os.makedirs(path_upload)
+
+    def stream_factory(*args, **kwargs):
+        return tempfile.NamedTemporaryFile("wb+", dir=path_upload, delete=False)
+
+    _, _, files = formparser.parse_form_data(environ, stream_factory=stream_factory)
+    for upload in files.getlist(UPLOAD_FIELD):
+        name = os.path.basename(upload.filename or "")
+        if name.lower().endswith(".zip"):
+            upload.stream.seek(0)
+            extract_zip(upload.stream, path_input)
+            upload.stream.close()
+        elif name:
+            upload.stream.close()
+            path = input_path(path_input, name)
+            if path is None:
+                logger.warning("Ignoring file with invalid name %r for job %s", name, job_id)
+                continue
+            logger.info("Received %s for job %s", name, job_id)
+            os.replace(upload.stream.name, path)
+    shutil.rmtree(path_upload)
+
+    queue.enqueue(job_id)
+    return job_id
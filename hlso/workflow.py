@@ -7,6 +7,8 @@ that can be joined by the read file name.  Further, the sample information can b
 from this with a regexp.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+import math
 import os
 import re
 import typing
@@ -16,9 +18,17 @@ from logzero import logger
 import pandas as pd
 import tempfile
 
-from .blast import run_blast, BlastMatch
-from .common import load_fasta
-from .haplotyping import run_haplotyping, HaplotypingResultWithMatches
+from .aligner import get_aligner, DEFAULT_ALIGNER
+from .blast import BlastMatch
+from .cache import file_checksum, ResultCache
+from .common import write_fasta, NamedSequence, SequenceRegistry
+from .haplotyping import (
+    run_haplotyping,
+    score_haplotypes,
+    HaplotypingResult,
+    HaplotypingResultWithMatches,
+    HAPLOTYPE_TABLE_FILE,
+)
 
 #: Default minimal quality to consider a match as true.
 DEFAULT_MIN_IDENTITY = 0.5
@@ -27,127 +37,276 @@ DEFAULT_MIN_IDENTITY = 0.5
 # TODO: change a bit...?
 DEFAULT_PARSE_RE = r"^(?P<sample>[^_]+_[^_]+_[^_]+)_(?P<primer>.*?)\.fasta"
 
+#: Default number of query sequences to align in a single ``blastn`` call.
+DEFAULT_BATCH_SIZE = 1000
+
 #: The reference files to use.
 REF_FILE = os.path.join(os.path.dirname(__file__), "data", "ref_seqs.fasta")
 
 
-@attr.s(auto_attribs=True, frozen=True)
-class NamedSequence:
-    """A named sequence."""
+def only_blast(path_query: str, aligner: str = DEFAULT_ALIGNER) -> typing.Tuple[BlastMatch]:
+    """Run BLAST and haplotyping for the one file at ``path_query``."""
+    logger.info("Running BLAST on all references for %s...", path_query)
+    return get_aligner(aligner, REF_FILE).align(path_query)
 
-    #: the sequence name
-    name: str
-    #: the sequence
-    sequence: str
 
+def only_blast_seqs(
+    queries: typing.Sequence[NamedSequence],
+    batch_size: typing.Optional[int] = DEFAULT_BATCH_SIZE,
+    jobs: int = 1,
+    aligner: str = DEFAULT_ALIGNER,
+) -> typing.List[typing.Tuple[BlastMatch]]:
+    """Run BLAST for all ``queries`` using one ``blastn`` call per batch.
 
-def only_blast(path_query: str) -> typing.Tuple[BlastMatch]:
-    """Run BLAST and haplotyping for the one file at ``path_query``."""
-    logger.info("Running BLAST on all references for %s...", path_query)
-    return run_blast(REF_FILE, path_query)
+    The sequences are written into temporary FASTA files of at most ``batch_size`` sequences
+    each (``None`` or ``0`` for a single batch).  Returns the matches for each query.
+
+    Up to ``jobs`` batches are processed in parallel.  The sequences are split such that there
+    are at least ``jobs`` batches and if there are fewer batches, each ``blastn`` call uses
+    multiple threads such that at most ``jobs`` cores are used in total.
+
+    The name of the aligner backend to use is given by ``aligner``, see ``aligner.ALIGNERS``.
+    """
+    jobs = max(1, jobs)
+    batch_size = min(batch_size or len(queries), math.ceil(len(queries) / jobs)) or 1
+    offsets = range(0, len(queries), batch_size)
+    workers = max(1, min(jobs, len(offsets)))
+    num_threads = max(1, jobs // workers)
+    backend = get_aligner(aligner, REF_FILE)
+
+    result = [[] for _ in queries]
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        def run_batch(offset):
+            batch = queries[offset : offset + batch_size]
+            path_batch = os.path.join(tmpdir, "batch-%d.fasta" % offset)
+            with open(path_batch, "wt") as outputf:
+                write_fasta({"q%d" % i: query.sequence for i, query in enumerate(batch)}, outputf)
+            logger.info("Running BLAST on all references for %d sequences...", len(batch))
+            return backend.align(path_batch, num_threads=num_threads)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for offset, matches in zip(offsets, executor.map(run_batch, offsets)):
+                for match in matches:
+                    idx = offset + int(match.query[1:])
+                    result[idx].append(attr.evolve(match, query=queries[idx].name))
+    return [tuple(matches) for matches in result]
+
+
+def load_queries(
+    paths_query: typing.Iterable[str], registry: typing.Optional[SequenceRegistry] = None
+) -> typing.List[typing.Tuple[str, NamedSequence]]:
+    """Load the sequences from the FASTA files at ``paths_query`` (through ``registry``).
+
+    Return list of ``(path, NamedSequence)`` pairs.
+    """
+    registry = registry or SequenceRegistry()
+    return [(path, seq) for path in dict.fromkeys(paths_query) for seq in registry.get(path)]
+
+
+def only_blast_many(
+    paths_query: typing.Iterable[str],
+    batch_size: typing.Optional[int] = DEFAULT_BATCH_SIZE,
+    jobs: int = 1,
+    aligner: str = DEFAULT_ALIGNER,
+    registry: typing.Optional[SequenceRegistry] = None,
+) -> typing.Dict[str, typing.Tuple[BlastMatch]]:
+    """Run BLAST for all files at ``paths_query``, see ``only_blast_seqs()``.
+
+    The matches are assigned back to the file that they originate from.
+    """
+    paths_query = list(dict.fromkeys(paths_query))
+    queries = load_queries(paths_query, registry)
+    result = {path: [] for path in paths_query}
+    all_matches = only_blast_seqs([seq for _, seq in queries], batch_size, jobs, aligner)
+    for (path, _), matches in zip(queries, all_matches):
+        result[path] += [attr.evolve(match, path=path) for match in matches]
+    return {path: tuple(matches) for path, matches in result.items()}
 
 
 def blast_and_haplotype(path_query: str) -> typing.Dict[str, HaplotypingResultWithMatches]:
     return run_haplotyping(only_blast(path_query))
 
 
+def cache_salt(
+    aligner: str = DEFAULT_ALIGNER, min_quality: typing.Optional[float] = None
+) -> typing.Tuple[str, ...]:
+    """Return the values that the results for a sequence depend on besides the sequence."""
+    result = (file_checksum(REF_FILE), file_checksum(HAPLOTYPE_TABLE_FILE), aligner)
+    if min_quality is not None:
+        result += ("min_quality=%s" % min_quality,)
+    return result
+
+
 def blast_and_haplotype_many(
     paths_query: typing.Iterable[str],
+    batch_size: typing.Optional[int] = DEFAULT_BATCH_SIZE,
+    jobs: int = 1,
+    aligner: str = DEFAULT_ALIGNER,
+    cache: typing.Optional[ResultCache] = None,
+    registry: typing.Optional[SequenceRegistry] = None,
+    min_quality: typing.Optional[float] = None,
 ) -> typing.Dict[str, HaplotypingResultWithMatches]:
     """Run BLAST and haplotyping for all files at ``paths_query``.
 
+    The queries are aligned in batches of ``batch_size`` sequences using up to ``jobs``
+    parallel ``blastn`` processes (or the ``aligner`` backend), see ``only_blast_seqs()``.
+    If ``cache`` is given then the results are looked up there first and only the sequences
+    that are not found in the cache are aligned.  The cache has to be created with the salt
+    from ``cache_salt()``.  The sequences are obtained through ``registry``, if given.
+    Informative positions with base qualities below ``min_quality`` are masked, see
+    ``run_haplotyping()``.
+
     Return list of dicts with keys "best_match" and "haplo_result".
     """
     logger.info("Running BLAST and haplotyping for all queries...")
-    result = {}
-    for path_query in paths_query:
-        path_result = blast_and_haplotype(path_query)
-        if path_result:
-            result.update(path_result)
-        else:
-            result[path_query] = HaplotypingResultWithMatches.build_empty()
-    return result
+    paths_query = list(dict.fromkeys(paths_query))
+    queries = load_queries(paths_query, registry)
+
+    # Obtain ``(matches, haplotyping result)`` for each query, from cache if possible.
+    if cache:
+        keys = [
+            cache.key(seq.sequence, seq.qualities if min_quality is not None else None)
+            for _, seq in queries
+        ]
+        per_query = cache.get_many(keys)
+    else:
+        per_query = [None] * len(queries)
+    missing = [i for i, value in enumerate(per_query) if value is None]
+    all_matches = only_blast_seqs([queries[i][1] for i in missing], batch_size, jobs, aligner)
+    for i, matches in zip(missing, all_matches):
+        path = queries[i][0]
+        matches = tuple(attr.evolve(match, path=path) for match in matches)
+        query = queries[i][1]
+        haplo_results = run_haplotyping(
+            matches, qualities={query.name: query.qualities}, min_quality=min_quality
+        )
+        per_query[i] = (matches, haplo_results[path].result if haplo_results else None)
+    if cache:
+        cache.put_many((keys[i], per_query[i]) for i in missing)
+
+    # Merge results for the queries from each file.
+    results_matches = {path: [] for path in paths_query}
+    results_haplo = {}
+    for (path, seq), (matches, haplo_result) in zip(queries, per_query):
+        results_matches[path] += [attr.evolve(m, path=path, query=seq.name) for m in matches]
+        if haplo_result:
+            haplo_result = attr.evolve(haplo_result, filename=path, query=seq.name)
+            if path in results_haplo:
+                results_haplo[path] = results_haplo[path].merge(haplo_result)
+            else:
+                results_haplo[path] = haplo_result
+    return {
+        path: (
+            HaplotypingResultWithMatches(result=results_haplo[path], matches=matches)
+            if path in results_haplo
+            else HaplotypingResultWithMatches.build_empty()
+        )
+        for path, matches in results_matches.items()
+    }
 
 
 def strip_ext(s: str) -> str:
     return s.rsplit(".", 1)[0]
 
 
-def results_to_data_frames(
-    results: typing.Dict[str, HaplotypingResultWithMatches], regex: str, column: str = "query"
-) -> typing.Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    """Convert list of dicts with best_match/haplo_result to triple of Pandas DataFrame.
-
-    The three DataFrame will contain the following information:
+def iter_result_rows(
+    results: typing.Dict[str, HaplotypingResultWithMatches],
+    registry: typing.Optional[SequenceRegistry] = None,
+) -> typing.Iterator[typing.Tuple[str, typing.Dict, typing.Dict, typing.Dict]]:
+    """Yield ``(path, summary_row, blast_row, haplo_row)`` for the queries of ``results``.
 
-    1. A summary data frame showing best BLAST match target and identity plus haplotype.
-    2. A data frame showing BLAST result details.
-    3. A data frame showing haplotyping result details.
+    The rows are the records of the data frames of ``results_to_data_frames()``, before adding
+    the sample information.  The original sequences are obtained through ``registry``.
     """
-    r_summary = []
-    r_blast = []
-    r_haplo = []
+    registry = registry or SequenceRegistry()
+    haplo_results = [result.result for result in results.values() if result.result]
+    haplo_scores = score_haplotypes(haplo_results)
+    haplo_scores = iter(
+        [
+            {key: values[i] for key, values in haplo_scores.items()}
+            for i in range(len(haplo_results))
+        ]
+    )
+
     for path, result in results.items():
         haplo_result = result.result
         if not haplo_result:
-            for query, query_seq in load_fasta(path).items():
-                r_summary.append(
-                    {"query": query, "database": ".", "identity": 0, "orig_sequence": query_seq}
+            for query, query_seq in registry.get_dict(path).items():
+                yield (
+                    path,
+                    {"query": query, "database": ".", "identity": 0, "orig_sequence": query_seq},
+                    {"query": query},
+                    {"query": query},
                 )
-                r_blast.append({"query": query})
-                r_haplo.append({"query": query})
         else:
-            query_seq = load_fasta(path)[haplo_result.query]
+            query_seq = registry.get_dict(path)[haplo_result.query]
+            scores = next(haplo_scores)
             haplo_matches = result.matches
             best_match = list(sorted(haplo_matches, key=lambda m: m.identity, reverse=True))[0]
 
-            r_summary.append(
-                {
-                    "query": best_match.query,
-                    "database": best_match.database,
-                    "identity": 100.0 * best_match.identity,
-                    **{
-                        key: value
-                        for key, value in haplo_result.asdict().items()
-                        if key in ("best_haplotypes", "best_score")
-                    },
-                    "orig_sequence": query_seq,
-                }
-            )
-            r_blast.append(
-                {
-                    "query": best_match.query,
-                    "database": best_match.database,
-                    "identity": 100.0 * best_match.identity,
-                    "q_start": best_match.query_start,
-                    "q_end": best_match.query_end,
-                    "q_str": best_match.query_strand,
-                    "db_start": best_match.database_start,
-                    "db_end": best_match.database_end,
-                    "db_str": best_match.database_strand,
-                    "alignment": best_match.alignment.wrapped(
-                        best_match.query_start, best_match.database_start
-                    ),
-                    "orig_sequence": query_seq,
-                }
-            )
-            r_haplo.append(
-                {
-                    "query": best_match.query,
-                    **{
-                        key: value
-                        for key, value in haplo_result.asdict().items()
-                        if "_pos" in key
-                        or "_neg" in key
-                        or key in ("best_haplotypes", "best_score")
-                    },
-                }
-            )
-
-    dfs = pd.DataFrame(r_summary), pd.DataFrame(r_blast), pd.DataFrame(r_haplo)
-    dfs = list(map(lambda df: match_sample_in_data_frame(df, regex, column), dfs))
+            summary_row = {
+                "query": best_match.query,
+                "database": best_match.database,
+                "identity": 100.0 * best_match.identity,
+                "best_haplotypes": scores["best_haplotypes"],
+                "best_score": scores["best_score"],
+                "orig_sequence": query_seq,
+            }
+            blast_row = {
+                "query": best_match.query,
+                "database": best_match.database,
+                "identity": 100.0 * best_match.identity,
+                "q_start": best_match.query_start,
+                "q_end": best_match.query_end,
+                "q_str": best_match.query_strand,
+                "db_start": best_match.database_start,
+                "db_end": best_match.database_end,
+                "db_str": best_match.database_strand,
+                "alignment": best_match.alignment.wrapped(
+                    best_match.query_start, best_match.database_start
+                ),
+                "orig_sequence": query_seq,
+            }
+            if haplo_result.masked is not None:
+                scores = {**scores, "masked": len(haplo_result.masked)}
+            yield path, summary_row, blast_row, {"query": best_match.query, **scores}
+
+
+def results_to_data_frames(
+    results: typing.Dict[str, HaplotypingResultWithMatches],
+    regex: str,
+    column: str = "query",
+    registry: typing.Optional[SequenceRegistry] = None,
+    metadata: typing.Optional[typing.Dict[str, typing.Dict[str, typing.Optional[str]]]] = None,
+) -> typing.Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Convert list of dicts with best_match/haplo_result to triple of Pandas DataFrame.
+
+    The original sequences are obtained through ``registry``, if given.  If ``metadata`` is
+    given, it maps paths to the sample information (e.g., ``sample`` and ``region``) that is
+    used instead of parsing the query names with ``regex``.
+
+    The three DataFrame will contain the following information:
+
+    1. A summary data frame showing best BLAST match target and identity plus haplotype.
+    2. A data frame showing BLAST result details.
+    3. A data frame showing haplotyping result details.
+    """
+    rows = list(iter_result_rows(results, registry))
+    r_paths = [row[0] for row in rows]
+    dfs = tuple(pd.DataFrame([row[i] for row in rows]) for i in (1, 2, 3))
+    if metadata is None:
+        dfs = list(map(lambda df: match_sample_in_data_frame(df, regex, column), dfs))
+    else:
+        values = [metadata.get(path) or {} for path in r_paths]
+        dfs = list(map(lambda df: insert_metadata_in_data_frame(df, values, column), dfs))
     dfs[0] = augment_summary(
-        dfs[0], results, regex, column, "sample" if "sample" in dfs[0].columns else "query"
+        dfs[0],
+        results,
+        regex,
+        column,
+        "sample" if "sample" in dfs[0].columns else "query",
+        metadata,
     )
     for df in dfs:
         df.index = range(df.shape[0])
@@ -164,26 +323,33 @@ def augment_summary(
     regex: str,
     column: str,
     group_by: str,
+    metadata: typing.Optional[typing.Dict[str, typing.Dict[str, typing.Optional[str]]]] = None,
 ):
+    pattern = re.compile(regex)
     grouped = {}
-    for record in results.values():
+    for path, record in results.items():
         if not record.result:
             continue
-        m = re.match(regex, record.result.query)
-        if m and m.group(group_by):
-            if m.group(group_by) not in grouped:
-                grouped[m.group(group_by)] = record.result
-            else:
-                grouped[m.group(group_by)] = grouped[m.group(group_by)].merge(record.result)
-    rows = []
-    for key, value in grouped.items():
-        rows.append(
-            {
-                "query": "%s%s" % (key, SUMMARY_SUFFIX),
-                group_by: key,
-                **value.asdict(only_summary=True),
-            }
+        if metadata is not None and group_by != "query":
+            key = (metadata.get(path) or {}).get(group_by)
+        else:
+            m = pattern.match(record.result.query)
+            key = m.groupdict().get(group_by) if m else None
+        if key:
+            grouped.setdefault(key, []).append(record.result)
+    merged = [HaplotypingResult.merge_all(values) for values in grouped.values()]
+    scores = score_haplotypes(merged)
+    rows = [
+        {
+            "query": "%s%s" % (key, SUMMARY_SUFFIX),
+            group_by: key,
+            "best_haplotypes": best_haplotypes,
+            "best_score": best_score,
+        }
+        for key, best_haplotypes, best_score in zip(
+            grouped, scores["best_haplotypes"], scores["best_score"]
         )
+    ]
     for key in set(df[group_by].values) - grouped.keys():  # fill for those without matches
         rows.append({"query": "%s%s" % (key, SUMMARY_SUFFIX), group_by: key})
     orig_columns = list(df.columns.values)
@@ -191,8 +357,9 @@ def augment_summary(
         keys = ["sample", "query"]
     else:
         keys = ["query"]
-    df = df.append(pd.DataFrame(rows))[orig_columns].sort_values(keys).fillna("-")
-    df["query"] = df["query"].str.replace(re.escape(SUMMARY_SUFFIX), "")
+    df = pd.concat([df, pd.DataFrame(rows)], sort=False)[orig_columns].sort_values(keys)
+    df = df.fillna("-")
+    df["query"] = df["query"].str.replace(SUMMARY_SUFFIX, "", regex=False)
     return df
 
 
@@ -203,32 +370,34 @@ def match_sample_in_data_frame(df, regex, column):
     """
     if not df.shape[0]:
         return df  # short-circuit empty
-    # Get shortcut to column with query/filenames.
+    # Compile once, ``str.extract()`` searches so anchor at the start as ``re.match()`` does.
+    pattern = re.compile(regex)
+    names = list(pattern.groupindex.keys())
     col_query = df.loc[:, column]
+    if not names or not col_query.str.match(regex).any():
+        return df
+    extracted = col_query.str.extract(r"^(?:%s)" % regex, expand=True)
 
-    # Obtain list of new column names, sorted by occurence, must use dict for that.
-    names = {}
-    for query in col_query:
-        m = re.match(regex, query)
-        if m:
-            for key in m.groupdict():
-                names[key] = True
-    names = list(names.keys())
-
-    # Build new column values.
-    columns = {n: [] for n in names}
-    for query in col_query:
-        m = re.match(regex, query)
-        if m:
-            for name in names:
-                columns[name].append(m.groupdict().get(name))
-        else:
-            for name in names:
-                columns[name].append(None)
-
-    # Insert new columns into df.
+    # Insert new (named) columns into df, using ``None`` for unmatched values.
     idx = df.columns.get_loc(column)
-    for i, (key, column) in enumerate(columns.items()):
-        df.insert(idx + i + 1, key, column)
+    for i, name in enumerate(names):
+        values = extracted.iloc[:, pattern.groupindex[name] - 1].astype(object)
+        df.insert(idx + i + 1, name, values.where(values.notna(), None).tolist())
 
     return df
+
+
+def insert_metadata_in_data_frame(
+    df: pd.DataFrame, values: typing.Sequence[typing.Dict[str, typing.Optional[str]]], column: str
+) -> pd.DataFrame:
+    """Insert the sample information ``values`` (one dict per row) after ``column`` of ``df``.
+
+    This is the counterpart of ``match_sample_in_data_frame()`` for explicitly given metadata.
+    """
+    if not df.shape[0]:
+        return df  # short-circuit empty
+    names = list(dict.fromkeys(name for row in values for name in row))
+    idx = df.columns.get_loc(column)
+    for i, name in enumerate(names):
+        df.insert(idx + i + 1, name, [row.get(name) for row in values])
+    return df
@@ -0,0 +1,70 @@
+"""Tests for the command line entry points ``hlso cli``, ``hlso convert``, and ``hlso paste``."""
+
+import argparse
+import functools
+import glob
+import os
+
+import pytest
+
+from hlso import cli, convert, paste, workflow
+
+#: Example input files shipped with the web interface.
+EXAMPLE_FILES = sorted(
+    glob.glob(
+        os.path.join(os.path.dirname(workflow.__file__), "web", "assets", "hlso_example", "*")
+    )
+)
+
+
+def parse_args(argv):
+    """Return the parser and the parsed ``argv`` for the ``hlso`` sub commands."""
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers()
+    for module in (cli, convert, paste):
+        module.add_parser(subparsers)
+    return parser, parser.parse_args(argv)
+
+
+def test_convert(tmpdir):
+    parser, args = parse_args(["convert", str(tmpdir), EXAMPLE_FILES[0], EXAMPLE_FILES[1]])
+    args.func(parser, args)
+    assert sorted(os.listdir(str(tmpdir))) == sorted(map(os.path.basename, EXAMPLE_FILES[:2]))
+
+
+def test_paste(tmpdir, monkeypatch):
+    monkeypatch.setattr(
+        paste,
+        "blast_and_haplotype_many",
+        functools.partial(workflow.blast_and_haplotype_many, aligner="local"),
+    )
+    prefix = os.path.join(str(tmpdir), "out.d") + os.sep
+    parser, args = parse_args(["paste", "-o", prefix, EXAMPLE_FILES[0]])
+    args.func(parser, args)
+    assert glob.glob(os.path.join(prefix, "*", "*.fasta"))
+
+
+def test_cli_rejects_two_inputs_from_stdin(tmpdir):
+    parser, args = parse_args(
+        ["cli", "--manifest", "-", "--input-list", "-", "-o", str(tmpdir.join("out.xlsx"))]
+    )
+    with pytest.raises(SystemExit):
+        args.func(parser, args)
+
+
+def test_cli_rejects_no_input_files(tmpdir):
+    for extra in ([], ["--stream-output", str(tmpdir.join("out.tsv"))]):
+        parser, args = parse_args(["cli", "-o", str(tmpdir.join("out.xlsx"))] + extra)
+        with pytest.raises(SystemExit):
+            args.func(parser, args)
+
+
+def test_cli_rejects_stream_output_with_manifest_and_other_inputs(tmpdir):
+    manifest = tmpdir.join("manifest.tsv")
+    manifest.write("path\tsample\n%s\tS1\n" % EXAMPLE_FILES[0])
+    parser, args = parse_args(
+        ["cli", "--stream-output", str(tmpdir.join("out.tsv")), "--manifest", str(manifest)]
+        + EXAMPLE_FILES[1:2]
+    )
+    with pytest.raises(SystemExit):
+        args.func(parser, args)
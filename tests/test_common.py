@@ -0,0 +1,175 @@
+"""Tests for ``hlso.common``.
+
+The variant calling is compared against a frozen copy of the original, straightforward
+implementation on random alignments with substitutions, gaps, ``N``s, IUPAC codes, and
+lower case characters, and ``genotype_positions()`` is compared against ``call_variants()``.
+"""
+
+import random
+
+import pytest
+
+from hlso.common import call_variants, describe, genotype_positions
+
+#: Number of random alignments per seed.
+NUM_ALIGNMENTS = 5000
+
+
+def _legacy_only_bases(s):
+    return "".join([x for x in s if x.upper() in "CGATN"])
+
+
+def _legacy_normalize_var(ref_seq, curr_var, offset):
+    ref_seq = _legacy_only_bases(ref_seq)
+    ref = _legacy_only_bases(curr_var["ref_bases"])
+    alt = _legacy_only_bases(curr_var["alt_bases"])
+    pos = curr_var["pos"] - 1 - offset
+    delta = 0
+    while ref[-1] == alt[-1] and pos > 0:
+        delta += 1
+        pos -= 1
+        ref = ref_seq[pos] + ref
+        alt = ref_seq[pos] + alt
+        while ref[-1] == alt[-1] and len(ref) > 1 and len(alt) > 1:
+            ref = ref[:-1]
+            alt = alt[:-1]
+
+    result = dict(curr_var)
+    result["pos"] -= delta
+    result["ref"] = ref if len(ref) >= len(alt) else ref + "-" * (len(alt) - len(ref))
+    result["alt"] = alt if len(ref) <= len(alt) else alt + "-" * (len(ref) - len(alt))
+    result["ref_bases"] = ref
+    result["alt_bases"] = alt
+    result["description"] = describe(**result)
+    return result
+
+
+def _legacy_pad(curr_var, ref, alt, last):
+    if curr_var["ali_pos"] > 1:  # left-pad indels if possible
+        return {
+            "pos": curr_var["pos"] - 1,
+            "ali_pos": curr_var["ali_pos"] - 1,
+            "ref": ref[curr_var["ali_pos"] - 2] + curr_var["ref"],
+            "alt": alt[curr_var["ali_pos"] - 2] + curr_var["alt"],
+        }
+    else:  # use base right of it, VCF-style
+        return {
+            "pos": curr_var["ali_pos"] if last else curr_var["pos"],
+            "ali_pos": curr_var["ali_pos"],
+            "ref": curr_var["ref"] + ref[curr_var["ali_pos"] + len(curr_var["ref"])],
+            "alt": curr_var["alt"] + alt[curr_var["ali_pos"] + len(curr_var["alt"])],
+        }
+
+
+def legacy_call_variants(ref, alt, offset=0):
+    """The original ``call_variants()`` that walks the alignment column by column."""
+    if len(ref) != len(alt):
+        raise Exception("Invalid alignment row lengths: %d vs. %d", len(ref), len(alt))
+    result = {}
+    ref = ref.upper()
+    alt = alt.upper()
+
+    pos_ref = offset
+    i = 0
+    curr_var = {}
+    while i < len(ref):
+        if ref[i] == alt[i]:
+            if curr_var:
+                if curr_var["ref"].startswith("-") or curr_var["alt"].startswith("-"):
+                    curr_var = _legacy_pad(curr_var, ref, alt, False)
+                curr_var["ref_bases"] = _legacy_only_bases(curr_var["ref"])
+                curr_var["alt_bases"] = _legacy_only_bases(curr_var["alt"])
+                curr_var["description"] = describe(**curr_var)
+                curr_var = _legacy_normalize_var(ref, curr_var, offset)
+                result[curr_var["pos"]] = curr_var
+                curr_var = {}
+        else:
+            if curr_var:
+                curr_var["ref"] = curr_var["ref"] + ref[i]
+                curr_var["alt"] = curr_var["alt"] + alt[i]
+            else:
+                curr_var = {"pos": pos_ref + 1, "ali_pos": i + 1, "ref": ref[i], "alt": alt[i]}
+
+        if ref[i] != "-":
+            pos_ref += 1
+        i += 1
+
+    if curr_var:
+        if curr_var["ref"].startswith("-") or curr_var["alt"].startswith("-"):
+            curr_var = _legacy_pad(curr_var, ref, alt, True)
+        curr_var["ref_bases"] = _legacy_only_bases(curr_var["ref"])
+        curr_var["alt_bases"] = _legacy_only_bases(curr_var["alt"])
+        curr_var = _legacy_normalize_var(ref, curr_var, offset)
+        curr_var["description"] = describe(**curr_var)
+        result[curr_var["pos"]] = curr_var
+
+    return result
+
+
+def random_alignment(rng, length):
+    """Return random alignment rows ``(ref, alt)`` of the given ``length``."""
+    ref, alt = [], []
+    for _ in range(length):
+        x = rng.random()
+        base = rng.choice("ACGT")
+        if x < 0.7:  # match, rarely in lower case
+            ref.append(base)
+            alt.append(base if rng.random() > 0.02 else base.lower())
+        elif x < 0.8:  # substitution or N
+            ref.append(base)
+            alt.append(rng.choice("ACGTN"))
+        elif x < 0.88:  # insertion
+            ref.append("-")
+            alt.append(base)
+        elif x < 0.96:  # deletion
+            ref.append(base)
+            alt.append("-")
+        elif x < 0.98:  # IUPAC code in reference
+            ref.append(rng.choice("RYN"))
+            alt.append(base)
+        else:  # gap in both rows
+            ref.append("-")
+            alt.append("-")
+    return "".join(ref), "".join(alt)
+
+
+def outcome(func, *args):
+    """Return the result of ``func(*args)`` with its order, or the raised error."""
+    try:
+        return "ok", list(func(*args).items())
+    except Exception as e:
+        return "error", type(e), e.args
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_call_variants_random(seed):
+    rng = random.Random(seed)
+    for _ in range(NUM_ALIGNMENTS):
+        ref, alt = random_alignment(rng, rng.randint(1, 25))
+        offset = rng.choice((0, 0, 5))
+        expected = outcome(legacy_call_variants, ref, alt, offset)
+        assert outcome(call_variants, ref, alt, offset) == expected, (ref, alt, offset)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_genotype_positions_random(seed):
+    rng = random.Random(seed)
+    for _ in range(NUM_ALIGNMENTS):
+        ref, alt = random_alignment(rng, rng.randint(1, 25))
+        offset = rng.choice((0, 0, 5))
+        positions = list(range(offset - 2, offset + 30))
+        expected = outcome(call_variants, ref, alt, offset)
+        if expected[0] == "ok":
+            expected = "ok", set(positions) & {pos for pos, _ in expected[1]}
+        try:
+            result = "ok", genotype_positions(ref, alt, positions, offset)
+        except Exception as e:
+            result = "error", type(e), e.args
+        assert result == expected, (ref, alt, offset)
+
+
+def test_call_variants_rows_of_different_length():
+    with pytest.raises(Exception):
+        call_variants("ACGT", "ACG")
+    with pytest.raises(Exception):
+        genotype_positions("ACGT", "ACG", [1, 2])
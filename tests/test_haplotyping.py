@@ -0,0 +1,106 @@
+"""Tests for ``hlso.haplotyping``.
+
+The haplotyping with ``genotype_positions()`` is compared against the full variant calling on
+random alignments over the informative positions of the haplotype table.  The masking of
+informative positions with low base quality is checked on a match with a single difference.
+"""
+
+import random
+
+import pytest
+
+from hlso.blast import Alignment, BlastMatch
+from hlso.haplotyping import HAPLOTYPE_INDEX, HAPLOTYPE_TABLE, run_haplotyping
+
+#: Number of random matches per seed.
+NUM_MATCHES = 300
+
+
+def random_match(rng, reference, number):
+    """Return a ``BlastMatch`` against ``reference`` over some of its informative positions.
+
+    The alignment differs from a random reference sequence at about half of the informative
+    positions and has random substitutions, ``N``s, and gaps elsewhere.
+    """
+    positions = HAPLOTYPE_INDEX.positions[reference]
+    first = rng.randrange(len(positions))
+    last = rng.randrange(first, min(first + 5, len(positions)))
+    start = max(0, positions[first] - rng.randint(0, 20))
+    end = positions[last] + rng.randint(1, 20)
+    informative = set(positions[first : last + 1])
+    hseq, qseq = [], []
+    for pos in range(start, end):
+        base = rng.choice("ACGT")
+        x = rng.random()
+        if pos in informative:
+            hseq.append(base)
+            qseq.append(rng.choice("ACGT") if x < 0.5 else base)
+        elif x < 0.85:
+            hseq.append(base)
+            qseq.append(base)
+        elif x < 0.9:
+            hseq.append(base)
+            qseq.append(rng.choice("ACGTN"))
+        elif x < 0.95:
+            hseq.append(base)
+            qseq.append("-")
+        else:
+            hseq.append("-" + base)
+            qseq.append(rng.choice("ACGT") + base)
+    return make_match(reference, start, "".join(hseq), "".join(qseq), "query-%d" % number)
+
+
+def make_match(reference, start, hseq, qseq, query="query-0"):
+    """Return a ``BlastMatch`` of ``query`` with the alignment rows ``hseq`` and ``qseq``."""
+    query_len = len(qseq) - qseq.count("-")
+    return BlastMatch(
+        path="sample.fasta",
+        query=query,
+        database=reference,
+        identity=1.0,
+        bits=100.0,
+        query_strand="+",
+        query_start=0,
+        query_end=query_len,
+        database_strand="+",
+        database_start=start,
+        database_end=start + len(hseq) - hseq.count("-"),
+        alignment=Alignment(hseq, None, qseq),
+        query_len=query_len,
+    )
+
+
+def haplotyping_outcome(match, full_calling):
+    """Return the haplotyping result for ``match`` or the raised error."""
+    try:
+        return "ok", run_haplotyping([match], full_calling=full_calling)["sample.fasta"].result
+    except Exception as e:
+        return "error", type(e), e.args
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_run_haplotyping_genotyped_like_full_calling(seed):
+    rng = random.Random(seed)
+    references = sorted(HAPLOTYPE_INDEX.positions)
+    for number in range(NUM_MATCHES):
+        match = random_match(rng, rng.choice(references), number)
+        expected = haplotyping_outcome(match, True)
+        assert haplotyping_outcome(match, False) == expected, match
+
+
+def test_run_haplotyping_masks_low_quality_bases():
+    reference = sorted(HAPLOTYPE_INDEX.positions)[0]
+    key = HAPLOTYPE_INDEX.keys[reference][0]
+    start = key[1] - 5  # the informative position is the sixth base
+    hseq = "ACGTAACGTA"
+    alt = "C" if hseq[5] != "C" else "G"
+    match = make_match(reference, start, hseq, hseq[:5] + alt + hseq[6:])
+    qualities = {"query-0": bytes([40] * 5 + [10] + [40] * 4)}
+
+    result = run_haplotyping([match], qualities=qualities, min_quality=20)["sample.fasta"].result
+    assert result.masked == (key,)
+    assert key not in result.informative_values
+
+    result = run_haplotyping([match], qualities=qualities, min_quality=10)["sample.fasta"].result
+    assert result.masked == ()
+    assert result.informative_values[key] == HAPLOTYPE_TABLE[key].haplo_values["alt"]
@@ -0,0 +1,45 @@
+"""Tests for ``hlso.inputs``."""
+
+import os
+
+import pytest
+
+from hlso.inputs import InputFile, iter_input_files, iter_manifest
+
+
+def test_iter_manifest(tmpdir):
+    manifest = tmpdir.join("manifest.tsv")
+    manifest.write("# comment\npath\tsample\tregion\na.ab1\tS1\t16S\n\n/data/b.ab1\tS2\t\n")
+    assert list(iter_manifest(str(manifest))) == [
+        InputFile(os.path.join(str(tmpdir), "a.ab1"), {"sample": "S1", "region": "16S"}),
+        InputFile("/data/b.ab1", {"sample": "S2", "region": None}),
+    ]
+
+
+@pytest.mark.parametrize(
+    "header", ["sample\tregion", "path\tquery\tregion", "path\tid", "path\tsample\tsample"]
+)
+def test_iter_manifest_invalid_header(tmpdir, header):
+    manifest = tmpdir.join("manifest.tsv")
+    manifest.write(header + "\n" + "\t".join(["x"] * len(header.split("\t"))) + "\n")
+    with pytest.raises(ValueError):
+        list(iter_manifest(str(manifest)))
+
+
+def test_iter_input_files(tmpdir):
+    tmpdir.join("sub").mkdir()
+    for name in ("sub/b.ab1", "a.fasta", "c.txt"):
+        tmpdir.join(name).write("")
+    input_list = tmpdir.join("list.txt")
+    input_list.write("# comment\nx.scf\n\ny.fastq\n")
+    paths = [
+        input_file.path
+        for input_file in iter_input_files(["z.fa"], [str(tmpdir)], input_list=str(input_list))
+    ]
+    assert paths == [
+        "z.fa",
+        str(tmpdir.join("a.fasta")),
+        str(tmpdir.join("sub", "b.ab1")),
+        "x.scf",
+        "y.fastq",
+    ]
@@ -0,0 +1,55 @@
+"""Tests for ``hlso.streaming`` and the ``RecordWriter`` for its records."""
+
+import glob
+import json
+import os
+
+import pytest
+
+from hlso import workflow
+from hlso.export import RecordWriter
+from hlso.inputs import InputFile
+from hlso.streaming import RECORD_COLUMNS, iter_records
+
+#: Example input files shipped with the web interface.
+EXAMPLE_FILES = sorted(
+    glob.glob(
+        os.path.join(os.path.dirname(workflow.__file__), "web", "assets", "hlso_example", "*")
+    )
+)
+
+
+def test_iter_records():
+    input_files = [InputFile(path) for path in EXAMPLE_FILES[:2]] + [
+        InputFile(EXAMPLE_FILES[2], {"sample": "S1", "query": "other", "database": "other"})
+    ]
+    records = list(
+        iter_records(input_files, r"^(?P<query>[^\.]+)\.(?P<region>.*)", True, aligner="local")
+    )
+    assert [record["path"] for record in records] == EXAMPLE_FILES[:3]
+    for record in records:
+        assert record["query"] == os.path.splitext(os.path.basename(record["path"]))[0]
+        assert record["database"] != "other"
+    assert list(records[0]) == ["path", "query", "region"] + list(RECORD_COLUMNS)
+    assert list(records[2]) == ["path", "query", "sample"] + list(RECORD_COLUMNS)
+
+
+def test_record_writer_tsv(tmpdir):
+    path = str(tmpdir.join("records.tsv"))
+    with RecordWriter(path) as writer:
+        writer.write({"query": "a\tb", "value": "1\n2\r\\"})
+        writer.write({"value": 3, "query": "c"})
+        with pytest.raises(ValueError):
+            writer.write({"query": "d"})
+    with open(path, "rt", newline="") as inputf:
+        assert inputf.read() == "query\tvalue\na\\tb\t1\\n2\\r\\\\\nc\t3\n"
+
+
+def test_record_writer_jsonl(tmpdir):
+    path = str(tmpdir.join("records.jsonl"))
+    records = [{"query": "a\tb", "value": 1}, {"query": "c"}]
+    with RecordWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+    with open(path, "rt") as inputf:
+        assert [json.loads(line) for line in inputf] == records
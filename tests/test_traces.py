@@ -0,0 +1,183 @@
+"""Tests for ``hlso.traces``.
+
+The AB1 and SCF files are written by the small writers below, which only fill in the parts of
+the formats that the readers use.
+"""
+
+import struct
+
+import pytest
+
+from hlso.traces import (
+    ABIF_UNKNOWN_ID,
+    Trace,
+    mott_trim,
+    read_ab1,
+    read_abif_tags,
+    read_fastq,
+    read_scf,
+    read_traces,
+    trim_trace,
+)
+
+#: Base calls and qualities of the test reads.
+SEQUENCE = "ACGTNACGTACGTTTGACAGT"
+QUALITIES = bytes([10, 20, 30, 40] * 5 + [15])
+
+
+def abif_blob(entries):
+    """Return an ABIF file with the directory ``entries`` of ``(name, number, type, data)``."""
+    data_offset = 128
+    directory, blobs = [], b""
+    for name, number, elem_type, data in entries:
+        if len(data) <= 4:  # stored in the offset field
+            offset = data.ljust(4, b"\0")
+        else:
+            offset = struct.pack(">i", data_offset + len(blobs))
+            blobs += data
+        directory.append(
+            struct.pack(">4sihhii", name, number, elem_type, 1, len(data), len(data))
+            + offset
+            + struct.pack(">i", 0)
+        )
+    header = b"ABIF" + struct.pack(
+        ">h4sihhiiii",
+        101,  # version
+        b"tdir",
+        1,
+        1023,
+        28,
+        len(directory),
+        28 * len(directory),
+        data_offset + len(blobs),  # the directory follows the data
+        0,
+    )
+    return header.ljust(data_offset, b"\0") + blobs + b"".join(directory)
+
+
+def ab1_blob(sequence=SEQUENCE, qualities=QUALITIES, sample=b"sample1"):
+    """Return an AB1 file with the base calls and qualities of the basecaller."""
+    entries = [
+        (b"PBAS", 2, 2, sequence.encode("ascii")),
+        (b"PCON", 2, 2, qualities),
+        (b"TUBE", 1, 18, b"\x03A01"),
+    ]
+    if sample is not None:
+        entries.append((b"SMPL", 1, 18, bytes([len(sample)]) + sample))
+    return abif_blob(entries)
+
+
+def scf_blob(sequence=SEQUENCE, qualities=QUALITIES, version=b"3.00", comments=b"NAME=read1\n"):
+    """Return an SCF file with the probabilities ``qualities`` for the called bases.
+
+    The other channels have probability ``1``, except for ``N`` calls.
+    """
+    num_bases = len(sequence)
+    probs = [
+        [q if base in (channel, "N") else 1 for base, q in zip(sequence, qualities)]
+        for channel in "ACGT"
+    ]
+    if version >= b"3":
+        bases = b"\0" * 4 * num_bases + b"".join(map(bytes, probs))
+        bases += sequence.encode("ascii") + b"\0" * 3 * num_bases
+    else:
+        bases = b"".join(
+            b"\0" * 4 + bytes(p[i] for p in probs) + sequence[i].encode("ascii") + b"\0" * 3
+            for i in range(num_bases)
+        )
+    bases_offset = 128
+    header = b".scf" + struct.pack(
+        ">8I4s",
+        0,
+        bases_offset,
+        num_bases,
+        0,
+        0,
+        bases_offset,
+        len(comments),
+        bases_offset + len(bases),
+        version,
+    )
+    return header.ljust(bases_offset, b"\0") + bases + comments
+
+
+def write(tmpdir, name, data):
+    path = tmpdir.join(name)
+    path.write_binary(data)
+    return str(path)
+
+
+def test_read_abif_tags_inline_and_offset_data():
+    tags = read_abif_tags(ab1_blob(sequence="ACG", qualities=bytes([1, 2, 3])))
+    assert tags["PBAS2"] == (2, b"ACG")
+    assert tags["PCON2"] == (2, bytes([1, 2, 3]))
+    assert tags["SMPL1"] == (18, b"\x07sample1")
+
+
+def test_read_abif_tags_not_abif():
+    with pytest.raises(ValueError):
+        read_abif_tags(b"XXXX" + bytes(60))
+
+
+def test_read_ab1(tmpdir):
+    path = write(tmpdir, "read.ab1", ab1_blob())
+    assert list(read_ab1(path)) == [Trace(name="sample1", sequence=SEQUENCE, qualities=QUALITIES)]
+    assert list(read_traces(path)) == list(read_ab1(path))
+
+
+def test_read_ab1_without_sample_and_mismatching_qualities(tmpdir):
+    path = write(tmpdir, "read.ab1", ab1_blob(qualities=QUALITIES[:-1], sample=None))
+    assert list(read_ab1(path)) == [Trace(name=ABIF_UNKNOWN_ID, sequence=SEQUENCE)]
+
+
+def test_read_ab1_empty(tmpdir):
+    with pytest.raises(ValueError):
+        list(read_ab1(write(tmpdir, "read.ab1", b"")))
+
+
+@pytest.mark.parametrize("version", [b"2.00", b"3.00"])
+def test_read_scf(tmpdir, version):
+    path = write(tmpdir, "file.scf", scf_blob(version=version))
+    expected = [Trace(name="read1", sequence=SEQUENCE, qualities=QUALITIES)]
+    assert list(read_scf(path)) == expected
+    assert list(read_traces(path)) == expected
+
+
+def test_read_scf_named_by_file(tmpdir):
+    path = write(tmpdir, "file.scf", scf_blob(comments=b""))
+    assert [trace.name for trace in read_scf(path)] == ["file"]
+
+
+def test_read_scf_not_scf(tmpdir):
+    with pytest.raises(ValueError):
+        list(read_scf(write(tmpdir, "file.scf", ab1_blob())))
+
+
+def test_read_fastq(tmpdir):
+    path = tmpdir.join("reads.fastq")
+    path.write("@read1 description\nACGT\n+\n!+5I\n")
+    expected = [Trace(name="read1", sequence="ACGT", qualities=bytes([0, 10, 20, 40]))]
+    assert list(read_fastq(str(path))) == expected
+    assert list(read_traces(str(path))) == expected
+
+
+@pytest.mark.parametrize(
+    "qualities, expected",
+    [
+        (b"", (0, 0)),
+        (bytes([5] * 10), (0, 0)),
+        (bytes([40] * 10), (0, 10)),
+        (bytes([5, 5, 40, 40, 40, 5, 5]), (2, 5)),
+        (bytes([40, 40, 5, 40, 40, 40, 2, 2, 2]), (3, 6)),
+    ],
+)
+def test_mott_trim(qualities, expected):
+    assert mott_trim(qualities, 20) == expected
+
+
+def test_trim_trace():
+    trace = Trace(name="read1", sequence="ACGTACG", qualities=bytes([5, 5, 40, 40, 40, 5, 5]))
+    assert trim_trace(trace, 20) == Trace(name="read1", sequence="GTA", qualities=bytes([40] * 3))
+    assert trim_trace(trace, None) is trace
+    without_qualities = Trace(name="read1", sequence="ACGTACG")
+    assert trim_trace(without_qualities, 20) is without_qualities
@@ -0,0 +1,110 @@
+"""Tests for the server-side filtering, sorting, and paging in ``hlso.web.tables``."""
+
+import pandas as pd
+import pytest
+
+from hlso.web.tables import filter_frame, get_page, parse_filter_query, sort_frame
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "query": ["S1.16S", "s2.16S", "S3.50S", "S4.50S", "S5.16S"],
+            "identity": [99.5, "-", 98.25, 100.0, 97.0],
+            "best_score": [2, "-", float("nan"), 5, None],
+            "region": ["16S", "16S", "50S", "50S", "16S"],
+        }
+    )
+
+
+def columns(df):
+    return {col: col for col in df.columns}
+
+
+def queries(df):
+    return df["query"].tolist()
+
+
+def test_parse_filter_query():
+    query = (
+        '{query} contains S1 && {identity} >= 99.5 && {region} = "16S" && '
+        "{query} icontains 'it\\'s' && {best_score} ne `2` && not a filter"
+    )
+    assert parse_filter_query(query) == [
+        ("query", "contains", False, "S1"),
+        ("identity", ">=", False, 99.5),
+        ("region", "=", False, "16S"),
+        ("query", "contains", True, "it's"),
+        ("best_score", "ne", False, "2"),
+    ]
+    assert parse_filter_query("") == []
+    assert parse_filter_query(None) == []
+
+
+@pytest.mark.parametrize(
+    "filter_query, expected",
+    [
+        ("{identity} >= 99.5", ["S1.16S", "S4.50S"]),
+        ("{identity} lt 98.25", ["S5.16S"]),
+        ("{identity} != 100", ["S1.16S", "s2.16S", "S3.50S", "S5.16S"]),
+        ("{best_score} = 2", ["S1.16S"]),
+        ('{best_score} = "-"', ["s2.16S"]),
+        ("{region} eq 50S", ["S3.50S", "S4.50S"]),
+        ("{query} contains s", ["s2.16S"]),
+        ("{query} icontains s", ["S1.16S", "s2.16S", "S3.50S", "S4.50S", "S5.16S"]),
+        ("{query} i= S2.16s", ["s2.16S"]),
+        ("{query} datestartswith S3", ["S3.50S"]),
+        ("{region} = 16S && {identity} > 98", ["S1.16S"]),
+        ("{unknown} = 1", ["S1.16S", "s2.16S", "S3.50S", "S4.50S", "S5.16S"]),
+    ],
+)
+def test_filter_frame(df, filter_query, expected):
+    assert queries(filter_frame(df, filter_query, columns(df))) == expected
+
+
+@pytest.mark.parametrize(
+    "sort_by, expected",
+    [
+        ([{"column_id": "identity", "direction": "asc"}], ["S5", "S3", "S1", "S4", "s2"]),
+        ([{"column_id": "identity", "direction": "desc"}], ["S4", "S1", "S3", "S5", "s2"]),
+        ([{"column_id": "best_score", "direction": "asc"}], ["S1", "S4", "s2", "S3", "S5"]),
+        ([{"column_id": "best_score", "direction": "desc"}], ["S4", "S1", "s2", "S3", "S5"]),
+        (
+            [
+                {"column_id": "region", "direction": "desc"},
+                {"column_id": "identity", "direction": "asc"},
+            ],
+            ["S3", "S4", "S5", "S1", "s2"],
+        ),
+        ([{"column_id": "unknown", "direction": "asc"}], ["S1", "s2", "S3", "S4", "S5"]),
+        ([], ["S1", "s2", "S3", "S4", "S5"]),
+    ],
+)
+def test_sort_frame(df, sort_by, expected):
+    result = [query.split(".")[0] for query in queries(sort_frame(df, sort_by, columns(df)))]
+    assert result == expected
+
+
+def test_get_page(df):
+    df["alignment"] = "..."  # hidden column
+    sort_by = [{"column_id": "identity", "direction": "desc"}]
+    records, page_count = get_page("summary", df, 0, 2, sort_by, "{region} = 16S")
+    assert page_count == 2
+    assert records == [
+        {"query": "S1.16S", "identity": "99.5", "best_score": 2, "region": "16S"},
+        {"query": "S5.16S", "identity": "97.0", "best_score": None, "region": "16S"},
+    ]
+    records, page_count = get_page("summary", df, 1, 2, sort_by, "{region} = 16S")
+    assert records == [{"query": "s2.16S", "identity": "-", "best_score": "-", "region": "16S"}]
+
+
+def test_get_page_haplotyping_columns():
+    df = pd.DataFrame({"query": ["a", "b", "c"], "A_pos": [1, 0, 1], "A_neg": [0, 1, 0]})
+    records, page_count = get_page(
+        "haplotyping", df, 0, 10, [{"column_id": "A-", "direction": "desc"}], "{A+} = 1"
+    )
+    assert page_count == 1
+    assert records == [{"query": "a", "A+": 1, "A-": 0}, {"query": "c", "A+": 1, "A-": 0}]
+    records, page_count = get_page("haplotyping", df.iloc[:0], 0, 10, [], "")
+    assert (records, page_count) == ([], 1)
@@ -0,0 +1,82 @@
+"""Tests for receiving uploaded files in ``hlso.web.upload``."""
+
+import io
+import os
+import zipfile
+
+from werkzeug.test import EnvironBuilder
+
+from hlso.web.jobs import JobQueue
+from hlso.web.upload import extract_zip, input_path, receive_upload
+
+
+def list_files(path_dir):
+    """Return mapping from relative path to contents of the files below ``path_dir``."""
+    result = {}
+    for root, _, names in os.walk(path_dir):
+        for name in names:
+            with open(os.path.join(root, name), "rb") as inputf:
+                result[os.path.relpath(os.path.join(root, name), path_dir)] = inputf.read()
+    return result
+
+
+def zip_blob(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        for name, data in files:
+            archive.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+def test_input_path(tmpdir):
+    path_dir = str(tmpdir)
+    assert input_path(path_dir, ".") is None
+    assert input_path(path_dir, "..") is None
+    assert input_path(path_dir, "a.ab1") == os.path.join(path_dir, "a.ab1")
+    tmpdir.join("a.ab1").write("")
+    tmpdir.join("1").write("")  # file with the name of the first subdirectory
+    assert input_path(path_dir, "a.ab1") == os.path.join(path_dir, "2", "a.ab1")
+
+
+def test_extract_zip(tmpdir):
+    archive = zip_blob(
+        [
+            ("run1/a.ab1", b"1"),
+            ("run2/a.ab1", b"2"),
+            ("run2/b.ab1", b"3"),
+            ("a.ab1", b"4"),
+            ("run2/.hidden", b"5"),
+            ("__MACOSX/run1/._a.ab1", b"6"),
+        ]
+    )
+    extract_zip(archive, str(tmpdir))
+    assert list_files(str(tmpdir)) == {
+        "a.ab1": b"1",
+        os.path.join("1", "a.ab1"): b"2",
+        "b.ab1": b"3",
+        os.path.join("2", "a.ab1"): b"4",
+    }
+
+
+def test_receive_upload(tmpdir):
+    queue = JobQueue(str(tmpdir), 60)
+    builder = EnvironBuilder(
+        method="POST",
+        data={
+            "files": [
+                (io.BytesIO(b"1"), "a.ab1"),
+                (io.BytesIO(b"2"), "dir/a.ab1"),
+                (io.BytesIO(b"3"), ".."),
+                (zip_blob([("run/a.ab1", b"4"), ("run/b.ab1", b"5")]), "reads.zip"),
+            ]
+        },
+    )
+    job_id = receive_upload(builder.get_environ(), queue)
+    assert list_files(queue.input_dir(job_id)) == {
+        "a.ab1": b"1",
+        os.path.join("1", "a.ab1"): b"2",
+        os.path.join("2", "a.ab1"): b"4",
+        "b.ab1": b"5",
+    }
+    assert os.listdir(queue.job_dir(job_id)) == ["input"]